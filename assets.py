@@ -0,0 +1,200 @@
+'''
+local database assets: manifest with the md5 hash, size and modification time of each local file (unchanged files are
+not hashed again), streaming downloads (chunks are written to disk and hashed on the fly), concurrent refresh and
+offline runs with a local mirror directory
+
+mirror directory: the published archives and (optional) md5 files named like the last part of their urls (e.g.,
+GeoLite2-ASN.tar.gz, GeoLite2-ASN.tar.gz.md5), without md5 file the hash of the mirrored archive is used
+'''
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# region ----------------------------------------------------------------- asset parameters
+MIRROR_DIRECTORY    = None     # local mirror of the published archives (offline, no network access), None: download
+DOWNLOAD_CHUNK_SIZE = 2 ** 20  # bytes per read of downloads, copies and hashing
+REFRESH_THREADS     = 4        # databases that are checked/downloaded concurrently
+DOWNLOAD_TIMEOUT    = 60       # s, timeout of remote requests
+# endregion
+
+
+class AssetManager(object):
+  '''
+  manifest of local files and remote access (network or mirror directory), thread-safe
+  '''
+
+  def __init__(self, manifest_file, mirror=None, threads=None, chunk_size=None):
+    '''
+    @param manifest_file: manifest (json file, str)
+    @param mirror       : (optional) mirror directory (str), default MIRROR_DIRECTORY
+    @param threads      : (optional) concurrent tasks of run (int), default REFRESH_THREADS
+    @param chunk_size   : (optional) read size (int, bytes), default DOWNLOAD_CHUNK_SIZE
+    '''
+    self.manifest_file = manifest_file
+    self.mirror        = MIRROR_DIRECTORY    if mirror     is None else mirror
+    self.threads       = REFRESH_THREADS     if threads    is None else threads
+    self.chunk_size    = DOWNLOAD_CHUNK_SIZE if chunk_size is None else chunk_size
+    self.lock          = threading.RLock()
+    self.manifest      = self.load()
+
+  def load(self):
+    '''
+    @return manifest (dict: files: path: size, mtime_ns, md5, further entries of the users), empty if not present or
+            invalid
+    '''
+    try:
+      with open(self.manifest_file) as file:
+        manifest = json.load(file)
+    except (OSError, ValueError):
+      manifest = {}
+    manifest.setdefault('files', {})
+    return manifest
+
+  def save(self):
+    ''' store the manifest (atomically replaced) '''
+    with self.lock:
+      with open(self.manifest_file + '.tmp', 'w') as file:
+        json.dump(self.manifest, file, indent=2, sort_keys=True)
+      os.replace(self.manifest_file + '.tmp', self.manifest_file)
+
+  def file_md5(self, filename):
+    '''
+    md5 hash of a local file, the file is only read if its size or modification time changed since it was hashed
+
+    @param filename: local file (str)
+    @return md5 hash (str, hex) or None if the file does not exist
+    '''
+    try:
+      stat = os.stat(filename)
+    except FileNotFoundError:
+      return None
+    with self.lock:
+      entry = self.manifest['files'].get(filename)
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+      return entry['md5']
+
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as file:
+      for chunk in iter(lambda: file.read(self.chunk_size), b''):
+        md5.update(chunk)
+    self.__record(filename, stat, md5.hexdigest())
+    return md5.hexdigest()
+
+  def remote_md5(self, url):
+    '''
+    published md5 hash of an archive (md5 file of the url or of the mirror, hash of the mirrored archive)
+
+    @param url: url of the md5 file (str)
+    @return md5 hash (str, hex)
+    '''
+    if self.mirror is None:
+      import urllib.request
+      with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+        return response.read().decode().strip()
+
+    mirrored = self.mirror_file(url)
+    if os.path.isfile(mirrored):
+      with open(mirrored) as file:
+        return file.read().strip()
+    if not mirrored.endswith('.md5'):
+      raise ValueError('no md5 url: {}'.format(url))
+    md5 = self.file_md5(mirrored[:-len('.md5')])
+    if md5 is None: raise FileNotFoundError('{} is not mirrored in {}'.format(url, self.mirror))
+    return md5
+
+  def download(self, url, filename):
+    '''
+    download a file (or copy it from the mirror) in chunks, the file is replaced when it is complete (the partial file
+    is removed if the download fails)
+
+    @param url     : url of the file (str)
+    @param filename: local file (str)
+    @return md5 hash of the file (str, hex)
+    '''
+    md5 = hashlib.md5()
+    try:
+      with self.__open(url) as source, open(filename + '.part', 'wb') as target:
+        for chunk in iter(lambda: source.read(self.chunk_size), b''):
+          md5.update(chunk)
+          target.write(chunk)
+      os.replace(filename + '.part', filename)
+    except BaseException:
+      if os.path.isfile(filename + '.part'): os.remove(filename + '.part')
+      raise
+    self.__record(filename, os.stat(filename), md5.hexdigest())
+    return md5.hexdigest()
+
+  def is_current(self, filename, md5_url):
+    '''
+    @param filename: local archive (str)
+    @param md5_url : url of the published md5 hash of the archive (str)
+    @return whether the local archive is the published one (bool)
+    '''
+    return self.file_md5(filename) == self.remote_md5(md5_url)
+
+  def mirror_file(self, url):
+    '''
+    @param url: url of a published file (str)
+    @return file in the mirror directory (str)
+    '''
+    return os.path.join(self.mirror, url.rstrip('/').rsplit('/', 1)[-1])
+
+  def run(self, func, items):
+    '''
+    apply a function to each item concurrently (REFRESH_THREADS)
+
+    @param func : function (func)
+    @param items: arguments of the function (list)
+    @return results in the order of the items (list), the first failure is raised after all tasks finished
+    '''
+    if self.threads <= 1 or len(items) <= 1: return [ func(item) for item in items ]
+    with ThreadPoolExecutor(min(self.threads, len(items))) as executor:
+      futures = [ executor.submit(func, item) for item in items ]
+    return [ future.result() for future in futures ]
+
+  def __open(self, url):
+    '''
+    @param url: url of a published file (str)
+    @return readable binary stream of the file (network or mirror)
+    '''
+    if self.mirror is not None: return open(self.mirror_file(url), 'rb')
+    import urllib.request
+    return urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT)
+
+  def __record(self, filename, stat, md5):
+    '''
+    record the hash of a local file
+
+    @param filename: local file (str)
+    @param stat    : status of the hashed file (os.stat_result)
+    @param md5     : md5 hash (str, hex)
+    '''
+    with self.lock:
+      self.manifest['files'][filename] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'md5': md5}
+
+
+def copy_to_mirror(urls, directory):
+  '''
+  create or update a mirror directory (download the published files, e.g., on a system with network access)
+
+  @param urls     : urls of the published files (list of str)
+  @param directory: mirror directory (str)
+  '''
+  os.makedirs(directory, exist_ok=True)
+  manager        = AssetManager(os.path.join(directory, 'manifest.json'))
+  manager.mirror = None # download from the urls
+  manager.run(lambda url: manager.download(url, os.path.join(directory, url.rstrip('/').rsplit('/', 1)[-1])), urls)
+  manager.save()
+
+
+if __name__ == '__main__':
+  import argparse
+  import geo
+  parser = argparse.ArgumentParser(description='download the published geo databases into a mirror directory')
+  parser.add_argument('directory', help='mirror directory (see MIRROR_DIRECTORY)')
+  args = parser.parse_args()
+
+  copy_to_mirror([ data[key] for data in geo.GEO_DATA.values() if type(data) is not str
+                   for key in ['db_zip_file_remote', 'db_zip_file_md5'] ], args.directory)
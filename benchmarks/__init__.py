@@ -0,0 +1,4 @@
+'''
+benchmarks for the enrichment and anonymization hot paths (run from the repository root, e.g.,
+python3 -m benchmarks.bench_prefix_lookup)
+'''
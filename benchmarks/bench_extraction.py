@@ -0,0 +1,83 @@
+'''
+benchmark: extraction of flows from elasticsearch per projection (complete hits, _source with filter_path, doc values
+with filter_path) with and without HTTP compression, the elasticsearch client reads from a local HTTP stub server
+(see stub_server.py), reported are the bytes on the wire per flow, the decode time per page (JSON of the response into
+flow columns) and the extraction throughput
+'''
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import main
+import sources
+from flows import FlowBatch
+from benchmarks.stub_server import StubServer
+from benchmarks.synthetic import synthetic_sources
+
+
+def decode_seconds(responses, projection):
+  '''
+  decode recorded responses like the pipeline (JSON, flow columns), pages of documents are converted to columns like
+  process_page does
+
+  @param responses : bodies of the search and scroll responses (list of bytes)
+  @param projection: projection of the responses (str, see sources.PROJECTIONS)
+  @return seconds per page (float)
+  '''
+  start = time.perf_counter()
+  for response in responses:
+    flows = sources.decode_hits(json.loads(response)['hits'].get('hits', []), main.FLOW_KEYS, projection)
+    if not isinstance(flows, FlowBatch): flows = FlowBatch.from_sources(flows)
+  return (time.perf_counter() - start) / max(1, len(responses))
+
+
+def run(number_of_flows, page_size):
+  '''
+  extract the same flows with each projection, uncompressed and compressed
+
+  @param number_of_flows: number of flows (int)
+  @param page_size      : flows per page (int)
+  @return bytes per flow, decode time per page and flows/s (until the flow columns) per projection and compression
+          (dict)
+  '''
+  from elasticsearch import Elasticsearch
+  server   = StubServer(synthetic_sources(number_of_flows), record=True)
+  results  = {}
+  expected = None
+  main.ELASTICSEARCH_SCROLL_SIZE = page_size
+  try:
+    for projection in sources.PROJECTIONS:
+      for compress in [False, True]:
+        main.ELASTICSEARCH_PROJECTION = projection
+        elastic = Elasticsearch(hosts=[{'host': '127.0.0.1', 'port': server.port}], http_compress=compress)
+        server.reset()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+          pages = [ page if isinstance(page, FlowBatch) else FlowBatch.from_sources(page)
+                    for page in main.elasticsearch_source(elastic).pages() ]
+        seconds = time.perf_counter() - start
+
+        flows    = [ flow for page in pages for flow in page.to_dicts() ]
+        expected = flows if expected is None else expected
+        assert flows == expected, 'flows of {} differ'.format(projection)
+        results['{}{}'.format(projection, ' (gzip)' if compress else '')] = {
+          'bytes_per_flow'     : round(server.bytes_sent / number_of_flows, 1),
+          'response_mb'        : round(server.bytes_sent / 2 ** 20, 2),
+          'decode_ms_per_page' : round(decode_seconds(server.responses, projection) * 1000, 2),
+          'extract_flows_per_s': round(number_of_flows / seconds),
+          }
+  finally:
+    server.close()
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--flows', type=int, default=100000)
+  parser.add_argument('--size' , type=int, default=10000)
+  args = parser.parse_args()
+
+  for name, result in run(args.flows, args.size).items():
+    print('{:18s}: {}'.format(name, result))
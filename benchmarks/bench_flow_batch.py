@@ -0,0 +1,51 @@
+'''
+benchmark: memory and time per page of flows for the columnar FlowBatch compared to the former list of dicts
+(load, enrich and anonymize one page)
+'''
+import argparse
+import time
+import tracemalloc
+
+import main
+from flows import FlowBatch, column_name
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+def run(number_of_flows):
+  '''
+  process one page as FlowBatch and convert it to the former representation (list of dicts)
+
+  @param number_of_flows: number of flows of the page (int)
+  @return memory (MB) and time (s) of both representations (dict)
+  '''
+  setup_tables()
+  sources = synthetic_sources(number_of_flows)
+  results = {}
+
+  tracemalloc.start()
+  start = time.time()
+  flows = FlowBatch.from_sources(sources)
+  main.update_flows(flows)
+  main.convert_flows(flows)
+  results['batch'] = {'time_s': time.time() - start, 'memory_mb': tracemalloc.get_traced_memory()[0] / 2 ** 20}
+
+  tracemalloc.reset_peak()
+  memory  = tracemalloc.get_traced_memory()[0]
+  start   = time.time()
+  records = flows.to_dicts()
+  results['dicts'] = {'time_s': time.time() - start,
+                      'memory_mb': (tracemalloc.get_traced_memory()[0] - memory) / 2 ** 20}
+  tracemalloc.stop()
+
+  assert len(records) == number_of_flows and set(records[0]) == set(column_name(x) for x in sources[0]) | set(
+    flows.columns)
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--flows', type=int, default=10000)
+  args = parser.parse_args()
+
+  for name, result in run(args.flows).items():
+    print('{:5s} memory: {memory_mb:7.2f}MB time: {time_s:6.3f}s'.format(name, **result))
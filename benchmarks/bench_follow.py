@@ -0,0 +1,55 @@
+'''
+benchmark: end-to-end latency (arrival until stored) and throughput of the streaming mode (main.follow_flows) for
+flows that arrive at a configurable rate in a local stub source, for different micro-batch sizes and flush intervals
+'''
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+import main
+import utils
+from benchmarks.stub_elasticsearch import StubElasticsearch
+from benchmarks.synthetic import setup_tables
+
+
+def run(rate, duration, batch_sizes, flush_intervals):
+  '''
+  run the streaming mode for each configuration
+
+  @param rate           : arriving flows per second (float)
+  @param duration       : duration of each run (float, s)
+  @param batch_sizes    : micro-batch sizes (list of int)
+  @param flush_intervals: flush intervals (list of float, s)
+  @return stored flows per second and latency percentiles per configuration (dict)
+  '''
+  setup_tables()
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    for batch_size in batch_sizes:
+      for flush_interval in flush_intervals:
+        name = 'batch {} flush {}s'.format(batch_size, flush_interval)
+        main.STREAM_BATCH_SIZE     = batch_size
+        main.STREAM_FLUSH_INTERVAL = flush_interval
+        main.STREAM_POLL_INTERVAL  = min(0.1, flush_interval)
+        main.CHECKPOINT_FILE       = os.path.join(directory, '{}.json'.format(len(results)))
+        utils.PICKLE_FILE_FLOWS    = os.path.join(directory, 'flows_{}.pkl.gz'.format(len(results)))
+        with contextlib.redirect_stdout(io.StringIO()):
+          count, latency = main.follow_flows(StubElasticsearch(rate), duration)
+        results[name] = dict(latency, flows_per_s=round(count / duration))
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--rate'           , type=float, default=5000)
+  parser.add_argument('--duration'       , type=float, default=10)
+  parser.add_argument('--batch-sizes'    , type=int  , nargs='+', default=[100, 1000, 10000])
+  parser.add_argument('--flush-intervals', type=float, nargs='+', default=[0.1, 1.0])
+  args = parser.parse_args()
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    results = run(args.rate, args.duration, args.batch_sizes, args.flush_intervals)
+  for name, result in results.items():
+    print('{:24s}: {}'.format(name, result))
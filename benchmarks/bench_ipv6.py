@@ -0,0 +1,114 @@
+'''
+benchmark: ipv6 compared to the ipv4 path (prefix lookup, geo lookup, permutation and a whole page), both address
+families with prefix tables of the same size and the same (ipv6) MMDB files
+
+python3 -m benchmarks.bench_ipv6 [--prefixes 200000] [--flows 20000]
+'''
+import argparse
+import contextlib
+import io
+import tempfile
+
+import numpy as np
+
+import geo
+import main
+import prefix_lookup as pl
+import sources
+import utils
+from benchmarks.mmdb import synthetic_geo_databases
+from benchmarks.suite import best_time, clear_geo_caches
+from benchmarks.synthetic import PRIVATE_PREFIXES, PRIVATE_PREFIXES6, PRIVATE_VLANS, bgp_prefixes, bgp_prefixes6
+
+
+def setup(directory, number_of_prefixes, number_of_networks, seed=0):
+  '''
+  install ipv4 and ipv6 prefix lookup tables of the same size, ipv6 MMDB files (ipv4 and ipv6 networks) and the
+  permutation tables
+
+  @param directory         : directory of the MMDB files (str)
+  @param number_of_prefixes: public prefixes per address family (int)
+  @param number_of_networks: networks per address family and MMDB file (int)
+  @param seed              : random seed (int)
+  @return public ipv4 and ipv6 prefixes (list of str, list of str)
+  '''
+  prefixes, prefixes6 = bgp_prefixes(number_of_prefixes, seed), bgp_prefixes6(number_of_prefixes, seed)
+  with contextlib.redirect_stdout(io.StringIO()):
+    pl.prefix_lookup_public   = getattr(pl, '__build_prefix_lookup')(prefixes)
+    pl.prefix_lookup_public6  = getattr(pl, '__build_prefix_lookup')(prefixes6, ipv6=True)
+    pl.prefix_lookup_private  = getattr(pl, '__build_prefix_lookup')(PRIVATE_PREFIXES, PRIVATE_VLANS)
+    pl.prefix_lookup_private6 = getattr(pl, '__build_prefix_lookup')(PRIVATE_PREFIXES6, ipv6=True)
+
+  files = synthetic_geo_databases(directory, number_of_networks, seed, number_of_networks)
+  for name, db_file in files.items(): geo.GEO_DATA[name]['db_file'] = db_file
+  geo.geo_table = None
+  geo.open_readers()
+  geo.hsfd_geo_data = geo.get_geo_information('8.8.8.8')
+
+  main.PERMUTATION_TABLES  = main.create_permutation_tables(b'benchmark')
+  main.PERMUTATION_TABLES6 = main.create_permutation_tables6(b'benchmark')
+  return prefixes, prefixes6
+
+
+def addresses(prefixes, number, seed=0):
+  '''
+  random addresses within random prefixes (the address mix of a prefix table)
+
+  @param prefixes: ip prefixes of one address family (list of str)
+  @param number  : number of addresses (int)
+  @param seed    : random seed (int)
+  @return ip addresses (np.ndarray of uint32 for ipv4, np.ndarray of uint64 with shape (n, 2) for ipv6)
+  '''
+  random = np.random.RandomState(seed)
+  chosen = [ prefixes[i] for i in random.randint(0, len(prefixes), number) ]
+  if ':' not in prefixes[0]:
+    networks, prefix_lens = pl.parse_prefixes(chosen)
+    hosts = random.randint(0, 2 ** 32, number, dtype=np.uint64) & ((np.uint64(1) << (32 - prefix_lens).astype(np.uint64)) - np.uint64(1))
+    return networks | hosts.astype(np.uint32)
+  networks, prefix_lens = pl.parse_prefixes6(chosen)
+  host_hi, host_lo      = getattr(pl, '__host_masks6')(prefix_lens)
+  hosts = random.randint(0, 2 ** 63, (number, 2), dtype=np.uint64)
+  return np.column_stack([ networks[:, 0] | (hosts[:, 0] & host_hi), networks[:, 1] | (hosts[:, 1] & host_lo) ])
+
+
+def run(number_of_prefixes, number_of_flows, repeat):
+  '''
+  measure both address families
+
+  @param number_of_prefixes: public prefixes per address family (int)
+  @param number_of_flows   : addresses/flows per measurement (int)
+  @param repeat            : runs per measurement (the best run is reported) (int)
+  @return throughput of ipv4 and ipv6 per measurement (dict: name: (float, float))
+  '''
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    prefixes, prefixes6 = setup(directory, number_of_prefixes, 3000)
+    ips = { 4: addresses(prefixes, number_of_flows), 6: addresses(prefixes6, number_of_flows) }
+
+    def _measure(name, func, prepare=None):
+      results[name] = tuple( number_of_flows / best_time(lambda *_: func(ips[version]), repeat, prepare)
+                             for version in [4, 6] )
+
+    _measure('prefix_lookups_per_s', pl.get_prefixes_for_ips)
+    _measure('geo_lookups_per_s'   , geo.get_geo_information_for_ips, prepare=clear_geo_caches)
+    _measure('permutations_per_s'  , lambda x: main.permute_ips(x, as_strings=False))
+    _measure('to_strings_per_s'    , lambda x: utils.uint32_to_ips(x) if x.ndim == 1 else utils.uint64x2_to_ips(x))
+
+    pages = { version: sources.synthetic_documents(number_of_flows, 0, 0, 0.0 if version == 4 else 1.0)
+              for version in [4, 6] }
+    results['process_page_flows_per_s'] = tuple(
+      number_of_flows / best_time(lambda _: main.process_page(pages[version]), repeat, clear_geo_caches)
+      for version in [4, 6] )
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--prefixes', type=int, default=200000, help='public prefixes per address family')
+  parser.add_argument('--flows'   , type=int, default=20000, help='addresses/flows per measurement')
+  parser.add_argument('--repeat'  , type=int, default=3)
+  args = parser.parse_args()
+
+  print('{:26s} {:>12s} {:>12s} {:>7s}'.format('', 'ipv4', 'ipv6', 'ratio'))
+  for name, (ipv4, ipv6) in run(args.prefixes, args.flows, args.repeat).items():
+    print('{:26s} {:12.0f} {:12.0f} {:7.2f}'.format(name, ipv4, ipv6, ipv6 / ipv4))
@@ -0,0 +1,58 @@
+'''
+benchmark: vectorized ip address permutation (main.permute_ips) compared to the former octet by octet permutation of
+each dotted quad
+'''
+import argparse
+import time
+import numpy as np
+
+import main
+import utils
+
+
+def permute_ip(ip):
+  '''
+  former permutation of a single ip address
+
+  @param ip: ip address (str)
+  @return permuted ip address (str)
+  '''
+  return '.'.join([str(main.PERMUTATION_TABLES[i][int(octet)]) for i, octet in enumerate(ip.split('.'))])
+
+
+def run(number_of_addresses):
+  '''
+  permute synthetic addresses with both implementations
+
+  @param number_of_addresses: number of synthetic ip addresses (int)
+  @return addresses/sec of each implementation (dict)
+  '''
+  ips = utils.uint32_to_ips(np.random.RandomState(0).randint(0, 2 ** 32, number_of_addresses, dtype=np.uint64))
+  main.PERMUTATION_TABLES = main.create_permutation_tables(b'benchmark')
+
+  results = {}
+  start   = time.time()
+  former  = [ permute_ip(ip) for ip in ips ]
+  results['former_per_s'] = number_of_addresses / (time.time() - start)
+
+  start   = time.time()
+  batch   = main.permute_ips(ips)
+  results['vectorized_per_s'] = number_of_addresses / (time.time() - start)
+
+  start   = time.time()
+  main.permute_ips(utils.ips_to_uint32(ips), as_strings=False)
+  results['vectorized_int_per_s'] = number_of_addresses / (time.time() - start)
+
+  assert former == batch, 'permutation results differ'
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--addresses', type=int, default=1000000)
+  args = parser.parse_args()
+
+  results = run(args.addresses)
+  for name, value in results.items():
+    print('{:22s} {:12.0f}'.format(name, value))
+  print('speedup {:.1f}x'.format(results['vectorized_per_s'] / results['former_per_s']))
@@ -0,0 +1,59 @@
+'''
+benchmark: throughput of process_flows with the serial loop (queue depth 0) and the fetch/compute/write pipeline
+against a fake elasticsearch client with configurable latency
+'''
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import main
+import utils
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+def run(number_of_pages, page_size, latency, queue_depths):
+  '''
+  process the same pages with each queue depth
+
+  @param number_of_pages: number of scroll pages (int)
+  @param page_size      : flows per page (int)
+  @param latency        : latency of each elasticsearch request (float, s)
+  @param queue_depths   : queue depths to compare (list of int)
+  @return flows/sec per queue depth (dict)
+  '''
+  setup_tables()
+  documents = synthetic_sources(number_of_pages * page_size)
+  main.ELASTICSEARCH_SCROLL_SIZE = page_size
+  results = {}
+  expected = None
+
+  with tempfile.TemporaryDirectory() as directory:
+    for queue_depth in queue_depths:
+      main.PIPELINE_QUEUE_DEPTH = queue_depth
+      utils.PICKLE_FILE_FLOWS   = os.path.join(directory, 'flows_{}.pkl.gz'.format(queue_depth))
+      start = time.time()
+      with contextlib.redirect_stdout(io.StringIO()):
+        main.process_flows(FakeElasticsearch(documents, latency))
+      results[queue_depth] = len(documents) / (time.time() - start)
+      flows    = utils.load_pickle_file(utils.PICKLE_FILE_FLOWS)
+      expected = flows if expected is None else expected
+      assert len(flows) == len(documents) and flows == expected, 'pipeline output differs'
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--pages'  , type=int  , default=20)
+  parser.add_argument('--size'   , type=int  , default=10000)
+  parser.add_argument('--latency', type=float, default=0.2)
+  parser.add_argument('--depths' , type=int  , nargs='+', default=[0, 1, 2, 4])
+  args = parser.parse_args()
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    results = run(args.pages, args.size, args.latency, args.depths)
+  for queue_depth, flows_per_s in results.items():
+    print('queue depth {:2d}: {:10.0f} flows/s'.format(queue_depth, flows_per_s))
@@ -0,0 +1,77 @@
+'''
+benchmark: startup time and resident memory of loading the public prefix lookup from the memory mapped binary index
+file compared to the former gzip-pickled lookup tree (each variant is loaded in a fresh process)
+'''
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import prefix_lookup as pl
+from benchmarks.bench_prefix_lookup import build_trie, synthetic_prefixes
+
+LOADER = '''
+import json, os, sys, time, psutil
+sys.path.insert(0, {root!r})
+import gzip, pickle
+import prefix_lookup as pl
+from benchmarks.bench_prefix_lookup import lookup_trie
+
+process = psutil.Process(os.getpid())
+rss     = process.memory_info().rss
+start   = time.time()
+if {kind!r} == 'pickle':
+  with gzip.open({filename!r}, 'rb') as file: lookup = pickle.load(file)
+  load = time.time() - start
+  lookup_trie('8.8.8.8', lookup)
+else:
+  lookup = pl.load_prefix_index({filename!r})
+  load = time.time() - start
+  getattr(pl, '__get_prefix_for_ip')('8.8.8.8', lookup)
+print(json.dumps({{'load_s': load, 'first_lookup_s': time.time() - start - load,
+                  'rss_mb': (process.memory_info().rss - rss) / 2 ** 20}}))
+'''
+
+
+def run(number_of_prefixes):
+  '''
+  write both file formats and load each in a fresh process
+
+  @param number_of_prefixes: number of synthetic prefixes (int)
+  @return results (dict)
+  '''
+  prefixes = synthetic_prefixes(number_of_prefixes)
+  root     = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+  results  = {}
+
+  with tempfile.TemporaryDirectory() as directory:
+    pickle_file = os.path.join(directory, 'public_prefixes_lookup_tree.pkl.gz')
+    index_file  = os.path.join(directory, 'public_prefixes_lookup.idx')
+
+    sys.setrecursionlimit(10000)
+    with gzip.GzipFile(pickle_file, 'wb') as file:
+      pickle.dump(build_trie(prefixes), file, pickle.HIGHEST_PROTOCOL)
+    with contextlib.redirect_stdout(io.StringIO()):
+      pl.save_prefix_index(getattr(pl, '__build_prefix_lookup')(prefixes), index_file)
+
+    for kind, filename in [('pickle', pickle_file), ('index', index_file)]:
+      output = subprocess.check_output([sys.executable, '-c', LOADER.format(root=root, kind=kind, filename=filename)])
+      results[kind] = json.loads(output.decode().strip().splitlines()[-1])
+      results[kind]['file_mb'] = os.path.getsize(filename) / 2 ** 20
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--prefixes', type=int, default=50000)
+  args = parser.parse_args()
+
+  for kind, result in run(args.prefixes).items():
+    print('{:6s} file: {file_mb:6.1f}MB load: {load_s:7.3f}s first lookup: {first_lookup_s:7.4f}s '
+          'rss: {rss_mb:7.1f}MB'.format(kind, **result))
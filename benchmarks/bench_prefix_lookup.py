@@ -0,0 +1,148 @@
+'''
+benchmark: lookups/sec and resident memory of the interval based prefix lookup table compared to the former
+nested-list binary trie (kept below as reference implementation)
+'''
+import argparse
+import contextlib
+import io
+import os
+import time
+import numpy as np
+import psutil
+from ipaddress import IPv4Address, IPv4Network
+
+import prefix_lookup as pl
+import utils
+
+
+# region ---------------------------------------------------------------------------- former nested-list binary trie
+def build_trie(prefixes):
+  '''
+  build the former nested-list binary trie (one list per bit)
+
+  @param prefixes: ip prefixes (list of str)
+  @return lookup tree (list)
+  '''
+  lookup = [None, None]
+  for prefix in prefixes:
+    ip, prefix_length = prefix.split('/', 1)
+
+    def __add_prefix(parent, bit_mask, prefix_length, prefix):
+      bit = int(bit_mask[0])
+      new_network = IPv4Network(prefix)
+      if type(parent[bit]) is tuple:
+        if parent[bit][0].prefixlen < new_network.prefixlen:
+          parent[bit] = [None, None]
+      if prefix_length == 1:
+        parent[bit] = (new_network, 0)
+        return
+      if parent[bit] is None:
+        parent[bit] = [None, None]
+      __add_prefix(parent[bit], bit_mask[1:], prefix_length - 1, prefix)
+
+    __add_prefix(lookup, ''.join([ np.binary_repr(int(x), width=8) for x in ip.split('.') ]), int(prefix_length), prefix)
+
+  default_prefix = (IPv4Network('0.0.0.0/0'), 0)
+
+  def __replace_none_values(lookup):
+    for bit in (0, 1):
+      if not isinstance(lookup[bit], list):
+        if lookup[bit] is None: lookup[bit] = default_prefix
+      else:
+        __replace_none_values(lookup[bit])
+
+  __replace_none_values(lookup)
+  return lookup
+
+
+def lookup_trie(ip, lookup):
+  '''
+  former recursive trie lookup
+
+  @param ip    : ip address (str)
+  @param lookup: lookup tree (list)
+  @return ip prefix and VLAN (IPv4Network,int)
+  '''
+  bit_mask = ''.join([ np.binary_repr(int(x), width=8) for x in ip.split('.') ])
+
+  def __get_prefix(parent, bit_mask):
+    bit = int(bit_mask[0])
+    if not isinstance(parent[bit], list):
+      return parent[bit]
+    return __get_prefix(parent[bit], bit_mask[1:])
+
+  return __get_prefix(lookup, bit_mask)
+#endregion
+
+
+def synthetic_prefixes(number, seed=0):
+  '''
+  create non-overlapping public prefixes with lengths /16 - /24 (similar to the GeoLite2 ASN blocks)
+
+  @param number: number of prefixes (int)
+  @param seed  : random seed (int)
+  @return ip prefixes (list of str)
+  '''
+  random  = np.random.RandomState(seed)
+  blocks  = random.choice(np.arange(1 << 8, 224 << 8), size=number, replace=False) # distinct /16 blocks
+  lengths = random.randint(16, 25, size=number)
+  return [ '{}/{}'.format(IPv4Address(int(block) << 16), length) for block, length in zip(blocks, lengths) ]
+
+
+def rss():
+  ''' @return resident set size of the current process (int, bytes) '''
+  return psutil.Process(os.getpid()).memory_info().rss
+
+
+def run(number_of_prefixes, number_of_lookups):
+  '''
+  build both lookup structures and measure build time, memory and lookup throughput (single and batch lookups)
+
+  @param number_of_prefixes: number of synthetic prefixes (int)
+  @param number_of_lookups : number of random lookups (int)
+  @return results (dict)
+  '''
+  prefixes = synthetic_prefixes(number_of_prefixes)
+  ips      = [ str(IPv4Address(int(x))) for x in np.random.RandomState(1).randint(1 << 24, 224 << 24, number_of_lookups) ]
+  results  = {}
+
+  for name, build, lookup in [
+      ('trie' , build_trie,                                        lookup_trie),
+      ('table', lambda x: getattr(pl, '__build_prefix_lookup')(x), getattr(pl, '__get_prefix_for_ip')),
+    ]:
+    memory = rss()
+    start  = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+      structure = build(prefixes)
+    build_time = time.time() - start
+    memory     = rss() - memory
+
+    start = time.time()
+    found = [ lookup(ip, structure) for ip in ips ]
+    lookup_time = time.time() - start
+
+    results[name] = {'build_s': build_time, 'rss_mb': memory / 2 ** 20,
+                     'lookups_per_s': number_of_lookups / lookup_time, 'result': found}
+
+  # vectorized batch lookup (one call per page of addresses)
+  pl.prefix_lookup_public = structure
+  start = time.time()
+  networks, prefix_lens, _ = pl.get_prefixes_for_ips(utils.ips_to_uint32(ips))
+  results['batch'] = {'build_s': results['table']['build_s'], 'rss_mb': results['table']['rss_mb'],
+                      'lookups_per_s': number_of_lookups / (time.time() - start),
+                      'result': [ (IPv4Network((network, prefix_len)), 0)
+                                  for network, prefix_len in zip(networks.tolist(), prefix_lens.tolist()) ]}
+
+  expected = results['trie'].pop('result')
+  assert expected == results['table'].pop('result') == results['batch'].pop('result'), 'lookup results differ'
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--prefixes', type=int, default=50000)
+  parser.add_argument('--lookups' , type=int, default=100000)
+  args = parser.parse_args()
+
+  for name, result in run(args.prefixes, args.lookups).items():
+    print('{:5s} build: {build_s:6.2f}s rss: {rss_mb:8.1f}MB lookups/s: {lookups_per_s:10.0f}'.format(name, **result))
@@ -0,0 +1,72 @@
+'''
+benchmark: peak memory and time of load_pickle_file (all pages in one list) compared to the streaming reader
+(iter_flows), and the time to skip to the last page with and without the side index of page offsets
+'''
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+import main
+import utils
+import writers
+from flows import FlowBatch
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+def measure(func):
+  '''
+  @param func: function to be measured (func)
+  @return result, time (s) and peak memory (MB) of the function
+  '''
+  tracemalloc.start()
+  start  = time.time()
+  result = func()
+  result = result, time.time() - start, tracemalloc.get_traced_memory()[1] / 2 ** 20
+  tracemalloc.stop()
+  return result
+
+
+def run(number_of_pages, page_size):
+  '''
+  write a pickle file and read it with both readers
+
+  @param number_of_pages: number of pages (int)
+  @param page_size      : flows per page (int)
+  @return time (s) and peak memory (MB) per reader (dict)
+  '''
+  setup_tables()
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    filename = os.path.join(directory, 'flows.pkl.gz')
+    with writers.open_writer(filename) as writer:
+      for i in range(number_of_pages):
+        flows = FlowBatch.from_sources(synthetic_sources(page_size, seed=i))
+        main.update_flows(flows)
+        main.convert_flows(flows)
+        writer.write(flows.to_dicts())
+
+    with contextlib.redirect_stdout(io.StringIO()):
+      count, *results['load_pickle_file'] = measure(lambda: len(utils.load_pickle_file(filename)))
+    assert count == number_of_pages * page_size
+    count, *results['iter_flows'] = measure(lambda: sum(1 for _ in utils.iter_flows(filename)))
+    assert count == number_of_pages * page_size
+
+    last_page = lambda: next(utils.iter_flow_pages(filename, start_page=number_of_pages - 1))
+    _, *results['skip (index)'] = measure(last_page)
+    os.remove(filename + '.idx')
+    _, *results['skip (scan)'] = measure(last_page)
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--pages', type=int, default=20)
+  parser.add_argument('--size' , type=int, default=10000)
+  args = parser.parse_args()
+
+  for reader, (time_s, memory_mb) in run(args.pages, args.size).items():
+    print('{:18s}: {:8.3f} s {:10.1f} MB peak'.format(reader, time_s, memory_mb))
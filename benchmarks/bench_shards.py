@@ -0,0 +1,85 @@
+'''
+benchmark: output size, write and read time of the pickled pages (gzip) compared to columnar shards, the shards are
+read completely and with a projection to a few columns
+'''
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import main
+import utils
+import writers
+from flows import FlowBatch
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+def directory_size(path):
+  '''
+  @param path: file or directory (str)
+  @return size of the file or of all files in the directory (int, bytes)
+  '''
+  if os.path.isfile(path): return os.path.getsize(path)
+  return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def run(number_of_pages, page_size, projection):
+  '''
+  write and read the same pages with both output formats
+
+  @param number_of_pages: number of pages (int)
+  @param page_size      : flows per page (int)
+  @param projection     : columns that are read from the shards (list of str)
+  @return size (MB), write and read times (s) per format (dict)
+  '''
+  setup_tables()
+  batches = []
+  for i in range(number_of_pages):
+    flows = FlowBatch.from_sources(synthetic_sources(page_size, seed=i))
+    main.update_flows(flows)
+    main.convert_flows(flows)
+    batches.append(flows)
+
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    filename = os.path.join(directory, 'flows.pkl.gz')
+    start    = time.time()
+    with writers.open_writer(filename, 'gzip') as writer:
+      for flows in batches: writer.write(flows.to_dicts())
+    write_s  = time.time() - start
+    start    = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+      records = utils.load_pickle_file(filename)
+    results['gzip'] = {'size_mb': directory_size(filename) / 2 ** 20, 'write_s': write_s,
+                       'read_s': time.time() - start}
+    assert len(records) == number_of_pages * page_size
+
+    shards  = os.path.join(directory, 'flows')
+    start   = time.time()
+    with writers.open_writer(shards, 'shards') as writer:
+      for flows in batches: writer.write(flows)
+    write_s = time.time() - start
+    start   = time.time()
+    rows    = sum(len(columns['src_addr']) for _, columns in utils.load_flow_shards(shards))
+    read_s  = time.time() - start
+    start   = time.time()
+    for _, columns in utils.load_flow_shards(shards, columns=projection): pass
+    results['shards'] = {'size_mb': directory_size(shards) / 2 ** 20, 'write_s': write_s, 'read_s': read_s,
+                         'projection_read_s': time.time() - start}
+    assert rows == number_of_pages * page_size
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--pages'     , type=int, default=10)
+  parser.add_argument('--size'      , type=int, default=10000)
+  parser.add_argument('--projection', nargs='+', default=['src_addr', 'dst_addr', 'dst_port', 'bytes'])
+  args = parser.parse_args()
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    results = run(args.pages, args.size, args.projection)
+  for codec, result in results.items():
+    print('{:7s}: {}'.format(codec, ', '.join('{} {:.3f}'.format(key, value) for key, value in result.items())))
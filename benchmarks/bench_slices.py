@@ -0,0 +1,67 @@
+'''
+benchmark: extraction throughput with 1..N elasticsearch scroll slices (fake elasticsearch client with latency), the
+output of each configuration must contain the same flows
+'''
+import argparse
+import contextlib
+import glob
+import io
+import os
+import tempfile
+import time
+
+import main
+import utils
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+def run(number_of_pages, page_size, latency, slices, output_per_slice=False):
+  '''
+  process the same documents with each number of slices
+
+  @param number_of_pages : number of scroll pages (int)
+  @param page_size       : flows per page (int)
+  @param latency         : latency of each elasticsearch request (float, s)
+  @param slices          : numbers of slices to compare (list of int)
+  @param output_per_slice: store each slice in its own file (bool)
+  @return flows/sec per number of slices (dict)
+  '''
+  setup_tables()
+  documents = synthetic_sources(number_of_pages * page_size)
+  main.ELASTICSEARCH_SCROLL_SIZE = page_size
+  main.OUTPUT_PER_SLICE          = output_per_slice
+  results  = {}
+  expected = None
+
+  with tempfile.TemporaryDirectory() as directory:
+    for number_of_slices in slices:
+      main.ELASTICSEARCH_SLICES = number_of_slices
+      utils.PICKLE_FILE_FLOWS   = os.path.join(directory, '{}_flows.pkl.gz'.format(number_of_slices))
+      start = time.time()
+      with contextlib.redirect_stdout(io.StringIO()):
+        main.process_flows(FakeElasticsearch(documents, latency))
+      results[number_of_slices] = len(documents) / (time.time() - start)
+
+      flows = []
+      with contextlib.redirect_stdout(io.StringIO()):
+        for filename in sorted(glob.glob(os.path.join(directory, '{}_flows*.pkl.gz'.format(number_of_slices)))):
+          flows += utils.load_pickle_file(filename)
+      flows    = sorted(flows, key=lambda flow: flow['flow_seq_num'])
+      expected = flows if expected is None else expected
+      assert flows == expected, 'output of {} slices differs'.format(number_of_slices)
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--pages'           , type=int  , default=16)
+  parser.add_argument('--size'            , type=int  , default=5000)
+  parser.add_argument('--latency'         , type=float, default=0.3)
+  parser.add_argument('--slices'          , type=int  , nargs='+', default=[1, 2, 4])
+  parser.add_argument('--output-per-slice', action='store_true')
+  args = parser.parse_args()
+
+  results = run(args.pages, args.size, args.latency, args.slices, args.output_per_slice)
+  for number_of_slices, flows_per_s in results.items():
+    print('{} slices: {:10.0f} flows/s'.format(number_of_slices, flows_per_s))
@@ -0,0 +1,87 @@
+'''
+benchmark: throughput of the flow sources (reading pages only) and of process_flows driven by each source, the file
+sources read NDJSON and CSV exports of the same synthetic flows
+'''
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+
+import main
+import sources
+import utils
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+def export(documents, directory):
+  '''
+  write documents as NDJSON and CSV file
+
+  @param documents: elasticsearch documents (list of dict)
+  @param directory: output directory (str)
+  @return filenames (dict: format: filename)
+  '''
+  filenames = {'ndjson': os.path.join(directory, 'flows.ndjson'), 'csv': os.path.join(directory, 'flows.csv')}
+  with open(filenames['ndjson'], 'w') as file:
+    for document in documents: file.write(json.dumps(document) + '\n')
+  with open(filenames['csv'], 'w', newline='') as file:
+    writer = csv.writer(file)
+    writer.writerow(main.FLOW_KEYS)
+    for document in documents: writer.writerow([ document.get(key, '') for key in main.FLOW_KEYS ])
+  return filenames
+
+
+def run(number_of_flows, page_size):
+  '''
+  read and process the same flows from each source
+
+  @param number_of_flows: number of flows (int)
+  @param page_size      : flows per page (int)
+  @return flows/sec of reading and of processing per source (dict)
+  '''
+  setup_tables()
+  documents = synthetic_sources(number_of_flows)
+  main.ELASTICSEARCH_SCROLL_SIZE = page_size
+  results   = {}
+  expected  = None
+
+  with tempfile.TemporaryDirectory() as directory:
+    filenames = export(documents, directory)
+    factories = {
+      'elasticsearch (fake)': lambda: main.elasticsearch_source(FakeElasticsearch(documents)),
+      'ndjson'              : lambda: sources.FileSource(filenames['ndjson'], main.FLOW_KEYS),
+      'csv'                 : lambda: sources.FileSource(filenames['csv'], main.FLOW_KEYS),
+      'synthetic'           : lambda: sources.SyntheticSource(number_of_flows, page_size),
+      }
+    for name, factory in factories.items():
+      start = time.time()
+      with contextlib.redirect_stdout(io.StringIO()):
+        count = sum(len(page) for page in factory().pages())
+      read_s = time.time() - start
+      assert count == number_of_flows
+
+      utils.PICKLE_FILE_FLOWS = os.path.join(directory, 'flows_{}.pkl.gz'.format(len(results)))
+      start = time.time()
+      with contextlib.redirect_stdout(io.StringIO()):
+        main.process_flows(source=factory())
+      results[name] = {'read_flows_per_s': round(number_of_flows / read_s),
+                       'process_flows_per_s': round(number_of_flows / (time.time() - start))}
+      flows    = list(utils.iter_flows(utils.PICKLE_FILE_FLOWS))
+      expected = flows if expected is None else expected
+      assert name == 'synthetic' or flows == expected, 'output of {} differs'.format(name)
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--flows', type=int, default=200000)
+  parser.add_argument('--size' , type=int, default=10000)
+  args = parser.parse_args()
+
+  for name, result in run(args.flows, args.size).items():
+    print('{:20s}: {}'.format(name, result))
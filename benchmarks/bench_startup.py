@@ -0,0 +1,97 @@
+'''
+benchmark: cold start of fresh interpreters (import of utils/main, init with local databases, time until the first
+page is processed) with a local database directory (synthetic MMDB files and ASN CSV, cached external ip address in the
+manifest, no network access)
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mmdb import synthetic_geo_databases
+from benchmarks.synthetic import bgp_prefixes, bgp_prefixes6
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# code of each measurement (run in the local database directory)
+SCENARIOS = {
+  'python'            : 'pass',
+  'import utils'      : 'import utils',
+  'import main'       : 'import main',
+  'init'              : 'import main, geo; geo.GEO_REMOTE_CHECK = "off"; main.init()',
+  'init (fast start)' : 'import main; main.init(fast_start=True)',
+  'first page'        : 'import main, geo, sources; geo.GEO_REMOTE_CHECK = "off"; main.init(); '
+                        'main.process_page(next(sources.SyntheticSource(1000, 1000).pages()))',
+  'first page (fast)' : 'import main, sources; main.init(fast_start=True); '
+                        'main.process_page(next(sources.SyntheticSource(1000, 1000).pages()))',
+  }
+
+
+def local_databases(directory, number_of_prefixes=50000, number_of_networks=3000):
+  '''
+  create a local database directory (./db) like after a download: MMDB files, ASN CSV files (ipv4, ipv6), (empty)
+  archives, the private prefixes of the repository and a manifest with a cached external ip address
+
+  @param directory         : working directory (str)
+  @param number_of_prefixes: public prefixes of the ipv4 ASN CSV (int), a fifth of it in the ipv6 CSV
+  @param number_of_networks: networks per MMDB file (int)
+  '''
+  import geo
+  db = os.path.join(directory, 'db')
+  for name in ['country', 'city', 'asn', 'public_prefixes']:
+    os.makedirs(os.path.join(directory, geo.GEO_DATA[name]['db_file_dir']), exist_ok=True)
+    open(os.path.join(directory, geo.GEO_DATA[name]['db_zip_file_local']), 'wb').close()
+
+  files = synthetic_geo_databases(db, number_of_networks)
+  for name, filename in files.items():
+    os.replace(filename, os.path.join(directory, geo.GEO_DATA[name]['db_file']))
+  with open(os.path.join(directory, geo.GEO_DATA['public_prefixes']['db_file']), 'w') as file:
+    file.write('network,autonomous_system_number,autonomous_system_organization\n')
+    for prefix in bgp_prefixes(number_of_prefixes): file.write('{},1,AS\n'.format(prefix))
+  with open(os.path.join(directory, geo.GEO_DATA['public_prefixes']['db_file6']), 'w') as file:
+    file.write('network,autonomous_system_number,autonomous_system_organization\n')
+    for prefix in bgp_prefixes6(number_of_prefixes // 5): file.write('{},1,AS\n'.format(prefix))
+  for name in ['private_prefixes_file', 'private_prefixes_vlans']:
+    with open(os.path.join(REPOSITORY, geo.GEO_DATA[name])) as source, \
+         open(os.path.join(directory, geo.GEO_DATA[name]), 'w') as target:
+      target.write(source.read())
+  with open(os.path.join(directory, geo.GEO_DATA['manifest_file']), 'w') as file:
+    json.dump({'external_ip': '8.8.8.8'}, file)
+
+
+def run(repeat):
+  '''
+  measure each scenario in fresh interpreters
+
+  @param repeat: runs per scenario (int)
+  @return median wall time per scenario (dict, s)
+  '''
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    local_databases(directory)
+    environment = dict(os.environ, PYTHONPATH=REPOSITORY)
+    # build the public prefix index once (stored next to the CSV), all scenarios memory map it
+    subprocess.run([sys.executable, '-c', SCENARIOS['init']], cwd=directory, env=environment, check=True,
+                   stdout=subprocess.DEVNULL)
+    for name, code in SCENARIOS.items():
+      times = []
+      for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=directory, env=environment, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+      results[name] = round(statistics.median(times), 3)
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  for name, seconds in run(args.repeat).items():
+    print('{:20s}: {:.3f}s'.format(name, seconds))
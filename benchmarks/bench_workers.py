@@ -0,0 +1,60 @@
+'''
+benchmark: scaling of process_flows with the number of worker processes for enrichment/anonymization (fake
+elasticsearch client without latency)
+'''
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import main
+import utils
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+def run(number_of_pages, page_size, workers):
+  '''
+  process the same pages with each number of workers
+
+  @param number_of_pages: number of scroll pages (int)
+  @param page_size      : flows per page (int)
+  @param workers        : numbers of workers to compare (list of int)
+  @return flows/sec per number of workers (dict)
+  '''
+  setup_tables()
+  documents = synthetic_sources(number_of_pages * page_size)
+  main.ELASTICSEARCH_SCROLL_SIZE = page_size
+  results  = {}
+  expected = None
+
+  with tempfile.TemporaryDirectory() as directory:
+    for number_of_workers in workers:
+      main.PIPELINE_WORKERS   = number_of_workers
+      utils.PICKLE_FILE_FLOWS = os.path.join(directory, 'flows_{}.pkl.gz'.format(number_of_workers))
+      start = time.time()
+      with contextlib.redirect_stdout(io.StringIO()):
+        main.process_flows(FakeElasticsearch(documents))
+      results[number_of_workers] = len(documents) / (time.time() - start)
+
+      with contextlib.redirect_stdout(io.StringIO()):
+        flows = utils.load_pickle_file(utils.PICKLE_FILE_FLOWS)
+      expected = flows if expected is None else expected
+      assert flows == expected, 'output of {} workers differs'.format(number_of_workers)
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--pages'  , type=int, default=32)
+  parser.add_argument('--size'   , type=int, default=10000)
+  parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+  args = parser.parse_args()
+
+  results = run(args.pages, args.size, args.workers)
+  for number_of_workers, flows_per_s in results.items():
+    print('{} workers: {:10.0f} flows/s ({:.2f}x, {} cpus)'.format(number_of_workers, flows_per_s,
+                                                                   flows_per_s / results[args.workers[0]],
+                                                                   os.cpu_count()))
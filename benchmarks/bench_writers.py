@@ -0,0 +1,102 @@
+'''
+benchmark: output throughput (MB/s of pickled flows) of the former gzip-appended pickles compared to the output
+writers with different compression levels and compression threads
+'''
+import argparse
+import contextlib
+import gzip
+import io
+import os
+import pickle
+import tempfile
+import time
+
+import main
+import utils
+import writers
+from flows import FlowBatch
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+def append_pickles(pages, filename):
+  '''
+  former output: open the file in append mode for each page (GzipFile, compression level 9)
+
+  @param pages   : pages of flows (list of list of dict)
+  @param filename: output file (str)
+  '''
+  for i, page in enumerate(pages):
+    with gzip.GzipFile(filename, 'wb' if i == 0 else 'ab') as file:
+      pickle.dump(page, file, pickle.HIGHEST_PROTOCOL)
+
+
+def write_pages(pages, filename, level, threads, flush_pages=None):
+  '''
+  output writer: persistent file handle, one gzip member per page
+
+  @param pages      : pages of flows (list of list of dict)
+  @param filename   : output file (str)
+  @param level      : compression level (int)
+  @param threads    : compression threads (int)
+  @param flush_pages: flush after each n-th page (int), default writers.FLUSH_PAGES
+  '''
+  with writers.open_writer(filename, level=level, threads=threads, flush_pages=flush_pages) as writer:
+    for page in pages:
+      writer.write(page)
+
+
+def run(number_of_pages, page_size, levels, threads, flush_pages=None):
+  '''
+  write the same pages with each codec (compression level, threads), the compression of pages overlaps with the
+  writes of completed pages (flush after each page with the default flush_pages)
+
+  @param number_of_pages: number of pages (int)
+  @param page_size      : flows per page (int)
+  @param levels         : compression levels (list of int)
+  @param threads        : numbers of compression threads (list of int)
+  @param flush_pages    : flush after each n-th page (int), default writers.FLUSH_PAGES
+  @return MB/s (pickled flows) and output size (MB) per codec (dict)
+  '''
+  setup_tables()
+  pages = []
+  for i in range(number_of_pages):
+    flows = FlowBatch.from_sources(synthetic_sources(page_size, seed=i))
+    main.update_flows(flows)
+    main.convert_flows(flows)
+    pages.append(flows.to_dicts())
+  raw_mb = sum(len(pickle.dumps(page, pickle.HIGHEST_PROTOCOL)) for page in pages) / 2 ** 20
+
+  codecs = [('append gzip-9', append_pickles)]
+  for level in levels:
+    for number_of_threads in threads:
+      codecs.append(('writer gzip-{} threads {}'.format(level, number_of_threads),
+                     lambda _pages, filename, level=level, number_of_threads=number_of_threads:
+                       write_pages(_pages, filename, level, number_of_threads, flush_pages)))
+
+  results = {}
+  with tempfile.TemporaryDirectory() as directory:
+    for i, (codec, write) in enumerate(codecs):
+      filename = os.path.join(directory, 'flows_{}.pkl.gz'.format(i))
+      start    = time.time()
+      write(pages, filename)
+      results[codec] = {'mb_per_s': raw_mb / (time.time() - start), 'size_mb': os.path.getsize(filename) / 2 ** 20}
+      with contextlib.redirect_stdout(io.StringIO()):
+        flows = utils.load_pickle_file(filename)
+      assert flows == [ flow for page in pages for flow in page ], 'output of {} differs'.format(codec)
+  return results
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--pages'  , type=int, default=10)
+  parser.add_argument('--size'   , type=int, default=10000)
+  parser.add_argument('--levels' , type=int, nargs='+', default=[1, 6, 9])
+  parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+  parser.add_argument('--flush-pages', type=int, default=writers.FLUSH_PAGES,
+                      help='flush after each n-th page, 0: only on close (default: %(default)s)')
+  args = parser.parse_args()
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    results = run(args.pages, args.size, args.levels, args.threads, args.flush_pages)
+  for codec, result in results.items():
+    print('{:28s}: {:8.1f} MB/s {:8.1f} MB'.format(codec, result['mb_per_s'], result['size_mb']))
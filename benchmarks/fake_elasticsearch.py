@@ -0,0 +1,60 @@
+'''
+local stand-in for the elasticsearch client: serves canned documents through count/search/scroll with a
+configurable latency per request, supports sliced scrolls (body['slice'] = {'id', 'max'}) and sorted searches with
+search_after (the document index stands in for sort fields that are not in the documents, e.g., @timestamp, _id),
+filter_path is ignored (the hits always contain _source)
+'''
+import itertools
+import time
+
+
+class FakeElasticsearch(object):
+  '''
+  elasticsearch client that serves an in-memory list of documents (_source of each hit)
+  '''
+
+  def __init__(self, documents, latency=0.0):
+    '''
+    @param documents: documents (list of dict)
+    @param latency  : delay of each request (float, s)
+    '''
+    self.documents = documents
+    self.latency   = latency
+    self.scrolls   = {}
+    self.requests  = 0
+    self.ids       = itertools.count()
+    self.failure   = None # requests after this number fail (simulated outage)
+
+  def _request(self):
+    self.requests += 1
+    if self.failure is not None and self.requests > self.failure: raise ConnectionError('request {}'.format(self.requests))
+    if self.latency: time.sleep(self.latency)
+
+  def count(self, index=None, doc_type=None, body=None):
+    self._request()
+    return {'count': len(self.documents)}
+
+  def search(self, index=None, doc_type=None, scroll=None, size=10, body=None, _source=None, filter_path=None):
+    self._request()
+    documents = list(enumerate(self.documents))
+    if body and 'slice' in body: # documents are assigned to slices by their id (like the _id hash of elasticsearch)
+      documents = [ (i, document) for i, document in documents if i % body['slice']['max'] == body['slice']['id'] ]
+    if scroll is None: # sorted search (search_after)
+      fields = [ list(field)[0] for field in body['sort'] ]
+      hits   = sorted(( [ document.get(field, i) for field in fields ], i, document ) for i, document in documents)
+      if 'search_after' in body: hits = [ hit for hit in hits if hit[0] > body['search_after'] ]
+      return {'hits': {'total': len(hits), 'hits': [ {'_id': str(i), '_source': document, 'sort': values}
+                                                     for values, i, document in hits[:size] ]}}
+    scroll_id = str(next(self.ids))
+    self.scrolls[scroll_id] = (documents, size, 0)
+    return self._page(scroll_id, total=len(documents))
+
+  def scroll(self, scroll_id=None, scroll=None, filter_path=None):
+    self._request()
+    return self._page(scroll_id)
+
+  def _page(self, scroll_id, total=None):
+    documents, size, position = self.scrolls[scroll_id]
+    self.scrolls[scroll_id]   = (documents, size, position + size)
+    hits = [ {'_id': str(i), '_source': document} for i, document in documents[position:position + size] ]
+    return {'_scroll_id': scroll_id, 'hits': {'total': total if total is not None else len(hits), 'hits': hits}}
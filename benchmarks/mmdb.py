@@ -0,0 +1,182 @@
+'''
+minimal MaxMind DB (MMDB) writer for synthetic GeoLite2-like databases (ipv4 search tree, 24 bit records), so the geo
+enrichment can be benchmarked without downloading the GeoLite2 databases
+
+format: https://maxmind.github.io/MaxMind-DB/
+'''
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+from ipaddress import IPv4Address
+
+METADATA_MARKER = b'\xab\xcd\xefMaxMind.com'
+
+# unsigned integer with an explicit type (5: uint16, 6: uint32, 9: uint64), e.g., for the metadata fields
+Unsigned = namedtuple('Unsigned', ['data_type', 'value'])
+
+
+def encode(value):
+  '''
+  encode a value in the MaxMind DB data format (maps, arrays, utf-8 strings, doubles, unsigned integers, booleans)
+
+  @param value: value (dict, list, str, float, int, bool)
+  @return encoded value (bytes)
+  '''
+  if isinstance(value, Unsigned):
+    data = value.value.to_bytes((value.value.bit_length() + 7) // 8, 'big')
+    return _control(value.data_type, len(data)) + data
+  if isinstance(value, bool): return _control(14, int(value))
+  if isinstance(value, dict):
+    return _control(7, len(value)) + b''.join(encode(str(key)) + encode(item) for key, item in value.items())
+  if isinstance(value, list): return _control(11, len(value)) + b''.join(encode(item) for item in value)
+  if isinstance(value, str):
+    data = value.encode()
+    return _control(2, len(data)) + data
+  if isinstance(value, float): return _control(3, 8) + struct.pack('>d', value)
+  if isinstance(value, int):
+    if value < 0: raise ValueError('negative integers are not supported')
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    if value < 2 ** 16: return _control(5, len(data)) + data
+    if value < 2 ** 32: return _control(6, len(data)) + data
+    return _control(9, len(data)) + data
+  raise TypeError('unsupported type {}'.format(type(value)))
+
+
+def _control(data_type, size):
+  '''
+  @param data_type: type number (int), types > 7 are extended types
+  @param size     : payload size or number of elements (int)
+  @return control byte(s) including the extended type and size bytes (bytes)
+  '''
+  if   size < 29   : head, extra = size, b''
+  elif size < 285  : head, extra = 29, bytes([size - 29])
+  elif size < 65821: head, extra = 30, (size - 285).to_bytes(2, 'big')
+  else             : head, extra = 31, (size - 65821).to_bytes(3, 'big')
+  if data_type <= 7: return bytes([(data_type << 5) | head]) + extra
+  return bytes([head, data_type - 7]) + extra
+
+
+def write_mmdb(filename, networks, database_type, ip_version=4):
+  '''
+  write an ipv4 or ipv6 MMDB file
+
+  @param filename     : output file (str)
+  @param networks     : non-overlapping networks (list of (network address (int), prefix length (int), record (dict)))
+  @param database_type: database type (str, e.g., GeoLite2-Country)
+  @param ip_version   : 4 or 6 (ipv6 tree, ipv4 networks are stored as ::a.b.c.d/96+ like in the GeoLite2 files) (int)
+  '''
+  bits = 32 if ip_version == 4 else 128
+  data    = bytearray()
+  offsets = {}
+  tree    = [[None, None]] # nodes: [left, right], entries are node indices (int) or data offsets (tuple)
+  for network, prefix_len, record in networks:
+    key = encode(record)
+    if key not in offsets:
+      offsets[key] = len(data)
+      data        += key
+    node = 0
+    for depth in range(prefix_len):
+      bit = (network >> (bits - 1 - depth)) & 1
+      if depth == prefix_len - 1:
+        tree[node][bit] = (offsets[key],)
+      else:
+        if not isinstance(tree[node][bit], int):
+          tree.append([None, None])
+          tree[node][bit] = len(tree) - 1
+        node = tree[node][bit]
+
+  node_count = len(tree)
+  def _record(entry):
+    if entry is None           : return node_count
+    if isinstance(entry, tuple): return node_count + 16 + entry[0]
+    return entry
+
+  with open(filename, 'wb') as file:
+    for left, right in tree:
+      file.write(_record(left).to_bytes(3, 'big') + _record(right).to_bytes(3, 'big'))
+    file.write(b'\0' * 16)
+    file.write(bytes(data))
+    file.write(METADATA_MARKER)
+    file.write(encode({ 'node_count'                 : Unsigned(6, node_count),
+                        'record_size'                : Unsigned(5, 24),
+                        'ip_version'                 : Unsigned(5, ip_version),
+                        'database_type'              : database_type,
+                        'languages'                  : ['en'],
+                        'binary_format_major_version': Unsigned(5, 2),
+                        'binary_format_minor_version': Unsigned(5, 0),
+                        'build_epoch'                : Unsigned(9, int(time.time())),
+                        'description'                : {'en': 'synthetic ' + database_type} }))
+
+
+def synthetic_networks(number, seed=0):
+  '''
+  create non-overlapping networks with lengths /12 - /24 (one per distinct /12 block)
+
+  @param number: number of networks (int, at most 3584)
+  @param seed  : random seed (int)
+  @return network addresses and prefix lengths (list of (int, int))
+  '''
+  random  = np.random.RandomState(seed)
+  blocks  = np.sort(random.choice(np.arange(1 << 4, 224 << 4), size=number, replace=False))
+  lengths = random.randint(12, 25, size=number)
+  offsets = [ random.randint(0, 2 ** (length - 12)) << (32 - length) for length in lengths.tolist() ]
+  return [ ((int(block) << 20) | offset, int(length)) for block, length, offset in zip(blocks, lengths, offsets) ]
+
+
+def synthetic_networks6(number, seed=0):
+  '''
+  create non-overlapping ipv6 networks with lengths /32 - /48 in 2000::/3 (one per distinct /32 block)
+
+  @param number: number of networks (int)
+  @param seed  : random seed (int)
+  @return network addresses and prefix lengths (list of (int, int))
+  '''
+  random  = np.random.RandomState(seed)
+  blocks  = np.unique(random.randint(0x20000000, 0x40000000, size=2 * number, dtype=np.int64))[:number]
+  lengths = random.randint(32, 49, size=len(blocks))
+  offsets = [ random.randint(0, 2 ** (length - 32)) << (128 - length) for length in lengths.tolist() ]
+  return [ ((int(block) << 96) | offset, int(length)) for block, length, offset in zip(blocks, lengths, offsets) ]
+
+
+def synthetic_geo_databases(directory, number_of_networks=3000, seed=0, number_of_networks6=0):
+  '''
+  write synthetic country, city and ASN databases (all databases cover the same networks, like the GeoLite2 blocks)
+
+  @param directory          : output directory (str)
+  @param number_of_networks : networks per database (int)
+  @param seed               : random seed (int)
+  @param number_of_networks6: ipv6 networks per database (int), ipv6 databases if > 0
+  @return database files (dict: country, city, asn)
+  '''
+  random    = np.random.RandomState(seed)
+  countries = ['DE', 'US', 'FR', 'CN', 'BR', 'JP']
+  records   = {
+    'country': ('GeoLite2-Country', lambda: { 'country': { 'iso_code': countries[random.randint(len(countries))],
+                                                           'names': { 'en': 'country' } } }),
+    'city'   : ('GeoLite2-City'   , lambda: { 'location': { 'latitude' : round(random.uniform(-90, 90), 4),
+                                                            'longitude': round(random.uniform(-180, 180), 4) } }),
+    'asn'    : ('GeoLite2-ASN'    , lambda: { 'autonomous_system_number': int(random.randint(1, 70000)),
+                                              'autonomous_system_organization': 'AS' }),
+    }
+  files    = {}
+  networks = synthetic_networks(number_of_networks, seed)
+  if number_of_networks6:
+    networks = ([ (network, prefix_len + 96) for network, prefix_len in networks ] +
+                synthetic_networks6(number_of_networks6, seed))
+  for name, (database_type, record) in records.items():
+    files[name] = '{}/{}.mmdb'.format(directory, database_type)
+    write_mmdb(files[name], [ (network, prefix_len, record()) for network, prefix_len in networks ], database_type,
+               6 if number_of_networks6 else 4)
+  return files
+
+
+if __name__ == '__main__':
+  import geoip2.database
+  import tempfile
+  with tempfile.TemporaryDirectory() as directory:
+    files = synthetic_geo_databases(directory, 100)
+    with geoip2.database.Reader(files['country']) as reader:
+      network, prefix_len = synthetic_networks(100)[0]
+      print(IPv4Address(network), prefix_len, reader.country(str(IPv4Address(network))).country.iso_code)
@@ -0,0 +1,64 @@
+'''
+local stub of an elasticsearch cluster that receives synthetic flows at a configurable rate, serves them with sorted
+searches (search_after, sort values @timestamp in ms, flow_seq_num, _id) like the streaming mode of main.py expects
+'''
+import collections
+import threading
+import time
+
+from benchmarks.synthetic import synthetic_sources
+
+# flows that are generated at once
+BLOCK_SIZE = 1000
+
+
+class StubElasticsearch(object):
+  '''
+  elasticsearch client whose index grows by rate flows per second (@timestamp is the arrival time of a flow)
+  '''
+
+  def __init__(self, rate, seed=0):
+    '''
+    @param rate: arriving flows per second (float)
+    @param seed: random seed of the synthetic flows (int)
+    '''
+    self.rate      = rate
+    self.seed      = seed
+    self.started   = time.time()
+    self.documents = collections.deque() # (sequence number, document) of flows that arrived and were not consumed
+    self.produced  = 0
+    self.block     = []
+    self.requests  = 0
+    self.lock      = threading.Lock()
+
+  def _arrive(self):
+    ''' add the flows that arrived since the last request '''
+    arrived = int((time.time() - self.started) * self.rate)
+    while self.produced < arrived:
+      if not self.block:
+        self.block = synthetic_sources(BLOCK_SIZE, seed=self.seed + self.produced // BLOCK_SIZE)[::-1]
+      self.documents.append((self.produced, self.block.pop()))
+      self.produced += 1
+
+  def _timestamp(self, sequence_number):
+    '''
+    @param sequence_number: sequence number of a flow (int)
+    @return arrival time of the flow (int, ms)
+    '''
+    return int((self.started + sequence_number / self.rate) * 1000)
+
+  def count(self, index=None, doc_type=None, body=None):
+    with self.lock:
+      self.requests += 1
+      self._arrive()
+      return {'count': self.produced}
+
+  def search(self, index=None, doc_type=None, size=10, body=None, _source=None, **kwargs):
+    with self.lock:
+      self.requests += 1
+      self._arrive()
+      after = body['search_after'][1] if body and 'search_after' in body else -1
+      while self.documents and self.documents[0][0] <= after: self.documents.popleft()
+      hits = [ {'_id': str(i), '_source': document, 'sort': [self._timestamp(i), i, str(i)]}
+               for i, document in list(self.documents)[:size] ]
+      return {'hits': {'total': len(self.documents), 'hits': hits}}
@@ -0,0 +1,182 @@
+'''
+local HTTP stub of an elasticsearch cluster (for the elasticsearch client over a real connection): serves the hits of
+recorded documents through count, scroll searches, scrolls and sorted searches (search_after, the document index stands
+in for sort fields that are not in the documents) with the response envelope of elasticsearch 6 (took,
+_shards, _index, _type, _id, _score of each hit), supports _source filtering, docvalue_fields, filter_path and gzip
+compressed requests and responses, counts the transferred bytes
+'''
+import gzip
+import itertools
+import json
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# compression level of gzip responses (level of elasticsearch, http.compression_level)
+COMPRESSION_LEVEL = 3
+
+
+class StubServer(object):
+  '''
+  elasticsearch HTTP API of an index with the documents (_source of each hit), started on a free local port
+  '''
+
+  def __init__(self, documents, index='netflow-2019.01.31', doc_type='netflow', record=False):
+    '''
+    @param documents: documents (list of dict)
+    @param index    : index name of the hits (str)
+    @param doc_type : document type of the hits (str)
+    @param record   : keep the (uncompressed) bodies of the search and scroll responses (bool)
+    '''
+    self.documents = documents
+    self.index     = index
+    self.doc_type  = doc_type
+    self.record    = record
+    self.responses = []
+    self.scrolls   = {}
+    self.ids       = itertools.count()
+    self.lock      = threading.Lock()
+    self.reset()
+
+    stub = self
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+      def do_GET(self) : stub._handle(self)
+      def do_POST(self): stub._handle(self)
+      def log_message(self, *args): pass
+
+    self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self.port   = self.server.server_address[1]
+    self.thread = threading.Thread(target=self.server.serve_forever, name='stub-server', daemon=True)
+    self.thread.start()
+
+  def reset(self):
+    ''' reset the counters '''
+    with self.lock:
+      self.requests       = 0
+      self.bytes_sent     = 0 # response bodies as transferred (compressed if requested)
+      self.bytes_response = 0 # uncompressed response bodies
+      self.responses      = []
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def _handle(self, request):
+    '''
+    answer a request (count, search with scroll, scroll, sorted search)
+
+    @param request: request (BaseHTTPRequestHandler)
+    '''
+    url    = urllib.parse.urlsplit(request.path)
+    params = dict(urllib.parse.parse_qsl(url.query))
+    body   = request.rfile.read(int(request.headers.get('Content-Length', 0)))
+    if request.headers.get('Content-Encoding') == 'gzip': body = gzip.decompress(body)
+    body   = json.loads(body) if body else {}
+
+    if url.path.endswith('/_count')        : response = {'count': len(self.documents)}
+    elif url.path.endswith('/_search/scroll'): response = self._scroll(body.get('scroll_id', params.get('scroll_id')))
+    elif url.path.endswith('/_search')     : response = self._search(params, body)
+    else                                   : response = {'name': 'stub', 'version': {'number': '6.8.0'}}
+    if 'filter_path' in params: response = filter_path(response, params['filter_path'].split(','))
+
+    content = json.dumps(response).encode()
+    sent    = content
+    request.send_response(200)
+    request.send_header('Content-Type', 'application/json; charset=UTF-8')
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+      sent = gzip.compress(content, COMPRESSION_LEVEL)
+      request.send_header('Content-Encoding', 'gzip')
+    request.send_header('Content-Length', str(len(sent)))
+    request.end_headers()
+    request.wfile.write(sent)
+
+    with self.lock:
+      self.requests       += 1
+      self.bytes_sent     += len(sent)
+      self.bytes_response += len(content)
+      if self.record and 'hits' in response: self.responses.append(content)
+
+  def _search(self, params, body):
+    '''
+    @param params: query parameters (dict: size, scroll, _source)
+    @param body  : request body (dict: query, slice, _source, docvalue_fields, sort, search_after)
+    @return first page of a new scroll or page of a sorted search without scroll (dict)
+    '''
+    documents = list(enumerate(self.documents))
+    if 'slice' in body:
+      documents = [ (i, document) for i, document in documents if i % body['slice']['max'] == body['slice']['id'] ]
+    fields    = params['_source'].split(',') if '_source' in params else None
+    docvalues = body.get('docvalue_fields')
+    if body.get('_source') is False: fields = []
+    if 'scroll' not in params: # sorted search
+      keys        = [ list(key)[0] for key in body['sort'] ]
+      sorted_hits = sorted(( [ document.get(key, i) for key in keys ], i, document ) for i, document in documents)
+      if 'search_after' in body: sorted_hits = [ hit for hit in sorted_hits if hit[0] > body['search_after'] ]
+      hits = []
+      for values, i, document in sorted_hits[:int(params.get('size', 10))]:
+        hits.append(dict(self._hit(i, document, fields, docvalues), sort=values))
+      return {'took': 3, 'timed_out': False, '_shards': {'total': 5, 'successful': 5, 'skipped': 0, 'failed': 0},
+              'hits': {'total': len(sorted_hits), 'max_score': None, 'hits': hits}}
+    scroll_id = 'DnF1ZXJ5VGhlbkZldGNoBQAAAAAA{:020d}'.format(next(self.ids))
+    with self.lock:
+      self.scrolls[scroll_id] = {'documents': documents, 'size': int(params.get('size', 10)), 'position': 0,
+                                 'fields': fields, 'docvalues': docvalues}
+    return self._scroll(scroll_id, total=len(documents))
+
+  def _scroll(self, scroll_id, total=None):
+    '''
+    @param scroll_id: id of the scroll (str)
+    @param total    : number of hits (int), default number of hits of the page
+    @return next page of a scroll (dict)
+    '''
+    with self.lock:
+      scroll              = self.scrolls[scroll_id]
+      position            = scroll['position']
+      scroll['position'] += scroll['size']
+    hits = [ self._hit(i, document, scroll['fields'], scroll['docvalues'])
+             for i, document in scroll['documents'][position:position + scroll['size']] ]
+    return {'_scroll_id': scroll_id, 'took': 3, 'timed_out': False,
+            '_shards': {'total': 5, 'successful': 5, 'skipped': 0, 'failed': 0},
+            'hits': {'total': total if total is not None else len(hits), 'max_score': 1.0, 'hits': hits}}
+
+  def _hit(self, i, document, fields, docvalues):
+    '''
+    @param i        : index of the document (int)
+    @param document : document (dict)
+    @param fields   : fields of _source (list of str), None: all fields
+    @param docvalues: fields of the doc values (list of str) or None
+    @return hit (dict)
+    '''
+    hit = {'_index': self.index, '_type': self.doc_type, '_id': 'flow{:016x}'.format(i), '_score': 1.0}
+    if fields != []:
+      hit['_source'] = document if fields is None else { key: document[key] for key in fields if key in document }
+    if docvalues:
+      hit['fields'] = { key: [ document[key] ] for key in docvalues if key in document }
+    return hit
+
+
+def filter_path(response, paths):
+  '''
+  keep only the parts of a response that match a path (dotted keys, lists are filtered element-wise, empty objects are
+  dropped, like the filter_path parameter of elasticsearch)
+
+  @param response: response (dict)
+  @param paths   : paths (list of str, e.g., hits.hits._source)
+  @return filtered response (dict)
+  '''
+  def _filter(value, paths):
+    if [] in paths: return value
+    if isinstance(value, list):
+      values = [ _filter(item, paths) for item in value ]
+      return [ item for item in values if item is not None ]
+    if not isinstance(value, dict): return None
+    result = {}
+    for key, item in value.items():
+      matching = [ path[1:] for path in paths if path[0] == key ]
+      if not matching: continue
+      item = _filter(item, matching)
+      if item is not None and item != {}: result[key] = item
+    return result or None
+
+  return _filter(response, [ path.split('.') for path in paths ]) or {}
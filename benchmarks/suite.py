@@ -0,0 +1,276 @@
+'''
+reproducible benchmark suite for the enrichment and anonymization hot paths: synthetic prefix tables of realistic size
+(BGP-like prefix lengths), synthetic MMDB geo databases and pages of flows with a Zipf distributed address mix, the
+results are stored as JSON and can be compared with the results of another version
+
+python3 -m benchmarks.suite --output results.json [--compare baseline.json] [--quick]
+'''
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import geo
+import main
+import prefix_lookup as pl
+import utils
+import writers
+from flows import FlowBatch
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.synthetic import PRIVATE_PREFIXES, PRIVATE_VLANS, bgp_prefixes, setup_geo_databases, zipf_sources
+
+# default configuration (--quick reduces the sizes)
+CONFIG = {
+  'prefixes'     : 500000, # public prefixes
+  'geo_networks' : 3000,   # networks per MMDB file
+  'pages'        : 10,     # pages of flows
+  'page_size'    : 10000,  # flows per page
+  'zipf_exponent': 1.2,    # address distribution
+  'addresses'    : 100000, # size of the address pool
+  'repeat'       : 3,      # runs per benchmark (the best run is reported)
+  'seed'         : 0,
+  }
+
+QUICK_CONFIG = dict(CONFIG, prefixes=50000, pages=3, page_size=5000, repeat=1)
+
+# benchmarks (name: function(config, state) -> metrics)
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name):
+  '''
+  register a benchmark function
+
+  @param name: name of the benchmark (str)
+  @return decorator
+  '''
+  def _register(func):
+    BENCHMARKS[name] = func
+    return func
+  return _register
+
+
+def best_time(func, repeat, prepare=None):
+  '''
+  @param func   : function to be measured (func), called with the result of prepare
+  @param repeat : number of runs (int)
+  @param prepare: (optional) function that creates the input of each run outside of the measurement (func)
+  @return shortest run time (float, s)
+  '''
+  times = []
+  for _ in range(repeat):
+    argument = prepare() if prepare is not None else None
+    start    = time.perf_counter()
+    func(argument) if prepare is not None else func()
+    times.append(time.perf_counter() - start)
+  return min(times)
+
+
+def clear_geo_caches():
+  ''' clear the geo lookup caches (cold lookups) '''
+  getattr(geo, '__lookup_geo_information').cache_clear()
+  getattr(geo, '__geo_table_information').cache_clear()
+
+
+# region ---------------------------------------------------------------------------------------------------- benchmarks
+@benchmark('prefix_table_build')
+def bench_prefix_table_build(config, state):
+  prefixes = state['prefixes']
+  def _build():
+    with contextlib.redirect_stdout(io.StringIO()):
+      state['public_table'] = getattr(pl, '__build_prefix_lookup')(prefixes)
+  seconds = best_time(_build, config['repeat'])
+  return {'seconds': seconds, 'prefixes_per_s': len(prefixes) / seconds}
+
+
+@benchmark('prefix_lookup_scalar')
+def bench_prefix_lookup_scalar(config, state):
+  ips     = state['src_ips']
+  public  = best_time(lambda: [ pl.get_prefix_for_ip_public(ip) for ip in ips ], config['repeat'])
+  private = best_time(lambda: [ pl.get_prefix_for_ip_private(ip) for ip in ips ], config['repeat'])
+  return {'public_lookups_per_s': len(ips) / public, 'private_lookups_per_s': len(ips) / private}
+
+
+@benchmark('prefix_lookup_batch')
+def bench_prefix_lookup_batch(config, state):
+  ips     = utils.ips_to_uint32(state['src_ips'])
+  seconds = best_time(lambda: pl.get_prefixes_for_ips(ips), config['repeat'])
+  return {'lookups_per_s': len(ips) / seconds}
+
+
+@benchmark('geo_lookup')
+def bench_geo_lookup(config, state):
+  ips = state['src_ips']
+  def _lookups():
+    for ip in ips: geo.get_geo_information(ip)
+  cold  = best_time(lambda _: _lookups(), config['repeat'], prepare=clear_geo_caches)
+  warm  = best_time(_lookups, config['repeat'])
+  uints = utils.ips_to_uint32(ips)
+  batch = best_time(lambda _: geo.get_geo_information_for_ips(uints), config['repeat'], prepare=clear_geo_caches)
+  return {'cold_lookups_per_s': len(ips) / cold, 'warm_lookups_per_s': len(ips) / warm,
+          'batch_lookups_per_s': len(ips) / batch}
+
+
+@benchmark('geo_table')
+def bench_geo_table(config, state):
+  def _build():
+    with contextlib.redirect_stdout(io.StringIO()):
+      state['geo_table'] = geo.build_geo_table()
+  build = best_time(_build, config['repeat'])
+  with contextlib.redirect_stdout(io.StringIO()):
+    geo.load_geo_table()
+  uints = utils.ips_to_uint32(state['src_ips'])
+  batch = best_time(lambda _: geo.get_geo_information_for_ips(uints), config['repeat'], prepare=clear_geo_caches)
+  geo.geo_table = None
+  return {'build_seconds': build, 'batch_lookups_per_s': len(uints) / batch}
+
+
+@benchmark('update_flows')
+def bench_update_flows(config, state):
+  pages = state['pages']
+  def _prepare():
+    clear_geo_caches()
+    return [ FlowBatch.from_sources(page) for page in pages ]
+  seconds = best_time(lambda batches: [ main.update_flows(flows) for flows in batches ], config['repeat'], _prepare)
+  return {'flows_per_s': state['number_of_flows'] / seconds}
+
+
+@benchmark('convert_flows')
+def bench_convert_flows(config, state):
+  pages = state['pages']
+  def _prepare():
+    batches = [ FlowBatch.from_sources(page) for page in pages ]
+    for flows in batches: main.update_flows(flows)
+    return batches
+  seconds = best_time(lambda batches: [ main.convert_flows(flows) for flows in batches ], config['repeat'], _prepare)
+  return {'flows_per_s': state['number_of_flows'] / seconds}
+
+
+@benchmark('pickle_flows')
+def bench_pickle_flows(config, state):
+  batches = [ main.process_page(page) for page in state['pages'] ]
+  size    = []
+  def _write():
+    filename = os.path.join(state['directory'], 'flows.pkl.gz')
+    with writers.open_writer(filename) as writer:
+      for flows in batches: writer.write(flows.to_dicts())
+    size.append(writer.raw_bytes)
+  seconds = best_time(_write, config['repeat'])
+  return {'flows_per_s': state['number_of_flows'] / seconds, 'mb_per_s': size[-1] / 2 ** 20 / seconds}
+
+
+@benchmark('process_flows')
+def bench_process_flows(config, state):
+  documents = [ document for page in state['pages'] for document in page ]
+  main.ELASTICSEARCH_SCROLL_SIZE = config['page_size']
+  def _prepare():
+    clear_geo_caches()
+    utils.PICKLE_FILE_FLOWS = os.path.join(state['directory'], 'process_flows_{}.pkl.gz'.format(time.time()))
+    return FakeElasticsearch(documents)
+  def _process(elastic):
+    with contextlib.redirect_stdout(io.StringIO()):
+      main.process_flows(elastic)
+  seconds = best_time(_process, config['repeat'], _prepare)
+  return {'flows_per_s': len(documents) / seconds}
+# endregion
+
+
+def setup(config, directory):
+  '''
+  create the synthetic data and install lookup tables, geo databases and permutation tables
+
+  @param config   : configuration (dict, see CONFIG)
+  @param directory: directory for temporary files (str)
+  @return state shared by the benchmarks (dict)
+  '''
+  state = { 'directory': directory, 'prefixes': bgp_prefixes(config['prefixes'], config['seed']) }
+  with contextlib.redirect_stdout(io.StringIO()):
+    pl.prefix_lookup_public  = getattr(pl, '__build_prefix_lookup')(state['prefixes'])
+    pl.prefix_lookup_private = getattr(pl, '__build_prefix_lookup')(PRIVATE_PREFIXES, PRIVATE_VLANS)
+  setup_geo_databases(directory, config['geo_networks'], config['seed'])
+  main.PERMUTATION_TABLES = main.create_permutation_tables(b'benchmark')
+
+  state['pages']           = [ zipf_sources(config['page_size'], config['seed'] + i, config['zipf_exponent'],
+                                            config['addresses']) for i in range(config['pages']) ]
+  state['number_of_flows'] = config['pages'] * config['page_size']
+  state['src_ips']         = [ document['netflow.src_addr'] for page in state['pages'] for document in page ]
+  return state
+
+
+def environment():
+  '''
+  @return description of the benchmarked version and machine (dict)
+  '''
+  try:
+    commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(main.__file__)),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip() or None
+  except OSError:
+    commit = None
+  return { 'commit': commit, 'python': sys.version.split()[0], 'numpy': np.__version__,
+           'platform': platform.platform(), 'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%d %H:%M:%S') }
+
+
+def run(config, names=None):
+  '''
+  run the benchmarks
+
+  @param config: configuration (dict, see CONFIG)
+  @param names : (optional) names of the benchmarks to run (list of str), default all
+  @return results (dict: environment, config, results)
+  '''
+  results = collections.OrderedDict()
+  with tempfile.TemporaryDirectory() as directory:
+    state = setup(config, directory)
+    for name, func in BENCHMARKS.items():
+      if names is not None and name not in names: continue
+      results[name] = { key: round(value, 4) for key, value in func(config, state).items() }
+      print('{:22s}: {}'.format(name, results[name]), file=sys.stderr)
+  return { 'environment': environment(), 'config': config, 'results': results }
+
+
+def compare(results, baseline):
+  '''
+  compare results with the results of another version (throughput: higher is better, seconds: lower is better)
+
+  @param results : results (dict, see run)
+  @param baseline: results of the other version (dict, see run)
+  @return relative changes, positive values are improvements (dict: benchmark: metric: float)
+  '''
+  changes = collections.OrderedDict()
+  for name, metrics in results['results'].items():
+    for metric, value in metrics.items():
+      old = baseline['results'].get(name, {}).get(metric)
+      if not old or not value: continue
+      change = value / old - 1 if metric.endswith('_per_s') else old / value - 1
+      changes.setdefault(name, collections.OrderedDict())[metric] = round(change, 4)
+  return changes
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--output'    , default='benchmark_results.json', help='JSON file of the results')
+  parser.add_argument('--compare'   , help='JSON file of a previous run')
+  parser.add_argument('--quick'     , action='store_true', help='small sizes, single runs')
+  parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), help='run only these benchmarks')
+  args = parser.parse_args()
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    results = run(QUICK_CONFIG if args.quick else CONFIG, args.benchmarks)
+  with open(args.output, 'w') as file:
+    json.dump(results, file, indent=2)
+  print('results stored in {}'.format(args.output))
+
+  if args.compare:
+    with open(args.compare) as file:
+      changes = compare(results, json.load(file))
+    for name, metrics in changes.items():
+      print('{:22s}: {}'.format(name, ', '.join('{} {:+.1%}'.format(metric, change) for metric, change in metrics.items())))
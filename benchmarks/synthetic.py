@@ -0,0 +1,149 @@
+'''
+synthetic lookup tables, geo databases (MMDB) and flows for the benchmarks (no downloads or elasticsearch cluster needed)
+'''
+import contextlib
+import io
+import numpy as np
+from ipaddress import IPv4Address
+
+
+import geo
+import main
+import prefix_lookup as pl
+import sources
+import utils
+from benchmarks.mmdb import synthetic_geo_databases, synthetic_networks
+from benchmarks.bench_prefix_lookup import synthetic_prefixes
+
+PRIVATE_PREFIXES  = ['10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16']
+PRIVATE_VLANS     = {'10.0.0.0/8': '10', '192.168.0.0/16': '20'}
+PRIVATE_PREFIXES6 = ['fd00::/8']
+
+
+def setup_tables(number_of_prefixes=50000, number_of_geo_ranges=100000, seed=0):
+  '''
+  install synthetic prefix lookup tables (ipv4 and ipv6, all tables are installed, otherwise pl.ensure_loaded loads
+  the tables from the downloaded files), a synthetic geo table and permutation tables
+
+  @param number_of_prefixes  : number of public prefixes (int), a tenth of it public ipv6 prefixes
+  @param number_of_geo_ranges: number of ranges of the geo table (int)
+  @param seed                : random seed (int)
+  '''
+  with contextlib.redirect_stdout(io.StringIO()):
+    pl.prefix_lookup_public   = getattr(pl, '__build_prefix_lookup')(synthetic_prefixes(number_of_prefixes, seed))
+    pl.prefix_lookup_public6  = getattr(pl, '__build_prefix_lookup')(bgp_prefixes6(max(1, number_of_prefixes // 10),
+                                                                                   seed), ipv6=True)
+    pl.prefix_lookup_private  = getattr(pl, '__build_prefix_lookup')(PRIVATE_PREFIXES, PRIVATE_VLANS)
+    pl.prefix_lookup_private6 = getattr(pl, '__build_prefix_lookup')(PRIVATE_PREFIXES6, ipv6=True)
+
+  random = np.random.RandomState(seed)
+  starts = np.unique(random.randint(0, 2 ** 32, number_of_geo_ranges, dtype=np.uint64)).astype(np.uint32)
+  starts[0] = 0
+  geo.geo_table = {
+    'starts'             : starts,
+    'country_codes'      : random.randint(0, 5, len(starts)).astype(np.uint16),
+    'latitudes'          : np.round(random.uniform(-90, 90, len(starts)), 4),
+    'longitudes'         : np.round(random.uniform(-180, 180, len(starts)), 4),
+    'asns'               : random.randint(0, 70000, len(starts)).astype(np.uint32),
+    'country_code_labels': [None, 'DE', 'US', 'FR', 'CN'],
+    }
+  getattr(geo, '__geo_table_information').cache_clear()
+  geo.hsfd_geo_data        = geo.get_geo_information_for_ips(np.array([int(starts[1])], dtype=np.uint32))[0][0]
+  main.PERMUTATION_TABLES  = main.create_permutation_tables(b'benchmark')
+  main.PERMUTATION_TABLES6 = main.create_permutation_tables6(b'benchmark')
+
+
+def synthetic_sources(number_of_flows, seed=0):
+  '''
+  create elasticsearch documents (_source of each hit) with main.FLOW_KEYS (see sources.synthetic_documents)
+
+  @param number_of_flows: number of flows (int)
+  @param seed           : random seed (int)
+  @return elasticsearch documents (list of dict)
+  '''
+  return sources.synthetic_documents(number_of_flows, seed)
+
+
+def zipf_sources(number_of_flows, seed=0, exponent=1.2, number_of_addresses=100000):
+  '''
+  create elasticsearch documents whose addresses follow a Zipf distribution (few heavy hitters, long tail) over a pool
+  of addresses (half of them in 10.0.0.0/8), like the address mix of real traffic
+
+  @param number_of_flows    : number of flows (int)
+  @param seed               : random seed (int)
+  @param exponent           : exponent of the Zipf distribution (float, > 1)
+  @param number_of_addresses: size of the address pool (int)
+  @return elasticsearch documents (list of dict)
+  '''
+  documents = synthetic_sources(number_of_flows, seed)
+  random    = np.random.RandomState(seed)
+  pool      = random.randint(1 << 24, 224 << 24, number_of_addresses, dtype=np.uint64).astype(np.uint32)
+  private   = random.rand(number_of_addresses) < 0.5
+  pool      = np.where(private, (10 << 24) | (pool & 0xFFFFFF), pool)
+  for direction in ['src', 'dst']:
+    ranks    = np.minimum(random.zipf(exponent, number_of_flows), number_of_addresses) - 1
+    ips      = utils.uint32_to_ips(pool[ranks])
+    locality = np.where(private[ranks], 'private', 'public').tolist()
+    for document, ip, local in zip(documents, ips, locality):
+      document['netflow.{}_addr'.format(direction)]     = ip
+      document['netflow.{}_locality'.format(direction)] = local
+  return documents
+
+
+def setup_geo_databases(directory, number_of_networks=3000, seed=0):
+  '''
+  write synthetic MMDB files (see benchmarks.mmdb) and install them as geo databases (readers, no geo table)
+
+  @param directory         : directory of the MMDB files and the geo table (str)
+  @param number_of_networks: networks per database (int)
+  @param seed              : random seed (int)
+  '''
+  files = synthetic_geo_databases(directory, number_of_networks, seed)
+  for name, db_file in files.items(): geo.GEO_DATA[name]['db_file'] = db_file
+  geo.GEO_DATA['geo_table_file'] = '{}/geo_table.idx'.format(directory)
+  geo.geo_table     = None
+  geo.open_readers()
+  geo.hsfd_geo_data = geo.get_geo_information(str(IPv4Address(synthetic_networks(1, seed)[0][0])))
+
+
+def bgp_prefixes(number, seed=0):
+  '''
+  create public prefixes with a prefix length distribution similar to a BGP table (mostly /24, /22 and /23, few /8 -
+  /15), prefixes may be nested (more specifics)
+
+  @param number: number of prefixes (int)
+  @param seed  : random seed (int)
+  @return ip prefixes (list of str)
+  '''
+  random   = np.random.RandomState(seed)
+  lengths  = np.arange(8, 25)
+  weights  = np.array([1, 1, 1, 1, 2, 2, 2, 2, 30, 8, 15, 25, 40, 60, 90, 110, 600], dtype=np.float64)
+  lengths  = random.choice(lengths, size=2 * number, p=weights / weights.sum()).astype(np.uint32)
+  networks = random.randint(1 << 24, 224 << 24, 2 * number, dtype=np.uint64).astype(np.uint32)
+  networks = networks & ~((np.uint32(1) << (32 - lengths)) - 1).astype(np.uint32)
+  # distinct prefixes in random order
+  _, first = np.unique(networks.astype(np.uint64) << 8 | lengths, return_index=True)
+  first    = np.sort(first)[:number]
+  return [ '{}/{}'.format(ip, length) for ip, length in zip(utils.uint32_to_ips(networks[first]), lengths[first].tolist()) ]
+
+
+def bgp_prefixes6(number, seed=0):
+  '''
+  create public ipv6 prefixes (2000::/3) with a prefix length distribution similar to an ipv6 BGP table (mostly /48,
+  /32 - /44, few longer prefixes), prefixes may be nested
+
+  @param number: number of prefixes (int)
+  @param seed  : random seed (int)
+  @return ip prefixes (list of str)
+  '''
+  random   = np.random.RandomState(seed)
+  lengths  = np.array([19, 24, 28, 29, 32, 36, 40, 44, 46, 47, 48, 56, 64])
+  weights  = np.array([1, 2, 4, 10, 60, 20, 30, 60, 10, 10, 300, 5, 3], dtype=np.float64)
+  lengths  = random.choice(lengths, size=2 * number, p=weights / weights.sum()).astype(np.int64)
+  # upper half: 2000::/3 with the bits after the prefix length cleared (all lengths are at most 64)
+  networks = (random.randint(0, 2 ** 61, 2 * number, dtype=np.uint64) | np.uint64(1 << 61))
+  networks = networks & ~((np.uint64(1) << (64 - lengths).astype(np.uint64)) - np.uint64(1))
+  _, first = np.unique(np.column_stack([ networks, lengths.astype(np.uint64) ]), axis=0, return_index=True)
+  first    = np.sort(first)[:number]
+  ips      = utils.uint64x2_to_ips(np.column_stack([ networks[first], np.zeros(len(first), dtype=np.uint64) ]))
+  return [ '{}/{}'.format(ip, length) for ip, length in zip(ips, lengths[first].tolist()) ]
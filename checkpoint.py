@@ -0,0 +1,66 @@
+'''
+checkpoints of the incremental extraction: after each durably written page, the watermark (sort values of the last
+flow: @timestamp, flow_seq_num, _id) and the size of the output are stored, the next run continues after the
+watermark (only new flows), an interrupted run continues its output (data after the last checkpoint is discarded)
+'''
+import json
+import os
+import utils
+import writers
+
+
+def load_checkpoint(filename):
+  '''
+  load a checkpoint
+
+  @param filename: filename of/path to the checkpoint file (str)
+  @return checkpoint (dict: watermark, output, path, codec, offset, pages, complete) or None if there is no checkpoint
+  '''
+  if not os.path.isfile(filename): return None
+  with open(filename) as file:
+    return json.load(file)
+
+
+def save_checkpoint(filename, checkpoint):
+  '''
+  replace the checkpoint atomically (fsync if writers.FSYNC)
+
+  @param filename  : filename of/path to the checkpoint file (str)
+  @param checkpoint: checkpoint (dict)
+  '''
+  with open(filename + '.tmp', 'w') as file:
+    json.dump(checkpoint, file)
+    file.flush()
+    if writers.FSYNC: os.fsync(file.fileno())
+  os.replace(filename + '.tmp', filename)
+
+
+def save_page(filename, checkpoint, writer, watermark):
+  '''
+  flush the output of a written page and advance the checkpoint
+
+  @param filename  : filename of/path to the checkpoint file (str)
+  @param checkpoint: previous checkpoint (dict) or None
+  @param writer    : writer of the page (see writers.open_writer)
+  @param watermark : sort values of the last flow of the page (list)
+  @return new checkpoint (dict)
+  '''
+  writer.flush()
+  pages      = checkpoint['pages'] + 1 if checkpoint is not None and not checkpoint['complete'] else 1
+  checkpoint = { 'watermark': watermark, 'output': utils.PICKLE_FILE_FLOWS, 'path': writer.filename,
+                 'codec': writers.OUTPUT_CODEC, 'offset': writer.tell(), 'pages': pages, 'complete': False }
+  save_checkpoint(filename, checkpoint)
+  return checkpoint
+
+
+def resume_output(checkpoint):
+  '''
+  continue the output of an interrupted run: discard data after the checkpoint, further pages are appended
+
+  @param checkpoint: checkpoint of the interrupted run (dict)
+  '''
+  if checkpoint['codec'] != writers.OUTPUT_CODEC:
+    raise ValueError('interrupted run used output format {}, not {}'.format(checkpoint['codec'], writers.OUTPUT_CODEC))
+  writers.truncate_output(checkpoint['path'], checkpoint['codec'], checkpoint['offset'])
+  utils.PICKLE_FILE_FLOWS = checkpoint['output']
+  utils.PICKLE_FILES_WRITTEN.add(checkpoint['path'])
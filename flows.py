@@ -0,0 +1,190 @@
+'''
+columnar representation of a page of flows (load, enrich, anonymize and store operate on whole columns)
+'''
+import numpy as np
+import utils
+
+# typed columns (all other columns are stored as object arrays)
+FLOW_COLUMN_TYPES = {
+  'bytes'         : np.uint64,
+  'protocol'      : np.uint8,
+  'src_port'      : np.uint16,
+  'dst_port'      : np.uint16,
+  'tcp_flags'     : np.uint8,
+  'flow_seq_num'  : np.uint64,
+  'src_prefix_len': np.uint8,
+  'dst_prefix_len': np.uint8,
+  }
+
+# ip address columns (stored as uint32, columns with ipv6 addresses as two uint64 per address with ipv4-mapped ipv4
+# addresses, see utils.ips_to_uint64x2, converted to strings by to_dicts)
+IP_COLUMNS = ['src_addr', 'dst_addr', 'src_network', 'dst_network']
+
+# placeholder for values that are not present in a flow
+MISSING = object()
+
+
+def column_name(key):
+  '''
+  name of the column for an elasticsearch field (e.g., netflow.src_addr -> src_addr, host -> host)
+
+  @param key: elasticsearch field (str)
+  @return column name (str)
+  '''
+  return key.split('.')[1] if key != 'host' else key
+
+
+class FlowBatch(object):
+  '''
+  a page of flows stored as one numpy array per key (column), keys that are missing in some flows are recorded in a
+  mask per column
+  '''
+  __slots__ = ('columns', 'missing', 'size')
+
+  def __init__(self, size, columns=None, missing=None):
+    '''
+    @param size   : number of flows (int)
+    @param columns: columns (dict of np.ndarray)
+    @param missing: masks of missing values per column (dict of np.ndarray of bool)
+    '''
+    self.size    = size
+    self.columns = columns if columns is not None else {}
+    self.missing = missing if missing is not None else {}
+
+  @classmethod
+  def from_sources(cls, sources):
+    '''
+    create a batch from elasticsearch documents (_source of each hit), fields are renamed to column names
+
+    @param sources: elasticsearch documents (list of dict)
+    @return flows (FlowBatch)
+    '''
+    keys = {}
+    for source in sources:
+      for key in source:
+        if key not in keys: keys[key] = column_name(key)
+
+    batch = cls(len(sources))
+    for key, name in keys.items():
+      batch.set_column(name, [ source.get(key, MISSING) for source in sources ])
+    return batch
+
+  @classmethod
+  def from_hits(cls, hits, keys, docvalues=False):
+    '''
+    create a batch from elasticsearch hits with known fields, each column is read from all hits at once (no documents
+    per flow, fields are renamed once), fields that are not present in any hit are skipped (like from_sources)
+
+    @param hits     : elasticsearch hits with _source or with doc values (fields: a list of values per field) (list of dict)
+    @param keys     : elasticsearch fields (list of str)
+    @param docvalues: read the (first) doc value of each field instead of _source (bool)
+    @return flows (FlowBatch)
+    '''
+    documents = [ hit['fields'] for hit in hits ] if docvalues else [ hit['_source'] for hit in hits ]
+
+    batch = cls(len(documents))
+    for key in keys:
+      if docvalues: values = [ document[key][0] if key in document else MISSING for document in documents ]
+      else        : values = [ document.get(key, MISSING) for document in documents ]
+      if values.count(MISSING) == len(values): continue
+      batch.set_column(column_name(key), values)
+    return batch
+
+  @classmethod
+  def from_dicts(cls, records):
+    '''
+    create a batch from flows as stored in pickle files (see to_dicts)
+
+    @param records: flows (list of dict)
+    @return flows (FlowBatch)
+    '''
+    names = {}
+    for record in records:
+      for name in record:
+        if name not in names: names[name] = None
+
+    batch = cls(len(records))
+    for name in names:
+      batch.set_column(name, [ record.get(name, MISSING) for record in records ])
+    return batch
+
+  def __len__(self):
+    return self.size
+
+  def __contains__(self, name):
+    return name in self.columns
+
+  def __getitem__(self, name):
+    return self.columns[name]
+
+  def __setitem__(self, name, column):
+    '''
+    set a column (values for all flows)
+
+    @param name  : column name (str)
+    @param column: values (np.ndarray)
+    '''
+    if len(column) != self.size: raise ValueError('column {} has {} values, expected {}'.format(name, len(column), self.size))
+    self.columns[name] = column
+    self.missing.pop(name, None)
+
+  def set_column(self, name, values):
+    '''
+    set a column from python values, typed columns (FLOW_COLUMN_TYPES, IP_COLUMNS) are only used if all present values
+    have the expected type (int/str), otherwise the values are kept as objects
+
+    @param name  : column name (str)
+    @param values: values, MISSING for values that are not present (list)
+    '''
+    missing = np.array([ value is MISSING for value in values ], dtype=bool)
+    present = [ value for value in values if value is not MISSING ] if missing.any() else values
+
+    column = None
+    if name in IP_COLUMNS and all(type(value) is str for value in present):
+      ips = [ '0.0.0.0' if value is MISSING else value for value in values ]
+      try:
+        column = utils.ips_to_uint32(ips)
+      except ValueError: # not an ipv4 address
+        try:
+          column = utils.ips_to_uint64x2(ips)
+        except ValueError: # no ip address
+          pass
+    elif name in FLOW_COLUMN_TYPES and all(type(value) is int for value in present):
+      limits = np.iinfo(FLOW_COLUMN_TYPES[name])
+      if not present or (min(present) >= limits.min and max(present) <= limits.max):
+        column = np.array([ 0 if value is MISSING else value for value in values ], dtype=FLOW_COLUMN_TYPES[name])
+
+    if column is None:
+      column    = np.empty(len(values), dtype=object)
+      column[:] = [ None if value is MISSING else value for value in values ]
+
+    self[name] = column
+    if missing.any(): self.missing[name] = missing
+
+  def nbytes(self):
+    '''
+    memory used by the columns (object columns: pointers only)
+
+    @return size in bytes (int)
+    '''
+    return sum(column.nbytes for column in self.columns.values()) + sum(mask.nbytes for mask in self.missing.values())
+
+  def to_dicts(self):
+    '''
+    convert the batch to a list of dicts (one dict per flow, ip addresses as strings), as stored in pickle files
+
+    @return flows (list of dict)
+    '''
+    names  = list(self.columns)
+    values = []
+    for name in names:
+      column = self.columns[name]
+      if name in IP_COLUMNS and column.dtype == np.uint32: values.append(utils.uint32_to_ips(column))
+      elif name in IP_COLUMNS and column.ndim == 2       : values.append(utils.uint64x2_to_ips(column))
+      else                                               : values.append(column.tolist())
+
+    records = [ dict(zip(names, row)) for row in zip(*values) ] if names else [ {} for _ in range(self.size) ]
+    for name, mask in self.missing.items():
+      for i in np.flatnonzero(mask).tolist():
+        del records[i][name]
+    return records
@@ -1,15 +1,24 @@
 '''
 download the latest version of the geo databases and load them
+
+the databases are loaded on first use (see ensure_loaded), geoip2/maxminddb and the download modules are imported
+when they are needed, the local manifest (db/manifest.json, see assets.py) records the hashes of the local archives,
+the time of the last remote check of each database and the external ip address of the local system, so a fast start
+needs no network access (see GEO_REMOTE_CHECK), with assets.MIRROR_DIRECTORY the databases are taken from a local
+mirror (offline)
 '''
-import geoip2.database
-import urllib.request
-import hashlib
+import functools
+import numpy as np
+import ipaddress
 import os
 import shutil
 import re
 import pathlib
-import tarfile
-import zipfile
+import threading
+import time
+import assets
+import tables
+import utils
 
 # region --------------------------------------------------------------------------------------	geo database parameters
 # considered geo features
@@ -43,6 +52,7 @@ GEO_DATA = {
     },
   'public_prefixes':{
     'db_file':'./db/GeoLite2-ASN-CSV/GeoLite2-ASN-Blocks-IPv4.csv',
+    'db_file6':'./db/GeoLite2-ASN-CSV/GeoLite2-ASN-Blocks-IPv6.csv',
     'db_file_dir':'./db/GeoLite2-ASN-CSV/',
     'db_zip_file_local':'./db/GeoLite2-ASN-CSV.zip',
     'db_zip_file_remote':'http://geolite.maxmind.com/download/geoip/database/GeoLite2-ASN-CSV.zip',
@@ -50,66 +60,282 @@ GEO_DATA = {
     },
   'private_prefixes_file': './db/private_prefixes.csv',
   'private_prefixes_vlans': './db/private_prefixes_vlans.csv',
-  'public_prefixes_lookup_file':'./db/public_prefixes_lookup_tree.pkl.gz'
+  'public_prefixes_lookup_file':'./db/public_prefixes_lookup.idx',
+  'public_prefixes_lookup_file6':'./db/public_prefixes_lookup6.idx',
+  'geo_table_file':'./db/geo_table.idx',
+  'manifest_file':'./db/manifest.json'
   }
+
+# check for updated databases (md5 of the published archives) and the external ip address:
+#   sync : before the databases are loaded (each start)
+#   async: in a background thread, updates are downloaded on the next start, the cached external ip address is used
+#   off  : only missing databases are downloaded, the cached external ip address is used
+GEO_REMOTE_CHECK          = 'sync'
+# skip remote checks that are more recent than this (s, 0: check each time)
+GEO_REMOTE_CHECK_INTERVAL = 0
+# external ip address of the local system (geo information of private addresses), None: query checkip.dyndns.org
+EXTERNAL_IP               = None
+
+# precompute a columnar table of geo information per ipv4 range from the MMDB files (one vectorized range search per
+# page instead of MaxMind queries)
+GEO_TABLE_ENABLED = False
 # endregion
 
 country_reader, city_reader, asn_reader = None, None, None
 hsfd_geo_data = None
 
+# raised by the readers for addresses without information (geoip2.errors.AddressNotFoundError, see open_readers)
+AddressNotFoundError = ValueError
+
+# manifest and downloads of the databases (assets.AssetManager, see asset_manager)
+database_assets = None
+# whether the databases were updated by this process (see ensure_databases)
+databases_updated = False
+
+# maximum number of cached geo lookups (distinct ip addresses)
+GEO_CACHE_SIZE = 2 ** 16
+# number of lookups saved by the deduplication of addresses within a page
+deduplicated_lookups = 0
+
 NEW_PREFIXES = False
+NEW_GEO_DATA = False
+
+# columnar geo information per ipv4 range (dict of np.ndarray, see build_geo_table) if GEO_TABLE_ENABLED
+geo_table = None
 
 
 def load_data():
   ''' load the latest version of each geo database (ASN, city, country) '''
+  update_databases()
+  open_readers()
+
+  global hsfd_geo_data
+  hsfd_geo_data = get_geo_information(local_external_ip())
+
+
+def ensure_loaded():
+  ''' load the geo databases and the geo information of the local system on first use '''
+  get_local_geo_information()
+
+
+def ensure_readers():
+  ''' open the database readers on first use (missing databases are downloaded, see GEO_REMOTE_CHECK) '''
+  if country_reader is None:
+    ensure_databases()
+    open_readers()
+
+
+def ensure_databases():
+  ''' download missing and outdated databases once per process (see update_databases) '''
+  if not databases_updated: update_databases()
+
+
+def update_databases(check=None):
+  '''
+  download missing and outdated databases concurrently (assets.REFRESH_THREADS), a database is outdated if the md5 of
+  its published archive differs (remote check, see GEO_REMOTE_CHECK) or a background check found an update
+
+  @param check: (optional) remote check mode (str: sync, async, off), default GEO_REMOTE_CHECK
+  '''
+  global databases_updated
+  check = check if check is not None else GEO_REMOTE_CHECK
   try:
     os.mkdir('./db')
   except FileExistsError:
     pass
 
-  for _type, data in GEO_DATA.items():
-
-    if type(data) is str:
-      continue
-
-    if not check_remote_database(data['db_zip_file_local'], data['db_zip_file_md5']):
-      if os.path.isfile(data['db_file']):
-        os.remove(data['db_file'])
-      if _type == 'public_prefixes' and os.path.isfile(GEO_DATA['public_prefixes_lookup_file']):
-        os.remove(GEO_DATA['public_prefixes_lookup_file'])
-      with urllib.request.urlopen(data['db_zip_file_remote']) as response, open(data['db_zip_file_local'], 'wb') as output:
-        download = response.read()
-        output.write(download)
-      if _type == 'public_prefixes':
-        global NEW_PREFIXES
-        NEW_PREFIXES = True
-
-      extension = ''.join(pathlib.Path(data['db_zip_file_local']).suffixes)
-      if extension == '.tar.gz':
-        with tarfile.open(data['db_zip_file_local'], 'r:*') as tar_gz_file:
-          member = [x for x in tar_gz_file.getmembers() if re.compile('^.*.mmdb$').match(x.name)][0]
-          tar_gz_file.extractall(data['db_file_dir'], [member])
-          shutil.move(data['db_file_dir'] + member.name, data['db_file_dir'])
-          old_directory = data['db_file_dir'] + member.name.split('/')[0]
-          if not os.listdir(old_directory):
-            os.rmdir(old_directory)
-      elif extension == '.zip':
-        with zipfile.ZipFile(data['db_zip_file_local'], 'r') as zip_file:
-          member = [x for x in zip_file.namelist() if re.compile('^.*IPv4.csv$').match(x)][0]
-          zip_file.extractall(data['db_file_dir'], [member])
-          shutil.move(data['db_file_dir'] + member, data['db_file_dir'])
-          old_directory = data['db_file_dir'] + member.split('/')[0]
-          if not os.listdir(old_directory):
-            os.rmdir(old_directory)
-
-  # create an individual database reader for each database file
-  global country_reader, city_reader, asn_reader
-  country_reader = geoip2.database.Reader(GEO_DATA['country']['db_file'])
-  city_reader    = geoip2.database.Reader(GEO_DATA['city']['db_file'])
-  asn_reader     = geoip2.database.Reader(GEO_DATA['asn']['db_file'])
+  manager   = asset_manager()
+  databases = manager.manifest.setdefault('databases', {})
+
+  def _update(item):
+    '''
+    @param item: type and files/urls of a database (tuple, item of GEO_DATA)
+    '''
+    _type, data = item
+    with manager.lock:
+      entry = databases.setdefault(_type, {})
+    present = all(os.path.isfile(data[key]) for key in ['db_file', 'db_file6', 'db_zip_file_local'] if key in data)
+    if present and check == 'sync' and time.time() - entry.get('checked', 0) >= GEO_REMOTE_CHECK_INTERVAL:
+      update = not manager.is_current(data['db_zip_file_local'], data['db_zip_file_md5'])
+      with manager.lock: entry.update(update=update, checked=time.time())
+    if present and not entry.get('update', False):
+      return
+
+    download_database(_type, data)
+    with manager.lock: entry.update(update=False, checked=time.time())
+
+  try:
+    manager.run(_update, [ (_type, data) for _type, data in GEO_DATA.items() if type(data) is not str ])
+  finally:
+    manager.save()
+  databases_updated = True
+
+  if check == 'async':
+    threading.Thread(target=check_remote_databases, name='geo-check', daemon=True).start()
+
+
+def asset_manager():
+  '''
+  @return manifest and downloads of the databases (assets.AssetManager), created on first use
+  '''
+  global database_assets
+  if database_assets is None: database_assets = assets.AssetManager(GEO_DATA['manifest_file'])
+  return database_assets
+
+
+def download_database(_type, data):
+  '''
+  download (streamed to the local archive) and extract a database (MMDB file of a tar.gz archive, ipv4 and ipv6 CSV
+  files of a zip archive)
+
+  @param _type: type of the database (str, key of GEO_DATA)
+  @param data : files and urls of the database (dict, value of GEO_DATA)
+  '''
+  import tarfile
+  import zipfile
+
+  if os.path.isfile(data['db_file']):
+    os.remove(data['db_file'])
+  asset_manager().download(data['db_zip_file_remote'], data['db_zip_file_local'])
+  if _type == 'public_prefixes':
+    global NEW_PREFIXES
+    NEW_PREFIXES = True
+  else:
+    global NEW_GEO_DATA
+    NEW_GEO_DATA = True
+
+  extension = ''.join(pathlib.Path(data['db_zip_file_local']).suffixes)
+  if extension == '.tar.gz':
+    with tarfile.open(data['db_zip_file_local'], 'r:*') as tar_gz_file:
+      member = [x for x in tar_gz_file.getmembers() if re.compile('^.*.mmdb$').match(x.name)][0]
+      tar_gz_file.extractall(data['db_file_dir'], [member])
+      shutil.move(data['db_file_dir'] + member.name, data['db_file_dir'])
+      old_directory = data['db_file_dir'] + member.name.split('/')[0]
+      if not os.listdir(old_directory):
+        os.rmdir(old_directory)
+  elif extension == '.zip':
+    with zipfile.ZipFile(data['db_zip_file_local'], 'r') as zip_file:
+      for pattern, db_file in [('^.*IPv4.csv$', data['db_file']), ('^.*IPv6.csv$', data['db_file6'])]:
+        member = [x for x in zip_file.namelist() if re.compile(pattern).match(x)][0]
+        if os.path.isfile(db_file): os.remove(db_file)
+        zip_file.extractall(data['db_file_dir'], [member])
+        shutil.move(data['db_file_dir'] + member, data['db_file_dir'])
+        old_directory = data['db_file_dir'] + member.split('/')[0]
+        if not os.listdir(old_directory):
+          os.rmdir(old_directory)
+
+
+def check_remote_databases():
+  '''
+  background check: mark outdated databases in the manifest (downloaded on the next start) and refresh the cached
+  external ip address, failures (e.g., no network) are ignored
+  '''
+  manager = asset_manager()
+
+  def _check(item):
+    '''
+    @param item: type and files/urls of a database (tuple, item of GEO_DATA)
+    '''
+    _type, data = item
+    try:
+      update = not manager.is_current(data['db_zip_file_local'], data['db_zip_file_md5'])
+    except (OSError, ValueError):
+      return
+    with manager.lock:
+      manager.manifest.setdefault('databases', {}).setdefault(_type, {}).update(update=update, checked=time.time())
+
+  manager.run(_check, [ (_type, data) for _type, data in GEO_DATA.items()
+                       if type(data) is not str and os.path.isfile(data['db_zip_file_local']) ])
+  if EXTERNAL_IP is None and manager.mirror is None:
+    try:
+      external_ip = get_external_ip()
+      with manager.lock: manager.manifest['external_ip'] = external_ip
+    except (OSError, IndexError):
+      pass
+  manager.save()
+
+
+def open_readers():
+  '''
+  create an individual database reader for each database file (and load the geo table if GEO_TABLE_ENABLED), the
+  readers are a version of the table registry (swapped if the database files change, see tables.TableRegistry)
+  '''
+  tables.REGISTRY.load('geo_readers')
+
+
+def load_readers():
+  '''
+  @return database readers (country, city, ASN), the geo table (dict or None if not GEO_TABLE_ENABLED) and the geo
+          information of the local system with the new readers (dict or None if the external ip address is not known
+          without a query, see __known_external_ip)
+  '''
+  import geoip2.database
+  import geoip2.errors
+
+  global AddressNotFoundError
+  AddressNotFoundError = geoip2.errors.AddressNotFoundError
+  readers     = tuple( geoip2.database.Reader(GEO_DATA[name]['db_file']) for name in ['country', 'city', 'asn'] )
+  external_ip = __known_external_ip()
+  local       = __query_readers(readers, ipaddress.ip_address(external_ip)) if external_ip is not None else None
+  return readers, read_geo_table() if GEO_TABLE_ENABLED else None, local
+
+
+def __install_readers(table):
+  '''
+  @param table: database readers, geo table and geo information of the local system (tuple, dict/None, dict/None, see
+               load_readers)
+  '''
+  global country_reader, city_reader, asn_reader, geo_table, hsfd_geo_data
+  previous = (country_reader, city_reader, asn_reader)
+  (country_reader, city_reader, asn_reader), table, local = table
+  if table is not None: geo_table     = table
+  if local is not None: hsfd_geo_data = local
+  # close the replaced readers (memory mapped database files), they are not used after the swap between pages
+  for reader in previous:
+    if reader is not None: reader.close()
+  __lookup_geo_information.cache_clear()
+  __geo_table_information.cache_clear()
+
+
+def local_external_ip():
+  '''
+  external ip address of the local system: EXTERNAL_IP, queried in sync mode (GEO_REMOTE_CHECK), otherwise the address
+  of the manifest is used (if present), offline (mirror) only EXTERNAL_IP or the manifest are used
+
+  @return external/public ip address (str)
+  '''
+  if EXTERNAL_IP is not None: return EXTERNAL_IP
+  manager = asset_manager()
+  cached  = __known_external_ip()
+  if cached is not None and (GEO_REMOTE_CHECK != 'sync' or manager.mirror is not None): return cached
+  if manager.mirror is not None:
+    raise ValueError('offline (mirror): set geo.EXTERNAL_IP (--external-ip) for the geo information of private addresses')
+  external_ip = get_external_ip()
+  with manager.lock: manager.manifest['external_ip'] = external_ip
+  manager.save()
+  return external_ip
+
 
+def __known_external_ip():
+  '''
+  @return external ip address of the local system without a query: EXTERNAL_IP or the address of the manifest (str
+          or None)
+  '''
+  if EXTERNAL_IP is not None: return EXTERNAL_IP
+  manager = asset_manager()
+  with manager.lock:
+    return manager.manifest.get('external_ip')
+
+
+def get_local_geo_information():
+  '''
+  @return geo information of the local system (dict), loaded on first use
+  '''
   global hsfd_geo_data
-  hsfd_geo_data = get_geo_information(get_external_ip())
+  if hsfd_geo_data is None:
+    ensure_readers()
+    hsfd_geo_data = get_geo_information(local_external_ip())
+  return hsfd_geo_data
 
 
 def check_remote_database(local_file, remote_url):
@@ -120,36 +346,120 @@ def check_remote_database(local_file, remote_url):
   @param remote_url: url to the most recently published database (str)
   @return result of the check for actuality (bool)
   '''
-  if os.path.isfile(local_file):
-    md5_local = hashlib.md5(open(local_file, 'rb').read()).hexdigest()
+  return asset_manager().is_current(local_file, remote_url)
+
+
+def get_geo_information(ip_address):
+  '''
+  retrieve geo information, None values are replaced with numerical zero values (also for invalid ip addresses)
+  
+  @param ip_address: ip address for which the geo information is retrieved (str/IPv4Address/IPv6Address)
+  @return retrieved geo information (dict)  
+  '''
+  try:
+    ip_address = ipaddress.ip_address(ip_address)
+  except ValueError:
+    return __geo_information(None, None, None, None)
+  return dict(__lookup_geo_information(int(ip_address) if ip_address.version == 4 else ip_address))
+
+
+def get_geo_information_for_ips(ip_addresses):
+  '''
+  retrieve geo information for many ip addresses (e.g., all public addresses of a page), each distinct address (or
+  range of the geo table) is resolved once, ipv4-mapped addresses of ipv6 columns are resolved like ipv4 addresses
+  
+  @param ip_addresses: ip addresses (np.ndarray of uint32 or np.ndarray of uint64 with shape (n, 2))
+  @return distinct geo information (list of dict, shared, do not modify) and the index of each ip address into it
+          (np.ndarray)
+  '''
+  global deduplicated_lookups
+  if np.ndim(ip_addresses) == 2: return __geo_information_for_ips6(ip_addresses)
+  ip_addresses = np.asarray(ip_addresses, dtype=np.uint32)
+
+  if geo_table is not None: # one range search for all addresses
+    rows            = np.searchsorted(geo_table['starts'], ip_addresses, side='right') - 1
+    unique, inverse = np.unique(rows, return_inverse=True)
+    information     = [ __geo_table_information(row) for row in unique.tolist() ]
   else:
-    md5_local = -1
+    unique, inverse = np.unique(ip_addresses, return_inverse=True)
+    information     = [ __lookup_geo_information(ip) for ip in unique.tolist() ]
+  deduplicated_lookups += len(inverse) - len(unique)
+  return information, inverse
 
-  md5_remote = urllib.request.urlopen(remote_url).read().decode()
 
-  return md5_local == md5_remote
+def __geo_information_for_ips6(ip_addresses):
+  '''
+  @param ip_addresses: ip addresses (np.ndarray of uint64, shape (n, 2))
+  @return distinct geo information (list of dict) and the index of each ip address into it (np.ndarray)
+  '''
+  global deduplicated_lookups
+  ipv4  = utils.ipv4_mapped(ip_addresses)
+  index = np.zeros(len(ip_addresses), dtype=np.int64)
+  information, index[ipv4] = get_geo_information_for_ips(ip_addresses[ipv4, 1] & np.uint64(2 ** 32 - 1))
+  if not ipv4.all():
+    unique, inverse = np.unique(ip_addresses[~ipv4], axis=0, return_inverse=True)
+    index[~ipv4]    = len(information) + inverse.ravel()
+    information     = information + [ __lookup_geo_information(ipaddress.IPv6Address((hi << 64) | lo))
+                                      for hi, lo in unique.tolist() ]
+    deduplicated_lookups += len(inverse) - len(unique)
+  return information, index
 
 
-def get_geo_information(ip_address):
+def get_cache_statistics():
   '''
-  retrieve geo information, None values are replaced with numerical zero values
+  statistics of the geo lookup cache
   
-  @param ip_address: ip address for which the geo information is retrieved (IPv4Address)
-  @return retrieved geo information (dict)  
+  @return hits, misses (MaxMind queries), current size of the cache and lookups saved by the deduplication (dict)
   '''
+  info = __lookup_geo_information.cache_info()
+  return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'deduplicated': deduplicated_lookups}
+
+
+@functools.lru_cache(maxsize=GEO_CACHE_SIZE)
+def __lookup_geo_information(ip_address):
+  '''
+  query the geo databases (country, city, ASN) for an ip address, results are cached per ip address (the covering
+  prefixes of the databases differ, so the integer address is used as key)
+  
+  @param ip_address: ip address (int: ipv4, IPv6Address: ipv6)
+  @return retrieved geo information (dict)
+  '''
+  if country_reader is None: ensure_readers()
+  return __query_readers((country_reader, city_reader, asn_reader), ipaddress.ip_address(ip_address))
+
+
+def __query_readers(readers, ip_address):
+  '''
+  query database readers (country, city, ASN) for an ip address
+
+  @param readers   : database readers (tuple: country, city, ASN)
+  @param ip_address: ip address (IPv4Address/IPv6Address)
+  @return retrieved geo information (dict)
+  '''
+  country_reader, city_reader, asn_reader = readers
   try:
-    country_response = country_reader.country(str(ip_address))
-    city_response    = city_reader.city(str(ip_address))
-    asn_response     = asn_reader.asn(str(ip_address))
-  except:
-    return {
-      'country_code': 'None',
-      # 'postal'      : 'None',
-      'longitude'   : '0.0',
-      'latitude'    : '0.0',
-      'asn'         : '0',
-      }
+    country_response = country_reader.country(ip_address)
+    city_response    = city_reader.city(ip_address)
+    asn_response     = asn_reader.asn(ip_address)
+  except (AddressNotFoundError, ValueError):
+    return __geo_information(None, None, None, None)
+
+  return __geo_information(country_response.country.iso_code,
+                           city_response.location.latitude,
+                           city_response.location.longitude,
+                           asn_response.autonomous_system_number)
+
 
+def __geo_information(country_code, latitude, longitude, asn):
+  '''
+  create the geo information of an ip address, None values are replaced with numerical zero values
+  
+  @param country_code: iso country code (str/None)
+  @param latitude    : latitude of the location (float/None)
+  @param longitude   : longitude of the location (float/None)
+  @param asn         : autonomous system number (int/None)
+  @return geo information (dict)
+  '''
   def __if_None(val, alt):
     '''
     replace None values with an alternative value
@@ -161,19 +471,153 @@ def get_geo_information(ip_address):
     if val is None: return alt
     return val
 
-  return {'country_code': __if_None(country_response.country.iso_code, 'None'),
+  return {'country_code': __if_None(country_code, 'None'),
           # 'postal'    : __if_None(city_response.postal.code, 'None'),
-          'longitude'   : __if_None(city_response.location.latitude, '0.0'),
-          'latitude'    : __if_None(city_response.location.longitude, '0.0'),
-          'asn'         : __if_None(asn_response.autonomous_system_number, '0'),
+          'longitude'   : __if_None(latitude, '0.0'),
+          'latitude'    : __if_None(longitude, '0.0'),
+          'asn'         : __if_None(asn, '0'),
           }
 
 
+def build_geo_table():
+  '''
+  walk the ipv4 networks of the MMDB files (country, city, ASN) once and merge them into a columnar table: sorted range
+  start addresses with country code (index into country_codes), latitude, longitude (NaN: not available) and ASN (0:
+  not available) of each range, ranges that are missing in one of the databases carry no geo information (like a
+  failed MaxMind query)
+  
+  @return geo table (dict of np.ndarray) and country codes (list of str/None)
+  '''
+  import maxminddb
+
+  def _networks(db_file, select):
+    '''
+    @param db_file: MMDB file (str)
+    @param select : select function that is applied to each record (func)
+    @return first and last address of each ipv4 network (np.ndarray, np.ndarray) and the selected values (list)
+    '''
+    starts, ends, values = [], [], []
+    with maxminddb.open_database(db_file) as reader:
+      for network, record in reader:
+        if network.version != 4: continue
+        starts.append(int(network.network_address))
+        ends.append(int(network.broadcast_address))
+        values.append(select(record))
+    order = np.argsort(np.array(starts, dtype=np.int64), kind='stable')
+    return np.array(starts, dtype=np.int64)[order], np.array(ends, dtype=np.int64)[order], [ values[i] for i in order ]
+
+  databases = {
+    'country': _networks(GEO_DATA['country']['db_file'], lambda x: (x.get('country') or {}).get('iso_code')),
+    'city'   : _networks(GEO_DATA['city']['db_file']   , lambda x: ((x.get('location') or {}).get('latitude'),
+                                                                    (x.get('location') or {}).get('longitude'))),
+    'asn'    : _networks(GEO_DATA['asn']['db_file']    , lambda x: x.get('autonomous_system_number')),
+    }
+
+  # split the address space at each network boundary of each database
+  starts = np.unique(np.concatenate([ [0] ] + [ x for starts, ends, _ in databases.values() for x in (starts, ends + 1) ]))
+  starts = starts[starts < 2 ** 32]
+
+  rows  = {}
+  found = np.ones(len(starts), dtype=bool)
+  for name, (db_starts, db_ends, _) in databases.items():
+    rows[name] = np.searchsorted(db_starts, starts, side='right') - 1
+    found     &= (rows[name] >= 0) & (db_ends[np.maximum(rows[name], 0)] >= starts)
+
+  country_codes = [None] + sorted({ x for x in databases['country'][2] if x is not None })
+  country_index = { code: i for i, code in enumerate(country_codes) }
+  countries     = np.array([ country_index[x] for x in databases['country'][2] ] or [0], dtype=np.uint16)
+  locations     = np.array([ [ np.nan if y is None else y for y in x ] for x in databases['city'][2] ] or [[np.nan] * 2],
+                           dtype=np.float64).reshape(-1, 2)
+  asns          = np.array([ x or 0 for x in databases['asn'][2] ] or [0], dtype=np.uint32)
+
+  table = {
+    'starts'       : starts.astype(np.uint32),
+    'country_codes': np.where(found, countries[np.maximum(rows['country'], 0)], 0).astype(np.uint16),
+    'latitudes'    : np.where(found, locations[np.maximum(rows['city'], 0), 0], np.nan),
+    'longitudes'   : np.where(found, locations[np.maximum(rows['city'], 0), 1], np.nan),
+    'asns'         : np.where(found, asns[np.maximum(rows['asn'], 0)], 0).astype(np.uint32),
+    }
+
+  # merge adjacent ranges with the same geo information
+  changed = np.ones(len(starts), dtype=bool)
+  changed[1:] = ((np.diff(table['country_codes']) != 0) | (np.diff(table['asns'].astype(np.int64)) != 0) |
+                 ~__equal_nan(table['latitudes'][1:], table['latitudes'][:-1]) |
+                 ~__equal_nan(table['longitudes'][1:], table['longitudes'][:-1]))
+  return { name: column[changed] for name, column in table.items() }, country_codes
+
+
+def __equal_nan(a, b):
+  '''
+  element-wise comparison, NaN values are considered equal
+  
+  @param a: values (np.ndarray)
+  @param b: values (np.ndarray)
+  @return result of the comparison (np.ndarray of bool)
+  '''
+  return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def load_geo_table():
+  '''
+  memory map the geo table (build and store it next to the prefix index if the MMDB files changed)
+  '''
+  global geo_table
+  geo_table = read_geo_table()
+  __geo_table_information.cache_clear()
+
+
+def read_geo_table():
+  '''
+  memory map the geo table, it is built and stored first if the MMDB files changed (one process at a time)
+
+  @return geo table (dict of np.ndarray, country_code_labels: country codes)
+  '''
+  filename = GEO_DATA['geo_table_file']
+  source   = [ utils.file_stamp(GEO_DATA[x]['db_file']) for x in ['country', 'city', 'asn'] ]
+
+  # one process at a time builds the table (workers that detect the same change wait and map the result)
+  with utils.file_lock(filename + '.lock'):
+    columns, meta = (None, None)
+    if not NEW_GEO_DATA and os.path.isfile(filename):
+      columns, meta = utils.load_index_file(filename)
+    if meta is None or meta.get('type') != 'geo_table' or meta.get('source') != source:
+      print('build geo table', end='', flush=True)
+      table, country_codes = build_geo_table()
+      utils.save_index_file(filename, table, {'type': 'geo_table', 'source': source, 'country_codes': country_codes})
+      columns, meta = utils.load_index_file(filename)
+      print('...{} ranges'.format(len(columns['starts'])))
+
+  return dict(columns, country_code_labels=meta['country_codes'])
+
+
+@functools.lru_cache(maxsize=GEO_CACHE_SIZE)
+def __geo_table_information(row):
+  '''
+  create the geo information of a range of the geo table
+  
+  @param row: index of the range (int)
+  @return geo information (dict)
+  '''
+  def _value(x):
+    return None if np.isnan(x) else float(x)
+
+  return __geo_information(geo_table['country_code_labels'][geo_table['country_codes'][row]],
+                           _value(geo_table['latitudes'][row]),
+                           _value(geo_table['longitudes'][row]),
+                           int(geo_table['asns'][row]) or None)
+
+
 def get_external_ip():
   '''
   get the external/public ip address for the local system
   
   @return external/public ip address
   '''	
+  import urllib.request
+
   result = urllib.request.urlopen('http://checkip.dyndns.org').read().decode()
-  return re.findall(r'\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b', result)[0]
\ No newline at end of file
+  return re.findall(r'\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b', result)[0]
+
+
+tables.REGISTRY.register('geo_readers', lambda: [ GEO_DATA[name]['db_file'] for name in ['country', 'city', 'asn'] ],
+                         load_readers, __install_readers)
@@ -2,7 +2,10 @@
 load flow data from an elasticsearch database, enrich and anonymize each flow and
 store the results in a zipped pickle file 
 '''
+import argparse
+import collections
 import datetime
+import time
 
 # region ----------------------------------------------------------------- anonymization parameters
 PERMUTATION_SEED                     = b'foobar' 
@@ -13,6 +16,8 @@ ELASTICSEARCH_HOST                   = 'XXX.XXX.XXX.XXX'
 ELASTICSEARCH_PORT                   = 9200
 ELASTICSEARCH_SCROLL_SIZE            = 10000
 ELASTICSEARCH_SCROLL_CONTEXT_TIMEOUT = '1h'  # m, h, d (nanos, micros, ms, s)
+ELASTICSEARCH_PROJECTION             = 'source'  # transferred fields of the hits: hits, source, docvalues (see sources.PROJECTIONS)
+ELASTICSEARCH_HTTP_COMPRESS          = True  # gzip compressed requests and responses
 # SEARCH_TIME_INTERVAL_LOW = '0000000000000'  # '0000000000000', '1970-01-01 01:00:00' (time zone UTC)
 SEARCH_TIME_INTERVAL_DELTA = '5d'  # s, m, H/h, d, w, M, y
 
@@ -55,26 +60,78 @@ FLOW_KEYS = [
 	]
 #endregion
 
-PERMUTATION_TABLES = None
+# region ----------------------------------------------------------------- pipeline parameters
+PIPELINE_QUEUE_DEPTH = 2  # pages buffered between fetch/compute/write (0: serial processing)
+PIPELINE_WORKERS     = 1  # worker processes for enrichment/anonymization (1: no worker processes)
+ELASTICSEARCH_SLICES = 1  # sliced scroll: number of slices that are extracted in parallel
+OUTPUT_PER_SLICE     = False  # store each slice in its own file (True) or all slices in one file (False)
+# endregion
+
+# region ----------------------------------------------------------------- incremental parameters
+INCREMENTAL      = False  # process only flows after the watermark of the checkpoint, continue interrupted runs
+CHECKPOINT_FILE  = './checkpoint.json'
+# order of the flows in incremental mode, the sort values of the last written flow are the watermark (search_after)
+INCREMENTAL_SORT = [{'@timestamp': 'asc'}, {'netflow.flow_seq_num': 'asc'}, {'_id': 'asc'}]
+# endregion
+
+# region ----------------------------------------------------------------- streaming parameters (follow mode)
+STREAM_BATCH_SIZE      = 1000  # flows per micro-batch
+STREAM_FLUSH_INTERVAL  = 1.0   # s, a micro-batch is stored at the latest this long after its first flow arrived
+STREAM_POLL_INTERVAL   = 0.5   # s, pause between polls without new flows
+STREAM_ROLL_INTERVAL   = 3600  # s, start a new output file after this time
+STREAM_REPORT_INTERVAL = 60    # s, report throughput and latency percentiles
+STREAM_LATENCY_SAMPLES = 10 ** 6  # latencies of the most recent flows used for the percentiles
+# endregion
+
+PERMUTATION_TABLES  = None
+# permutation tables of the 16-bit groups of ipv6 addresses (8 x 65536), created on first use if missing
+PERMUTATION_TABLES6 = None
 
 import utils
 import geo
-from elasticsearch import Elasticsearch
 import numpy as np
 import hashlib
-from ipaddress import IPv4Address
 import prefix_lookup as pl
+import pipeline
+import writers
+import assets
+import checkpoint
+import metrics
+import sources
+import tables
+from flows import FlowBatch
 
 @utils.measure_time_memory
-def init():
-  # load geo information
-  geo.load_data()
+def init(fast_start=False):
+  '''
+  load the geo databases and prefix lookup tables and create the permutation tables
+
+  @param fast_start: load the databases and lookup tables on first use, remote checks in the background (bool)
+  '''
+  if fast_start:
+    geo.GEO_REMOTE_CHECK = 'async'
+  else:
+    # load geo information
+    geo.load_data()
+    
+    # load prefix information  
+    pl.load_prefix_data()
   
-  # load prefix information  
-  pl.load_prefix_data()
+  # create 4 individual permutation tables for each octet of an ip address (8 for the groups of ipv6 addresses)
+  global PERMUTATION_TABLES, PERMUTATION_TABLES6
+  PERMUTATION_TABLES  = create_permutation_tables(PERMUTATION_SEED)
+  PERMUTATION_TABLES6 = create_permutation_tables6(PERMUTATION_SEED)
+
+
+def create_permutation_tables(permutation_seed):
+  '''
+  create the permutation tables for the anonymization of ip addresses
   
+  @param permutation_seed: password (permutation seed) (bytes)
+  @return one permutation table for each octet of an ip address (np.ndarray of uint32, 4 x 256)
+  '''
   # hash password (permutation seed) based on SHA3-512
-  sha3_512_hash = hashlib.sha512(PERMUTATION_SEED).hexdigest()
+  sha3_512_hash = hashlib.sha512(permutation_seed).hexdigest()
   
   # create 4 seeds, one for each permutation table
   seeds = [
@@ -84,118 +141,516 @@ def init():
     int(sha3_512_hash[120:128], 16), 
     ]
   
-  # create 4 individual permutation tables for each octet of an ip address 
-  global PERMUTATION_TABLES 
-  PERMUTATION_TABLES = [ np.random.RandomState(seed=seed).permutation(np.arange(256)) for seed in seeds ]
+  # create 4 individual permutation tables for each octet of an ip address (one row per octet)
+  return np.array([ np.random.RandomState(seed=seed).permutation(np.arange(256)) for seed in seeds ], dtype=np.uint32)
 
+
+def create_permutation_tables6(permutation_seed):
+  '''
+  create the permutation tables for the anonymization of ipv6 addresses (one table per 16-bit group)
   
-@utils.measure_time_memory
-def process_flows():
-  ''' load, enrich (update), anonymize (convert) and store flows pagewise '''
+  @param permutation_seed: password (permutation seed) (bytes)
+  @return one permutation table for each group of an ipv6 address (np.ndarray of uint64, 8 x 65536)
+  '''
+  # 8 seeds from the hash of the password (separate from the seeds of the ipv4 tables)
+  sha512_hash = hashlib.sha512(b'ipv6' + permutation_seed).hexdigest()
+  seeds       = [ int(sha512_hash[i:i + 8], 16) for i in range(0, 128, 16) ]
+  return np.array([ np.random.RandomState(seed=seed).permutation(np.arange(2 ** 16)) for seed in seeds ],
+                  dtype=np.uint64)
+
   
-  elastic = Elasticsearch(hosts=[{'host': ELASTICSEARCH_HOST,
-                                  'port': ELASTICSEARCH_PORT}])
+@utils.measure_time_memory
+def process_flows(elastic=None, source=None):
+  '''
+  load, enrich (update), anonymize (convert) and store flows pagewise, loading and storing run in separate threads
+  that overlap with the enrichment/anonymization of the current page (PIPELINE_QUEUE_DEPTH), the enrichment/
+  anonymization is distributed to PIPELINE_WORKERS forked processes (geo cache statistics cover the main process only),
+  with ELASTICSEARCH_SLICES > 1 the slices of a sliced scroll are fetched in parallel (one fetcher thread per slice),
+  with INCREMENTAL only flows after the watermark of the checkpoint are processed (the checkpoint is advanced after
+  each written page), the stages are instrumented (see metrics.py, the output is started if METRICS_FILE or
+  METRICS_PORT is set)
   
-  number_of_elements = elastic.count(index=ELASTICSEARCH_INDEX,
-                                     doc_type=ELASTICSEARCH_DOCTYPE,
-                                     body=ELASTICSEARCH_BODY)['count'] 
+  @param elastic: elasticsearch client (Elasticsearch), None connects to ELASTICSEARCH_HOST
+  @param source : (optional) source of the flows instead of elasticsearch (sources.FlowSource)
+  '''
+  if source is None: source = elasticsearch_source(elastic)
+  # workers inherit the loaded databases and lookup tables instead of loading them on first use
+  if PIPELINE_WORKERS > 1:
+    geo.ensure_loaded()
+    pl.ensure_loaded()
+  if INCREMENTAL and not isinstance(source, sources.ElasticsearchSource):
+    raise ValueError('incremental mode requires an elasticsearch source')
   
-  number_of_pages = number_of_elements // ELASTICSEARCH_SCROLL_SIZE
+  number_of_elements = source.count()
+  number_of_pages    = max(1, number_of_elements // ELASTICSEARCH_SCROLL_SIZE) if number_of_elements is not None else None
   print('number_of_elements', number_of_elements)
   print('ELASTICSEARCH_SCROLL_SIZE', ELASTICSEARCH_SCROLL_SIZE)
+
+  written_pages = 0
+  state         = None
+  metrics.REGISTRY.reset()
+
+  def write_page(flows, slice_id):
+    '''
+    store a processed page and report the progress
+    
+    @param flows   : enriched and anonymized flows (FlowBatch), with the watermark of the page in incremental mode
+    @param slice_id: index of the scroll slice of the page (int)
+    '''
+    nonlocal written_pages, state
+    if INCREMENTAL: flows, watermark = flows
+    with metrics.stage('write', len(flows)):
+      writer = utils.pickle_flows(flows, part=slice_id if OUTPUT_PER_SLICE and ELASTICSEARCH_SLICES > 1 else None)
+      if INCREMENTAL: state = checkpoint.save_page(CHECKPOINT_FILE, state, writer, watermark)
+    metrics.count('pages')
+    if number_of_pages is not None:
+      utils.printProgressBar(written_pages, number_of_pages, prefix='Progress:', suffix='Complete', length=50)
+    written_pages += 1
+
+  if INCREMENTAL:
+    state = checkpoint.load_checkpoint(CHECKPOINT_FILE)
+    # continue the output of an interrupted run
+    if state is not None and not state['complete']: checkpoint.resume_output(state)
+    pages   = search_after_pages(source.elastic, state['watermark'] if state is not None else None)
+    slices  = [ metrics.timed_pages(pages, size=lambda page: len(page[0])) ]
+    compute = process_checkpointed_page
+  else:
+    slices  = [ metrics.timed_pages(pages) for pages in source.slices(ELASTICSEARCH_SLICES) ]
+    compute = process_page
+
+  reporter = metrics.start_reporter()
+  try:
+    pipeline.run_sliced_pipeline(slices, compute, write_page,
+                                 queue_depth=PIPELINE_QUEUE_DEPTH, workers=PIPELINE_WORKERS)
+  finally:
+    utils.close_flow_writers()
+    if reporter is not None: reporter.stop()
+    metrics.save_profiles()
+
+  if INCREMENTAL and state is not None:
+    state['complete'] = True
+    checkpoint.save_checkpoint(CHECKPOINT_FILE, state)
+
+  print('geo cache', geo.get_cache_statistics())
+  print('stages', metrics.summary())
+  print('tables', metrics.REGISTRY.table_versions())
+
+
+def elasticsearch_source(elastic=None):
+  '''
+  source of the flows of ELASTICSEARCH_INDEX that match ELASTICSEARCH_BODY
   
+  @param elastic: elasticsearch client (Elasticsearch), None connects to ELASTICSEARCH_HOST
+  @return flow source (sources.ElasticsearchSource)
+  '''
+  if elastic is None: elastic = elasticsearch_client()
+  return sources.ElasticsearchSource(elastic, ELASTICSEARCH_INDEX, ELASTICSEARCH_DOCTYPE, ELASTICSEARCH_BODY, FLOW_KEYS,
+                                     ELASTICSEARCH_SCROLL_SIZE, ELASTICSEARCH_SCROLL_CONTEXT_TIMEOUT,
+                                     ELASTICSEARCH_PROJECTION)
+
+
+def elasticsearch_client():
+  '''
+  connect to ELASTICSEARCH_HOST (the elasticsearch module is imported on first use), compressed with
+  ELASTICSEARCH_HTTP_COMPRESS
+
+  @return elasticsearch client (Elasticsearch)
+  '''
+  from elasticsearch import Elasticsearch
+  return Elasticsearch(hosts=[{'host': ELASTICSEARCH_HOST,
+                               'port': ELASTICSEARCH_PORT}],
+                       http_compress=ELASTICSEARCH_HTTP_COMPRESS)
+
+
+def search_after_pages(elastic, watermark=None):
+  '''
+  load flows pagewise in the order of INCREMENTAL_SORT (search_after), starting after a watermark
+  
+  @param elastic  : elasticsearch client (Elasticsearch)
+  @param watermark: sort values of the last processed flow (list), None starts with the first flow
+  @return generator of pages (list of hits) and the watermark of each page (list)
+  '''
+  while True:
+    hits = search_after_page(elastic, watermark, ELASTICSEARCH_SCROLL_SIZE)
+    if not hits: return
+    watermark = hits[-1]['sort']
+    yield hits, watermark
+
+
+def search_after_page(elastic, watermark=None, size=None):
+  '''
+  load the next flows in the order of INCREMENTAL_SORT after a watermark
+  
+  @param elastic  : elasticsearch client (Elasticsearch)
+  @param watermark: sort values of the last processed flow (list), None starts with the first flow
+  @param size     : maximum number of flows (int), default ELASTICSEARCH_SCROLL_SIZE
+  @return hits with the fields of ELASTICSEARCH_PROJECTION, the sort values of each hit are stored in hit['sort']
+          (list of dict, see sources.decode_hits)
+  '''
+  body = dict(ELASTICSEARCH_BODY, sort=INCREMENTAL_SORT)
+  if watermark is not None: body['search_after'] = watermark
+  body, params = sources.search_request(body, FLOW_KEYS, ELASTICSEARCH_PROJECTION, sort=True)
   page = elastic.search(index=ELASTICSEARCH_INDEX,
                         doc_type=ELASTICSEARCH_DOCTYPE,
-                        scroll=ELASTICSEARCH_SCROLL_CONTEXT_TIMEOUT,
-                        size=ELASTICSEARCH_SCROLL_SIZE,
-                        body=ELASTICSEARCH_BODY,
-                        _source=FLOW_KEYS)
-  
-  scroll_id   = page['_scroll_id']
-  scroll_size = page['hits']['total']
-  
-  print('scroll_size_total', scroll_size)
-  
-  i = 0
-  while (scroll_size > 0):
-    flows = [ x['_source'] for x in page['hits']['hits'] ]
-    flows = [ {k.split('.')[1] if k != 'host' else k:x[k] for k in x.keys()} for x in flows ]
-    update_flows(flows)
-    convert_flows(flows)
-    utils.pickle_flows(flows)
-    utils.printProgressBar(i, number_of_pages, prefix='Progress:', suffix='Complete', length=50)
-    page        = elastic.scroll(scroll_id=scroll_id, scroll=ELASTICSEARCH_SCROLL_CONTEXT_TIMEOUT)    
-    scroll_id   = page['_scroll_id']
-    scroll_size = len(page['hits']['hits'])
-    i += 1
+                        size=size if size is not None else ELASTICSEARCH_SCROLL_SIZE,
+                        body=body,
+                        **params)
+  return page.get('hits', {}).get('hits', []) # filter_path drops the hits of an empty page
+
+
+@utils.measure_time_memory
+def follow_flows(elastic=None, duration=None):
+  '''
+  streaming mode: poll for flows after the watermark of the checkpoint, enrich (update), anonymize (convert) and store
+  them in micro-batches (STREAM_BATCH_SIZE flows or STREAM_FLUSH_INTERVAL after the first buffered flow), the checkpoint
+  is advanced after each micro-batch, the output file is rolled each STREAM_ROLL_INTERVAL, the latency of a flow is
+  the time from its @timestamp until it is stored
+  
+  @param elastic : elasticsearch client (Elasticsearch), None connects to ELASTICSEARCH_HOST
+  @param duration: (optional) stop after this time (float, s), otherwise runs until interrupted (KeyboardInterrupt)
+  @return number of stored flows (int) and latency statistics (dict, see latency_statistics)
+  '''
+  if elastic is None: elastic = elasticsearch_client()
+  
+  state = checkpoint.load_checkpoint(CHECKPOINT_FILE)
+  # continue the output of an interrupted run
+  if state is not None and not state['complete']: checkpoint.resume_output(state)
+  watermark = state['watermark'] if state is not None else None
+  
+  latencies = collections.deque(maxlen=STREAM_LATENCY_SAMPLES)
+  buffer    = []
+  count     = 0
+  started   = rolled = reported = buffered = time.time()
+  
+  def store_batch():
+    ''' store the buffered flows as one page and advance the checkpoint '''
+    nonlocal state, buffer, count
+    flows = process_page(sources.decode_hits(buffer, FLOW_KEYS, ELASTICSEARCH_PROJECTION))
+    with metrics.stage('write', len(flows)):
+      writer = utils.pickle_flows(flows)
+      state  = checkpoint.save_page(CHECKPOINT_FILE, state, writer, buffer[-1]['sort'])
+    metrics.count('pages')
+    stored = time.time()
+    latencies.extend((stored - np.array([ hit['sort'][0] for hit in buffer ], dtype=np.float64) / 1000).tolist())
+    count += len(buffer)
+    buffer = []
+  
+  metrics.REGISTRY.reset()
+  reporter = metrics.start_reporter()
+  try:
+    while duration is None or time.time() - started < duration:
+      with metrics.stage('fetch') as call:
+        hits          = search_after_page(elastic, watermark, STREAM_BATCH_SIZE - len(buffer))
+        call['flows'] = len(hits)
+      if hits:
+        if not buffer: buffered = time.time()
+        buffer   += hits
+        watermark = hits[-1]['sort']
+      
+      now = time.time()
+      if buffer and (len(buffer) >= STREAM_BATCH_SIZE or now - buffered >= STREAM_FLUSH_INTERVAL): store_batch()
+      
+      if now - rolled >= STREAM_ROLL_INTERVAL: # further flows are stored in a new file
+        utils.close_flow_writers()
+        utils.PICKLE_FILE_FLOWS = None
+        if state is not None:
+          state['complete'] = True
+          checkpoint.save_checkpoint(CHECKPOINT_FILE, state)
+        rolled = now
+      
+      if now - reported >= STREAM_REPORT_INTERVAL:
+        print('\nflows {} ({:.0f}/s), latency {}'.format(count, count / (now - started), latency_statistics(latencies)))
+        reported = now
+      
+      if not hits: # wait for new flows (at most until the buffered flows are due)
+        due = STREAM_FLUSH_INTERVAL - (now - buffered) if buffer else STREAM_POLL_INTERVAL
+        time.sleep(max(0, min(STREAM_POLL_INTERVAL, due)))
+  except KeyboardInterrupt:
+    pass
+  
+  try:
+    if buffer: store_batch()
+  finally:
+    utils.close_flow_writers()
+    if reporter is not None: reporter.stop()
+    metrics.save_profiles()
+  
+  statistics = latency_statistics(latencies)
+  print('flows {}, latency {}'.format(count, statistics))
+  return count, statistics
+
+
+def latency_statistics(latencies):
+  '''
+  percentiles of latencies
+  
+  @param latencies: latencies (iterable of float, s)
+  @return p50, p90, p99 and maximum latency in ms (dict), empty if there are no latencies
+  '''
+  latencies = np.fromiter(latencies, dtype=np.float64)
+  if len(latencies) == 0: return {}
+  p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+  return { 'p50_ms': round(p50, 1), 'p90_ms': round(p90, 1), 'p99_ms': round(p99, 1),
+           'max_ms': round(latencies.max() * 1000, 1) }
+
+
+def process_checkpointed_page(page):
+  '''
+  enrich (update) and anonymize (convert) the flows of a page in incremental mode
+  
+  @param page: elasticsearch hits of a page (list of dict) and the watermark of the page (list)
+  @return enriched and anonymized flows (FlowBatch) and the watermark of the page (list)
+  '''
+  hits, watermark = page
+  return process_page(sources.decode_hits(hits, FLOW_KEYS, ELASTICSEARCH_PROJECTION)), watermark
+
+
+def process_page(page):
+  '''
+  enrich (update) and anonymize (convert) the flows of a page
+  
+  @param page: flows of a page, elasticsearch documents (list of dict, _source of each hit) or columns (FlowBatch)
+  @return enriched and anonymized flows (FlowBatch)
+  '''
+  tables.REGISTRY.swap() # switch to new versions of the lookup tables between pages
+  if isinstance(page, FlowBatch):
+    flows = page
+  else:
+    with metrics.stage('rename', len(page)):
+      flows = FlowBatch.from_sources(page)
+  update_flows(flows)
+  convert_flows(flows)
+  return flows
 
 
 def update_flows(flows):
   '''
   enrich (update) flows with local and global topology information
   
-  @param flows: flows to be enriched (list)
+  @param flows: flows to be enriched (FlowBatch)
   '''  
-  for flow in flows:
-    if flow['src_locality'] == 'private':
-      flow.update({ 'src_' + k:v for k, v in geo.hsfd_geo_data.items() if k in geo.GEO_KEYS })
-      src_prefix, src_vlan = pl.get_prefix_for_ip_private(flow['src_addr'])
-    else: 
-      flow.update({ 'src_' + k:v for k, v in geo.get_geo_information(flow['src_addr']).items() if k in geo.GEO_KEYS })
-      src_prefix, src_vlan = pl.get_prefix_for_ip_public(flow['src_addr'])
-      
-    if flow['dst_locality'] == 'private': 
-      flow.update({ 'dst_' + k:v for k, v in geo.hsfd_geo_data.items() if k in geo.GEO_KEYS })
-      dst_prefix, dst_vlan = pl.get_prefix_for_ip_private(flow['dst_addr'])
-    else: 
-      flow.update({ 'dst_' + k:v for k, v in geo.get_geo_information(flow['dst_addr']).items() if k in geo.GEO_KEYS })
-      dst_prefix, dst_vlan = pl.get_prefix_for_ip_public(flow['dst_addr'])
+  n = len(flows)
+  if n == 0: return
 
-    flow.update({'src_network'   : str(src_prefix.network_address),
-                 'src_prefix_len': src_prefix.prefixlen,
-                 'src_vlan'      : src_vlan,
-                 'dst_network'   : str(dst_prefix.network_address),
-                 'dst_prefix_len': dst_prefix.prefixlen,
-                 'dst_vlan'      : dst_vlan})
+  # determine the prefixes of all source and destination addresses of the page at once
+  ips     = ip_columns(flows, ['src_addr', 'dst_addr'])
+  private = np.concatenate([flows['src_locality'] == 'private', flows['dst_locality'] == 'private'])
+  with metrics.stage('prefix', n):
+    networks, prefix_lens, vlans = get_prefixes(ips, private)
+
+  # geo information of each distinct public address of the page (private addresses: location of the local network)
+  with metrics.stage('geo', n):
+    public             = np.flatnonzero(~private)
+    information, index = geo.get_geo_information_for_ips(ips[public])
+    information        = [ geo.get_local_geo_information() ] + information
+    geo_index          = np.zeros(len(ips), dtype=np.int64)
+    geo_index[public]  = index + 1
+
+    for prefix, rows in [('src_', slice(0, n)), ('dst_', slice(n, None))]:
+      for key in [ k for k in information[0] if k in geo.GEO_KEYS ]:
+        values    = np.empty(len(information), dtype=object)
+        values[:] = [ x[key] for x in information ]
+        flows[prefix + key] = values[geo_index[rows]]
+
+  flows['src_network']    = networks[:n]
+  flows['src_prefix_len'] = prefix_lens[:n]
+  flows['src_vlan']       = vlans[:n]
+  flows['dst_network']    = networks[n:]
+  flows['dst_prefix_len'] = prefix_lens[n:]
+  flows['dst_vlan']       = vlans[n:]
+
+
+def get_prefixes(ips, private):
+  '''
+  determine the ip prefixes and VLANs for public and private ip addresses
+  
+  @param ips    : ip addresses (np.ndarray of uint32 or np.ndarray of uint64 with shape (n, 2))
+  @param private: whether an ip address is private (np.ndarray of bool)
+  @return network addresses, prefix lengths and VLANs (np.ndarray, np.ndarray, np.ndarray)
+  '''
+  public_prefixes  = pl.get_prefixes_for_ips(ips)
+  private_prefixes = pl.get_prefixes_for_ips(ips, private=True)
+  return [ np.where(private if x.ndim == 1 else private[:, None], x, y)
+           for x, y in zip(private_prefixes, public_prefixes) ]
 
 
 def convert_flows(flows):
   '''
-  anonymize (convert) flows
+  anonymize (convert) flows, all ip addresses (source/destination address/network) of the page are permuted at once
   
-  @param flows: flows to be anonymized (list)
+  @param flows: flows to be anonymized (FlowBatch)
   '''
+  keys = ['src_addr', 'dst_addr', 'src_network', 'dst_network']
+  n    = len(flows)
+  with metrics.stage('permute', n):
+    ips = permute_ips(ip_columns(flows, keys), as_strings=False)
   
-  def convert_ips(flow):
-    '''
-    convert each ip address in a flow (source/destination address/network)
-    
-    @param flow: flow for which the ip addresses are converted (dict)
-    '''
+  for i, key in enumerate(keys):
+    flows[key] = ips[i * n:(i + 1) * n]
 
-    def permute_ip(ip):
-      ''' 
-      permute an ip address octet by octet based on individual permutation tables
-      
-      @param ip: ip address to be permuted (str)
-      @return permuted ip address (str)
-      '''
-      return '.'.join([str(PERMUTATION_TABLES[i][int(octet)]) for i, octet in enumerate(ip.split('.'))])
-    
-    flow['src_addr']    = permute_ip(flow['src_addr'])
-    flow['dst_addr']    = permute_ip(flow['dst_addr'])
-    
-    flow['src_network'] = permute_ip(flow['src_network'])
-    flow['dst_network'] = permute_ip(flow['dst_network'])
+
+def ip_columns(flows, keys):
+  '''
+  concatenate ip address columns, if one of them contains ipv6 addresses all are converted to 128-bit integers
   
-  for flow in flows:
-    convert_ips(flow)
+  @param flows: flows (FlowBatch)
+  @param keys : names of the ip address columns (list of str)
+  @return ip addresses (np.ndarray of uint32 or np.ndarray of uint64 with shape (n, 2))
+  '''
+  columns = [ flows[key] for key in keys ]
+  if all(column.ndim == 1 for column in columns): return np.concatenate(columns)
+  return np.concatenate([ column if column.ndim == 2 else utils.uint32_to_uint64x2(column) for column in columns ])
+
+
+def permute_ips(ips, as_strings=True):
+  ''' 
+  permute ip addresses octet by octet based on individual permutation tables (vectorized, all addresses at once),
+  ipv6 addresses group by group (16 bits), ipv4-mapped addresses of ipv6 columns like ipv4 addresses
+  
+  @param ips       : ip addresses (list of str, np.ndarray of uint32 or np.ndarray of uint64 with shape (n, 2))
+  @param as_strings: return the permuted ip addresses as strings (True) or integers (False)
+  @return permuted ip addresses (list of str or np.ndarray of uint32/uint64 like ips)
+  '''
+  if not isinstance(ips, np.ndarray):
+    try:
+      ips = utils.ips_to_uint32(ips)
+    except ValueError: # ipv6 addresses
+      ips = utils.ips_to_uint64x2(ips)
+  if ips.ndim == 2:
+    permuted = __permute_ips6(ips)
+    return utils.uint64x2_to_ips(permuted) if as_strings else permuted
+  shifts   = np.array([24, 16, 8, 0], dtype=np.uint32)
+  octets   = (np.asarray(ips, dtype=np.uint32)[:, None] >> shifts) & 255
+  permuted = (PERMUTATION_TABLES[np.arange(4), octets] << shifts).sum(axis=1, dtype=np.uint32)
+  return utils.uint32_to_ips(permuted) if as_strings else permuted
+
+
+def __permute_ips6(ips):
+  '''
+  @param ips: ip addresses (np.ndarray of uint64, shape (n, 2))
+  @return permuted ip addresses (np.ndarray of uint64, shape (n, 2))
+  '''
+  global PERMUTATION_TABLES6
+  if PERMUTATION_TABLES6 is None: PERMUTATION_TABLES6 = create_permutation_tables6(PERMUTATION_SEED)
+  ipv4     = utils.ipv4_mapped(ips)
+  permuted = np.empty_like(ips)
+  if ipv4.any():
+    permuted[ipv4] = utils.uint32_to_uint64x2(permute_ips(ips[ipv4, 1] & np.uint64(2 ** 32 - 1), as_strings=False))
+  if not ipv4.all():
+    shifts = np.array([48, 32, 16, 0], dtype=np.uint64)
+    for half in [0, 1]: # 4 groups per half
+      groups = (ips[~ipv4, half][:, None] >> shifts) & np.uint64(0xFFFF)
+      permuted[~ipv4, half] = (PERMUTATION_TABLES6[np.arange(4 * half, 4 * half + 4), groups] << shifts).sum(
+        axis=1, dtype=np.uint64)
+  return permuted
  
   
 if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--workers', type=int, default=PIPELINE_WORKERS,
+                      help='worker processes for enrichment/anonymization (default: %(default)s)')
+  parser.add_argument('--slices', type=int, default=ELASTICSEARCH_SLICES,
+                      help='elasticsearch scroll slices that are extracted in parallel (default: %(default)s)')
+  parser.add_argument('--projection', choices=sources.PROJECTIONS, default=ELASTICSEARCH_PROJECTION,
+                      help='transferred fields of the elasticsearch hits: complete hits, _source only or doc values '
+                           '(default: %(default)s)')
+  parser.add_argument('--no-http-compress', dest='http_compress', action='store_false',
+                      default=ELASTICSEARCH_HTTP_COMPRESS, help='uncompressed elasticsearch requests and responses')
+  parser.add_argument('--output-per-slice', action='store_true', default=OUTPUT_PER_SLICE,
+                      help='store each slice in its own file')
+  parser.add_argument('--compression-level', type=int, default=writers.COMPRESSION_LEVEL,
+                      help='compression level of the output (0-9, default: %(default)s)')
+  parser.add_argument('--compression-threads', type=int, default=writers.COMPRESSION_THREADS,
+                      help='threads that compress the output (default: %(default)s)')
+  parser.add_argument('--flush-pages', type=int, default=writers.FLUSH_PAGES,
+                      help='flush the compressed pages after each n-th page, 0: only on checkpoints and at the end '
+                           '(default: %(default)s)')
+  parser.add_argument('--fsync', action='store_true', default=writers.FSYNC,
+                      help='fsync the output after each flushed page')
+  parser.add_argument('--output-format', choices=list(writers.WRITERS), default=writers.OUTPUT_CODEC,
+                      help='gzip: pickled pages (<timestamp>_flows.pkl.gz), shards: directory of columnar shards '
+                           '(<timestamp>_flows/) (default: %(default)s)')
+  parser.add_argument('--incremental', action='store_true', default=INCREMENTAL,
+                      help='process only flows after the last checkpoint, continue an interrupted run')
+  parser.add_argument('--checkpoint', default=CHECKPOINT_FILE,
+                      help='checkpoint file of the incremental mode (default: %(default)s)')
+  # sources of the flows: elasticsearch (batch, --incremental or --follow), an exported file or synthetic flows
+  source_group = parser.add_mutually_exclusive_group()
+  source_group.add_argument('--follow', action='store_true',
+                            help='streaming mode: continuously process new flows (checkpointed, see --checkpoint)')
+  parser.add_argument('--batch-size', type=int, default=STREAM_BATCH_SIZE,
+                      help='flows per micro-batch in streaming mode (default: %(default)s)')
+  parser.add_argument('--flush-interval', type=float, default=STREAM_FLUSH_INTERVAL,
+                      help='maximum time (s) flows are buffered in streaming mode (default: %(default)s)')
+  source_group.add_argument('--input',
+                            help='process an exported file (NDJSON: one document or hit per line, CSV: header with the '
+                                 'field names) instead of elasticsearch')
+  source_group.add_argument('--synthetic', type=int, metavar='FLOWS',
+                            help='process synthetic random flows instead of elasticsearch (profiling)')
+  parser.add_argument('--fast-start', action='store_true',
+                      help='load the databases and lookup tables on first use, check for updated databases in the '
+                           'background (updates are used on the next start)')
+  parser.add_argument('--mirror', default=assets.MIRROR_DIRECTORY,
+                      help='offline: take the databases from a local mirror directory (see python3 assets.py)')
+  parser.add_argument('--external-ip', default=geo.EXTERNAL_IP,
+                      help='external ip address of the local system (default: cached or queried)')
+  parser.add_argument('--table-refresh-interval', type=float, default=tables.TABLE_REFRESH_INTERVAL,
+                      help='interval (s) of the checks for changed databases and prefix files, new versions of the '
+                           'lookup tables are built in the background and used from the next page, 0: off '
+                           '(default: %(default)s)')
+  parser.add_argument('--install-modules', action='store_true',
+                      help='install missing required modules (pip, user space) before the start')
+  parser.add_argument('--metrics-file', default=metrics.METRICS_FILE,
+                      help='file for the per-stage metrics (see --metrics-format)')
+  parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default=metrics.METRICS_FORMAT,
+                      help='json: append JSON lines, prometheus: replace the file (text format) (default: %(default)s)')
+  parser.add_argument('--metrics-port', type=int, default=metrics.METRICS_PORT,
+                      help='serve the metrics on http://localhost:<port>/metrics (Prometheus) and /metrics.json')
+  parser.add_argument('--metrics-host', default=metrics.METRICS_HOST,
+                      help='interface of the metrics server, 0.0.0.0: all interfaces (default: %(default)s)')
+  parser.add_argument('--metrics-interval', type=float, default=metrics.METRICS_INTERVAL,
+                      help='interval (s) of the metrics output (default: %(default)s)')
+  parser.add_argument('--profile', nargs='+', choices=metrics.STAGES, default=list(metrics.PROFILE_STAGES),
+                      help='profile sampled calls of these stages with cProfile (see metrics.PROFILE_DIRECTORY)')
+  parser.add_argument('--profile-memory', action='store_true', default=metrics.PROFILE_MEMORY,
+                      help='record the peak memory allocations (tracemalloc) of the profiled stages')
+  args = parser.parse_args()
+  if args.incremental and (args.input is not None or args.synthetic is not None):
+    parser.error('--incremental requires an elasticsearch source (not with --input or --synthetic)')
+  PIPELINE_WORKERS            = args.workers
+  ELASTICSEARCH_SLICES        = args.slices
+  ELASTICSEARCH_PROJECTION    = args.projection
+  ELASTICSEARCH_HTTP_COMPRESS = args.http_compress
+  OUTPUT_PER_SLICE            = args.output_per_slice
+  writers.COMPRESSION_LEVEL   = args.compression_level
+  writers.COMPRESSION_THREADS = args.compression_threads
+  writers.FLUSH_PAGES         = args.flush_pages
+  writers.FSYNC               = args.fsync
+  writers.OUTPUT_CODEC        = args.output_format
+  INCREMENTAL                 = args.incremental
+  CHECKPOINT_FILE             = args.checkpoint
+  STREAM_BATCH_SIZE           = args.batch_size
+  STREAM_FLUSH_INTERVAL       = args.flush_interval
+  assets.MIRROR_DIRECTORY     = args.mirror
+  geo.EXTERNAL_IP             = args.external_ip
+  tables.TABLE_REFRESH_INTERVAL = args.table_refresh_interval
+  metrics.METRICS_FILE        = args.metrics_file
+  metrics.METRICS_FORMAT      = args.metrics_format
+  metrics.METRICS_PORT        = args.metrics_port
+  metrics.METRICS_HOST        = args.metrics_host
+  metrics.METRICS_INTERVAL    = args.metrics_interval
+  metrics.PROFILE_STAGES      = args.profile
+  metrics.PROFILE_MEMORY      = args.profile_memory
+
   print('Anonymizer')
 
-  init()
-  process_flows()
+  if args.install_modules: utils.install_modules()
+  init(args.fast_start)
+  source = None
+  if args.input     is not None: source = sources.FileSource(args.input, FLOW_KEYS)
+  if args.synthetic is not None: source = sources.SyntheticSource(args.synthetic, ELASTICSEARCH_SCROLL_SIZE)
+  
+  if args.follow: follow_flows()
+  else          : process_flows(source=source)
   
   print('EXIT')
\ No newline at end of file
@@ -0,0 +1,434 @@
+'''
+per-stage instrumentation of the flow processing
+
+stages: fetch (load a page from the source), rename (documents to columns, see FlowBatch.from_sources), prefix (prefix
+lookup), geo (geo lookup), permute (anonymization) and write (store a page)
+
+each stage records calls, flows, errors and a histogram of its duration per call, the metrics are emitted every
+METRICS_INTERVAL as JSON lines or in the Prometheus text format to METRICS_FILE and/or served on METRICS_PORT
+(http://localhost:<port>/metrics), the metrics of forked worker processes are merged into the main process (see
+measured_call)
+
+opt-in profiling of sampled calls per stage (PROFILE_STAGES): cProfile statistics (<PROFILE_DIRECTORY>/<stage>_<pid>.prof,
+view with python3 -m pstats) and, with PROFILE_MEMORY, the peak of traced memory allocations (tracemalloc) per stage
+'''
+import bisect
+import collections
+import contextlib
+import cProfile
+import json
+import multiprocessing.util
+import os
+import threading
+import time
+import tracemalloc
+
+import tables
+
+# region ----------------------------------------------------------------- metrics parameters
+METRICS_FILE      = None    # file for the metrics (JSON lines are appended, Prometheus text is replaced), None: no file
+METRICS_PORT      = None    # port of a local http server for the metrics (/metrics), None: no server
+METRICS_HOST      = '127.0.0.1' # interface of the http server ('' or 0.0.0.0: all interfaces, e.g., remote scraping)
+METRICS_FORMAT    = 'json'  # format of METRICS_FILE: json (JSON lines) or prometheus (text format), the port serves both
+METRICS_INTERVAL  = 10      # s, interval of the metrics output
+
+PROFILE_STAGES    = ()      # stages that are profiled with cProfile (e.g., ('geo', 'write'))
+PROFILE_MEMORY    = False   # record the peak of traced memory allocations (tracemalloc) of the profiled stages
+PROFILE_SAMPLE    = 10      # profile every n-th call of a stage
+PROFILE_DIRECTORY = './profiles'
+# endregion
+
+STAGES = ('fetch', 'rename', 'prefix', 'geo', 'permute', 'write')
+
+# upper bounds of the duration histogram buckets (s)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+# prefix of the Prometheus metric names
+PROMETHEUS_PREFIX = 'anonymizer'
+
+
+class Metrics(object):
+  '''
+  thread-safe registry of stage metrics and counters
+  '''
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    ''' discard all recorded metrics '''
+    with self.lock:
+      self.started  = time.time()
+      self.stages   = collections.OrderedDict()
+      self.counters = collections.OrderedDict()
+      self.tables   = {} # versions of the lookup tables reported by the worker processes
+
+  def record(self, stage, seconds, flows=0, error=False, memory=None):
+    '''
+    record a call of a stage
+
+    @param stage  : name of the stage (str)
+    @param seconds: duration of the call (float, s)
+    @param flows  : flows processed by the call (int)
+    @param error  : whether the call failed (bool)
+    @param memory : (optional) peak of traced memory allocations during the call (int, bytes)
+    '''
+    with self.lock:
+      metrics = self.stages.get(stage)
+      if metrics is None: metrics = self.stages[stage] = _stage_metrics()
+      metrics['calls']   += 1
+      metrics['flows']   += flows
+      metrics['errors']  += int(error)
+      metrics['seconds'] += seconds
+      metrics['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+      if memory is not None: metrics['memory_peak'] = max(metrics['memory_peak'], memory)
+
+  def count(self, name, value=1):
+    '''
+    increase a counter
+
+    @param name : name of the counter (str)
+    @param value: increment (int)
+    '''
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + value
+
+  def state(self):
+    '''
+    @return raw metrics of all stages and counters and the versions of the lookup tables of this process (dict), see
+            merge
+    '''
+    with self.lock:
+      return { 'stages'  : { stage: dict(metrics, buckets=list(metrics['buckets']))
+                             for stage, metrics in self.stages.items() },
+               'counters': dict(self.counters),
+               'tables'  : tables.REGISTRY.versions() }
+
+  def merge(self, state):
+    '''
+    add the metrics of another registry (e.g., of a worker process)
+
+    @param state: raw metrics (dict, see state)
+    '''
+    with self.lock:
+      for stage, other in state['stages'].items():
+        metrics = self.stages.get(stage)
+        if metrics is None: metrics = self.stages[stage] = _stage_metrics()
+        for key in ['calls', 'flows', 'errors', 'seconds']: metrics[key] += other[key]
+        metrics['buckets']     = [ x + y for x, y in zip(metrics['buckets'], other['buckets']) ]
+        metrics['memory_peak'] = max(metrics['memory_peak'], other['memory_peak'])
+      for name, value in state['counters'].items():
+        self.counters[name] = self.counters.get(name, 0) + value
+      self.tables.update(state.get('tables', {}))
+
+  def table_versions(self):
+    '''
+    @return versions of the lookup tables in use, the last versions reported by the worker processes replace the
+            versions of this process (dict, see tables.TableRegistry.versions)
+    '''
+    with self.lock:
+      return dict(tables.REGISTRY.versions(), **self.tables)
+
+  def snapshot(self):
+    '''
+    @return metrics with flows per second of each stage (flows / time spent in the stage), overall (flows written
+            per elapsed time) and the versions of the lookup tables in use (dict)
+    '''
+    state   = self.state()
+    elapsed = time.time() - self.started
+    for metrics in state['stages'].values():
+      metrics['flows_per_s'] = metrics['flows'] / metrics['seconds'] if metrics['seconds'] > 0 else 0.0
+    written = state['stages'].get('write', {}).get('flows', 0)
+    return dict(state, time=time.time(), elapsed=elapsed, flows_per_s=written / elapsed if elapsed > 0 else 0.0,
+                tables=self.table_versions())
+
+
+def _stage_metrics():
+  '''
+  @return empty metrics of a stage (dict)
+  '''
+  return { 'calls': 0, 'flows': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(BUCKETS), 'memory_peak': 0 }
+
+
+# metrics of this process
+REGISTRY = Metrics()
+
+# cProfile statistics and sampling counters of the profiled stages (of the process with the id _pid)
+_profilers = {}
+_calls     = collections.Counter()
+_pid       = os.getpid()
+
+
+@contextlib.contextmanager
+def stage(name, flows=0):
+  '''
+  measure a stage call (context manager), sampled calls of PROFILE_STAGES are profiled
+
+  @param name : name of the stage (str, see STAGES)
+  @param flows: flows processed by the call (int)
+  @return call (dict), the flows can be set within the context (call['flows'])
+  '''
+  profiler = None
+  memory   = None
+  if name in PROFILE_STAGES:
+    _calls[name] += 1
+    if (_calls[name] - 1) % max(1, PROFILE_SAMPLE) == 0:
+      profiler = _profilers.get(name)
+      if profiler is None: profiler = _profilers[name] = cProfile.Profile()
+      try:
+        profiler.enable()
+      except ValueError: # another profiler is active (e.g., a concurrent stage)
+        profiler = None
+      if profiler is not None and PROFILE_MEMORY:
+        if not tracemalloc.is_tracing(): tracemalloc.start()
+        tracemalloc.reset_peak()
+        memory = tracemalloc.get_traced_memory()[0]
+
+  call  = { 'flows': flows }
+  start = time.perf_counter()
+  error = False
+  try:
+    yield call
+  except BaseException:
+    error = True
+    raise
+  finally:
+    seconds = time.perf_counter() - start
+    if profiler is not None:
+      profiler.disable()
+      if memory is not None: memory = max(0, tracemalloc.get_traced_memory()[1] - memory)
+    REGISTRY.record(name, seconds, call['flows'], error, memory)
+
+
+def timed_pages(pages, size=len):
+  '''
+  measure the fetch stage of a page source
+
+  @param pages: pages (iterable)
+  @param size : function that returns the number of flows of a page (func)
+  @return generator of the pages
+  '''
+  pages = iter(pages)
+  while True:
+    with stage('fetch') as call:
+      try:
+        page = next(pages)
+      except StopIteration:
+        return
+      call['flows'] = size(page)
+    yield page
+
+
+def count(name, value=1):
+  '''
+  increase a counter of this process
+
+  @param name : name of the counter (str)
+  @param value: increment (int)
+  '''
+  REGISTRY.count(name, value)
+
+
+def measured_call(func, argument):
+  '''
+  call a function in a worker process and return the metrics it recorded, so they can be merged into the registry of
+  the main process (REGISTRY.merge)
+
+  @param func    : function (module level func)
+  @param argument: argument of the function
+  @return result of the function and the recorded metrics (tuple, see Metrics.state)
+  '''
+  global _pid
+  if _pid != os.getpid(): # first call in a forked worker, discard the profiles inherited from the main process
+    _profilers.clear()
+    _calls.clear()
+    _pid = os.getpid()
+    # store the profiles of the worker once when it exits (pool closed)
+    multiprocessing.util.Finalize(None, save_profiles, exitpriority=10)
+  REGISTRY.reset()
+  result = func(argument)
+  return result, REGISTRY.state()
+
+
+def save_profiles():
+  ''' store the cProfile statistics of the profiled stages of this process '''
+  if not _profilers: return
+  os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+  for name, profiler in list(_profilers.items()):
+    profiler.dump_stats(os.path.join(PROFILE_DIRECTORY, '{}_{}.prof'.format(name, os.getpid())))
+
+
+# region ----------------------------------------------------------------- output
+def to_json(snapshot):
+  '''
+  @param snapshot: metrics (dict, see Metrics.snapshot)
+  @return one JSON line (str)
+  '''
+  return json.dumps(snapshot, sort_keys=True)
+
+
+def to_prometheus(snapshot):
+  '''
+  @param snapshot: metrics (dict, see Metrics.snapshot)
+  @return metrics in the Prometheus text format (str)
+  '''
+  lines  = []
+  stages = snapshot['stages']
+
+  def _metric(name, _type, values):
+    '''
+    @param name  : metric name without prefix (str)
+    @param _type : counter, gauge or histogram (str)
+    @param values: label set (str) and value of each sample (list of (str, number))
+    '''
+    if not values: return
+    lines.append('# TYPE {}_{} {}'.format(PROMETHEUS_PREFIX, name, _type))
+    for labels, value in values:
+      lines.append('{}_{}{} {}'.format(PROMETHEUS_PREFIX, name, labels, repr(float(value)) if isinstance(value, float)
+                                                                               else value))
+
+  def _label(stage):
+    return '{{stage="{}"}}'.format(stage)
+
+  histogram = []
+  for name, metrics in stages.items():
+    cumulative = 0
+    for bound, count in zip(BUCKETS, metrics['buckets']):
+      cumulative += count
+      histogram.append(('_bucket{{stage="{}",le="{}"}}'.format(name, '+Inf' if bound == float('inf') else bound),
+                        cumulative))
+    histogram.append(('_sum' + _label(name), metrics['seconds']))
+    histogram.append(('_count' + _label(name), metrics['calls']))
+  if histogram:
+    lines.append('# TYPE {}_stage_seconds histogram'.format(PROMETHEUS_PREFIX))
+    lines.extend('{}_stage_seconds{} {}'.format(PROMETHEUS_PREFIX, labels, value) for labels, value in histogram)
+
+  _metric('stage_flows_total'      , 'counter', [ (_label(name), x['flows'])       for name, x in stages.items() ])
+  _metric('stage_errors_total'     , 'counter', [ (_label(name), x['errors'])      for name, x in stages.items() ])
+  _metric('stage_flows_per_second' , 'gauge'  , [ (_label(name), x['flows_per_s']) for name, x in stages.items() ])
+  _metric('stage_memory_peak_bytes', 'gauge'  , [ (_label(name), x['memory_peak']) for name, x in stages.items()
+                                                  if x['memory_peak'] ])
+  _metric('counter_total'          , 'counter', [ ('{{name="{}"}}'.format(name), value)
+                                                  for name, value in snapshot['counters'].items() ])
+  _metric('flows_per_second'       , 'gauge'  , [ ('', snapshot['flows_per_s']) ])
+  _metric('table_version'          , 'gauge'  , [ ('{{table="{}"}}'.format(name), x['version'])
+                                                  for name, x in snapshot.get('tables', {}).items() ])
+  _metric('table_build_seconds'    , 'gauge'  , [ ('{{table="{}"}}'.format(name), x['build_seconds'])
+                                                  for name, x in snapshot.get('tables', {}).items() ])
+  return '\n'.join(lines) + '\n'
+
+
+def summary(snapshot=None):
+  '''
+  @param snapshot: (optional) metrics (dict, see Metrics.snapshot), default the current metrics
+  @return time share (%), seconds and flows per second of each stage (dict)
+  '''
+  snapshot = snapshot if snapshot is not None else REGISTRY.snapshot()
+  total    = sum(metrics['seconds'] for metrics in snapshot['stages'].values()) or 1.0
+  return { name: { 'share': round(100 * metrics['seconds'] / total, 1), 'seconds': round(metrics['seconds'], 3),
+                   'flows_per_s': round(metrics['flows_per_s']) }
+           for name, metrics in snapshot['stages'].items() }
+
+
+class Reporter(object):
+  '''
+  emit the metrics periodically to a file and serve them on a local port
+  '''
+
+  def __init__(self, filename=None, port=None, _format=None, interval=None, host=None):
+    '''
+    @param filename: (optional) file for the metrics (str), default METRICS_FILE
+    @param port    : (optional) port of the http server (int), default METRICS_PORT
+    @param host    : (optional) interface of the http server (str), default METRICS_HOST
+    @param _format : (optional) format of the file, json or prometheus (str), default METRICS_FORMAT
+    @param interval: (optional) output interval (float, s), default METRICS_INTERVAL
+    '''
+    self.filename = METRICS_FILE     if filename is None else filename
+    self.port     = METRICS_PORT     if port     is None else port
+    self.host     = METRICS_HOST     if host     is None else host
+    self.format   = METRICS_FORMAT   if _format  is None else _format
+    self.interval = METRICS_INTERVAL if interval is None else interval
+    self.stopped  = threading.Event()
+    self.server   = None
+    self.thread   = None
+    if self.format not in ('json', 'prometheus'): raise ValueError('unknown metrics format {}'.format(self.format))
+
+  def start(self):
+    '''
+    start the output thread and the http server
+
+    @return self (Reporter)
+    '''
+    if self.port is not None:
+      import http.server
+      self.server = http.server.ThreadingHTTPServer((self.host, self.port), _metrics_handler(http.server))
+      threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True).start()
+    if self.filename is not None:
+      self.thread = threading.Thread(target=self._run, name='metrics', daemon=True)
+      self.thread.start()
+    return self
+
+  def _run(self):
+    while not self.stopped.wait(self.interval):
+      self.write()
+
+  def write(self):
+    ''' write the current metrics to the file '''
+    snapshot = REGISTRY.snapshot()
+    if self.format == 'json':
+      with open(self.filename, 'a') as file:
+        file.write(to_json(snapshot) + '\n')
+    else: # replace the file atomically (e.g., for the textfile collector of the node exporter)
+      with open(self.filename + '.tmp', 'w') as file:
+        file.write(to_prometheus(snapshot))
+      os.replace(self.filename + '.tmp', self.filename)
+
+  def stop(self):
+    ''' write the final metrics, stop the output thread and the http server '''
+    self.stopped.set()
+    if self.thread is not None:
+      self.thread.join()
+      self.write()
+    if self.server is not None:
+      self.server.shutdown()
+      self.server.server_close()
+
+
+def _metrics_handler(server):
+  '''
+  @param server: http.server module (imported when the server is started)
+  @return request handler: /metrics in the Prometheus text format, /metrics.json as JSON (class)
+  '''
+  class _MetricsHandler(server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+      snapshot = REGISTRY.snapshot()
+      if   self.path == '/metrics'     : body, content_type = to_prometheus(snapshot), 'text/plain; version=0.0.4'
+      elif self.path == '/metrics.json': body, content_type = to_json(snapshot), 'application/json'
+      else:
+        self.send_error(404)
+        return
+      body = body.encode()
+      self.send_response(200)
+      self.send_header('Content-Type', content_type)
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, *args):
+      pass
+
+  return _MetricsHandler
+
+
+def start_reporter():
+  '''
+  start the metrics output if METRICS_FILE or METRICS_PORT is set
+
+  @return reporter (Reporter) or None
+  '''
+  if METRICS_FILE is None and METRICS_PORT is None:
+    return None
+  return Reporter().start()
+# endregion
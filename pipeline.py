@@ -0,0 +1,208 @@
+'''
+bounded-queue pipeline for pagewise processing: fetcher threads (one per slice) prefetch pages, the calling thread
+computes (enrich, anonymize) and a writer thread stores the results, the stages overlap (network, CPU, compression)
+
+the compute stage can be distributed to a pool of forked worker processes, the workers inherit all data that is loaded
+before the pipeline is started (lookup tables, geo readers, permutation tables) copy-on-write instead of receiving
+it with each page
+'''
+import collections
+import multiprocessing
+import queue
+import threading
+import metrics
+
+# end of the page stream
+END = object()
+
+# timeout for blocking queue operations (s), to react on failures of the other stages
+POLL_INTERVAL = 0.1
+
+
+def run_pipeline(pages, compute, write, queue_depth=2, workers=1):
+  '''
+  run fetch (iterate pages), compute and write for each page, the bounded queues between the stages provide
+  backpressure (at most queue_depth pages are buffered before and after the compute stage), pages are written in
+  input order
+
+  @param pages      : pages to be processed (iterable, e.g., generator of elasticsearch scroll pages)
+  @param compute    : compute function that is applied to each page (module level func if workers > 1)
+  @param write      : write function that is applied to each computed page (func)
+  @param queue_depth: maximum number of buffered pages per queue, 0 runs fetch and write in the calling thread (int)
+  @param workers    : number of worker processes for the compute stage, 1 computes in the calling thread (int)
+  @return number of processed pages (int)
+  '''
+  return run_sliced_pipeline([pages], compute, lambda result, _: write(result), queue_depth, workers)
+
+
+def run_sliced_pipeline(slices, compute, write, queue_depth=2, workers=1):
+  '''
+  run the pipeline for multiple page sources (e.g., elasticsearch scroll slices), each slice is fetched by its own
+  fetcher thread, compute and write are shared, the pages of each slice are written in order (the order between
+  slices depends on the fetch progress)
+
+  @param slices     : pages of each slice (list of iterables)
+  @param compute    : compute function that is applied to each page (module level func if workers > 1)
+  @param write      : write function that is applied to each computed page and the index of its slice (func)
+  @param queue_depth: maximum number of buffered pages per queue, 0 runs fetch (slice by slice) and write in the
+                      calling thread (int)
+  @param workers    : number of worker processes for the compute stage, 1 computes in the calling thread (int)
+  @return number of processed pages (int)
+  '''
+  # fork the workers before any pipeline thread is started
+  pool = multiprocessing.get_context('fork').Pool(workers) if workers > 1 else None
+  try:
+    if queue_depth == 0:
+      count  = 0
+      tagged = ( (i, page) for i, pages in enumerate(slices) for page in pages )
+      for i, result in _compute_pages(tagged, compute, pool, workers):
+        write(result, i)
+        count += 1
+      return count
+    return _run_threads(slices, compute, write, queue_depth, pool, workers)
+  except BaseException:
+    if pool is not None: pool.terminate()
+    raise
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+
+
+def _compute_pages(pages, compute, pool, workers):
+  '''
+  apply the compute function to each page in the calling thread or in the worker processes (at most two pages per
+  worker are in progress, results are returned in input order), the metrics recorded by the workers are merged into
+  the metrics of the calling process
+
+  @param pages  : pages tagged with the index of their slice (iterable of (int, page))
+  @param compute: compute function (func)
+  @param pool   : worker processes (multiprocessing.Pool or None)
+  @param workers: number of worker processes (int)
+  @return generator of computed pages tagged with the index of their slice
+  '''
+  if pool is None:
+    for i, page in pages:
+      yield i, compute(page)
+    return
+
+  pending = collections.deque()
+  for i, page in pages:
+    pending.append((i, pool.apply_async(metrics.measured_call, (compute, page))))
+    if len(pending) >= 2 * workers:
+      i, result = pending.popleft()
+      yield i, _merged(result.get())
+  while pending:
+    i, result = pending.popleft()
+    yield i, _merged(result.get())
+
+
+def _merged(result):
+  '''
+  @param result: computed page and the metrics recorded by the worker (tuple, see metrics.measured_call)
+  @return computed page
+  '''
+  result, state = result
+  metrics.REGISTRY.merge(state)
+  return result
+
+
+def _run_threads(slices, compute, write, queue_depth, pool, workers):
+  '''
+  run a fetcher thread per slice and the writer thread, compute in the calling thread (see run_sliced_pipeline)
+
+  @return number of processed pages (int)
+  '''
+  fetched = queue.Queue(maxsize=queue_depth)
+  results = queue.Queue(maxsize=queue_depth)
+  stop    = threading.Event()
+  errors  = []
+
+  def _put(_queue, item):
+    '''
+    put an item into a queue, wait while the queue is full (backpressure) unless the pipeline is stopped
+
+    @param _queue: queue (queue.Queue)
+    @param item  : item
+    @return whether the item was added (bool)
+    '''
+    while not stop.is_set():
+      try:
+        _queue.put(item, timeout=POLL_INTERVAL)
+        return True
+      except queue.Full:
+        pass
+    return False
+
+  def _get(_queue):
+    '''
+    get an item from a queue, wait while the queue is empty unless the pipeline is stopped
+
+    @param _queue: queue (queue.Queue)
+    @return item (END if the pipeline is stopped)
+    '''
+    while not stop.is_set():
+      try:
+        return _queue.get(timeout=POLL_INTERVAL)
+      except queue.Empty:
+        pass
+    return END
+
+  def _fetch(i, pages):
+    '''
+    fetcher thread: iterate the pages of a slice
+
+    @param i    : index of the slice (int)
+    @param pages: pages of the slice (iterable)
+    '''
+    try:
+      for page in pages:
+        if not _put(fetched, (i, page)): return
+      _put(fetched, END)
+    except BaseException as error:
+      errors.append(error)
+      stop.set()
+
+  def _write():
+    ''' writer thread: write the computed pages '''
+    try:
+      while True:
+        result = _get(results)
+        if result is END: return
+        write(result[1], result[0])
+    except BaseException as error:
+      errors.append(error)
+      stop.set()
+
+  writer   = threading.Thread(target=_write, name='write', daemon=True)
+  fetchers = [ threading.Thread(target=_fetch, args=(i, pages), name='fetch-{}'.format(i), daemon=True)
+               for i, pages in enumerate(slices) ]
+  for thread in [writer] + fetchers: thread.start()
+
+  def _fetched_pages():
+    ''' pages from the fetcher threads (until all slices are finished) '''
+    finished = 0
+    while finished < len(slices):
+      page = _get(fetched)
+      if page is END:
+        if stop.is_set(): return
+        finished += 1
+        continue
+      yield page
+
+  count = 0
+  try:
+    for result in _compute_pages(_fetched_pages(), compute, pool, workers):
+      if not _put(results, result): break
+      count += 1
+    _put(results, END)
+  except BaseException as error:
+    errors.append(error)
+    stop.set()
+
+  writer.join()
+  stop.set()
+  for thread in fetchers: thread.join()
+
+  if errors: raise errors[0]
+  return count
@@ -1,219 +1,716 @@
-''' 
-organize/manage lookup trees for private and public prefixes as well as vlan information 
 '''
+organize/manage lookup tables for private and public prefixes as well as vlan information
 
+each lookup table splits the ipv4 address space into sorted, non-overlapping intervals. every interval is
+owned by the longest (most specific) prefix that covers it (or the default prefix 0.0.0.0/0) and is stored in flat
+numpy arrays (start address, network address, prefix length, vlan index), a lookup is a binary search over the
+interval start addresses
+
+ipv6 lookup tables have the same layout with 128-bit start and network addresses (two uint64 per address: upper and
+lower half, see utils.searchsorted_uint64x2), ipv4-mapped addresses of ipv6 columns are looked up in the ipv4 tables
+'''
+
+import bisect
+import functools
 import numpy as np
-from ipaddress import IPv4Network
+from collections import namedtuple
+from ipaddress import IPv4Network, IPv6Network, ip_network
 import geo
+import tables
 import utils
 import os
+import re
+
+# lookup table: sorted interval start addresses (uint32) and the owning network address (uint32), prefix length (uint8)
+# and vlan (uint16, index into vlan_labels) of each interval, vlan_labels[0] is the default vlan (0)
+PrefixTable = namedtuple('PrefixTable', ['starts', 'networks', 'prefix_lens', 'vlans', 'vlan_labels'])
+
+# columns after the prefix (first column) of each line of the GeoLite2 ASN blocks csv file
+OTHER_COLUMNS = re.compile(r',[^\n]*')
+
+# delta updates of the public prefix index are applied if at most this share of the prefixes changed (otherwise the
+# lookup table is rebuilt)
+PREFIX_DELTA_MAX = 0.5
 
 # temporary loaded csv data for public prefixes
 public_prefixes  = None
 # temporary loaded csv data for private prefixes
 private_prefixes = None
 
-# lookup tree for public prefixes 
-prefix_lookup_public  = [None, None]
-# lookup tree for private prefixes
-prefix_lookup_private = [None, None]
+# lookup table for public prefixes
+prefix_lookup_public  = None
+# version of the public prefix index that is used (see update_prefix_index)
+public_index_version  = None
+# lookup table for private prefixes
+prefix_lookup_private = None
+# lookup tables for public and private ipv6 prefixes
+prefix_lookup_public6  = None
+prefix_lookup_private6 = None
 
 
 def load_prefix_data():
-  '''  build and load the lookup trees for private and public prefixes  '''  
-  global private_prefixes, public_prefixes, prefix_lookup_public
-
-  # region ---------------------------------------------------------------------------- build public prefixes lookup tree
-  if geo.NEW_PREFIXES is False and os.path.isfile(utils.PICKLE_FILE_PREFIXES):
-    # load existing pickled lookup tree for public prefixes
-    prefix_lookup_public = utils.load_pickle_file(utils.PICKLE_FILE_PREFIXES)
-  else: # build (updated) lookup tree for public prefixes
-    if os.path.isfile(utils.PICKLE_FILE_PREFIXES):
-      os.remove(utils.PICKLE_FILE_PREFIXES)
-
-    def _select(data):
-      '''
-      select prefix information from a loaded csv line (e.g., 8.8.4.0/24,15169,"Google LLC")
-      
-      @param data: csv line (str)
-      @return ip prefix (str)
-      ''' 
-      return data.split(',', 1)[0]
-    
-    # load public prefix information from csv file
-    public_prefixes = utils.load_csv_file(geo.GEO_DATA['public_prefixes']['db_file'], _select=_select, skip_header=True)
-    # build lookup tree
-    __build_prefix_lookup_public()
-  #endregion
-
-  # region ---------------------------------------------------------------------------- build public prefixes lookup tree    
+  '''  build and load the lookup tables for private and public prefixes (versions of the table registry)  '''
+  tables.REGISTRY.load('public_prefixes')
+  tables.REGISTRY.load('public_prefixes6')
+  tables.REGISTRY.load('private_prefixes')
+
+
+def load_public_prefixes():
+  '''
+  update the public prefix index if the csv file changed (delta update, see update_prefix_index, one process at a time)
+  and memory map it
+
+  @return lookup table for public prefixes and version of the index (PrefixTable, int)
+  '''
+  global public_prefixes
+  index_file = geo.GEO_DATA['public_prefixes_lookup_file']
+  csv_file   = geo.GEO_DATA['public_prefixes']['db_file']
+  with utils.file_lock(index_file + '.lock'):
+    source = utils.file_stamp(csv_file)
+    if geo.NEW_PREFIXES is not False or not os.path.isfile(index_file) or load_prefix_index(index_file, source) is None:
+      # update (delta) or build the lookup table for public prefixes from the public prefix information of the csv
+      # file (network addresses and prefix lengths)
+      public_prefixes = read_prefix_file(csv_file)
+      update_prefix_index(index_file, public_prefixes, source)
+      geo.NEW_PREFIXES = False
+    # memory map the lookup table for public prefixes
+    columns, meta = utils.load_index_file(index_file)
+  __clear_prefix_lists()
+  return __prefix_table(columns, meta), meta.get('version')
+
+
+def load_public_prefixes6():
+  '''
+  build the public ipv6 prefix index if the ipv6 csv file changed (one process at a time) and memory map it, without
+  ipv6 csv file all ipv6 addresses belong to the default prefix (::/0)
+
+  @return lookup table for public ipv6 prefixes (PrefixTable)
+  '''
+  index_file = geo.GEO_DATA['public_prefixes_lookup_file6']
+  csv_file   = geo.GEO_DATA['public_prefixes']['db_file6']
+  with utils.file_lock(index_file + '.lock'):
+    source = utils.file_stamp(csv_file)
+    lookup = load_prefix_index(index_file, source) if os.path.isfile(index_file) else None
+    if lookup is None:
+      prefixes = read_prefix_file6(csv_file) if source is not None else parse_prefixes6([])
+      save_prefix_index(build_prefix_table6(*prefixes), index_file, source)
+      lookup   = load_prefix_index(index_file)
+  return lookup
+
+
+def load_private_prefixes():
+  '''
+  build the lookup tables for private ipv4 and ipv6 prefixes (and VLANs)
+
+  @return lookup tables for private ipv4 and ipv6 prefixes (PrefixTable, PrefixTable)
+  '''
+  global private_prefixes
+
   def _filter_host_addresses(data):
     '''
-    check if the prefix is a host prefix (prefix length /32)
-    
+    check if the prefix is a host prefix (prefix length /32, ipv6: /128)
+
     @param data: ip prefix (str)
     @return result of the check (bool)
-    ''' 
-    return data.strip().split('/')[1] == '32'
+    '''
+    return data.strip().split('/')[1] == ('128' if ':' in data else '32')
 
   # load private prefix information from csv file
   private_prefixes = utils.load_csv_file(geo.GEO_DATA['private_prefixes_file'], _filter=_filter_host_addresses)
-  
+
   def _filter_not_available(data):
     '''
     check if VLAN information is not available (N/A)
-    
+
     @param data: VLAN information (str)
     @return result of the check (bool)
-    '''     
+    '''
     return data.strip().split(',')[1] == 'N/A'
-  
+
   # load vlan information from csv file and build mapping between a private prefix and a VLAN
   vlans = utils.load_csv_file(geo.GEO_DATA['private_prefixes_vlans'], _filter=_filter_not_available, skip_header=True)
-  vlans = { prefix: vlan for (prefix, vlan) in [ line.split(',', 1) for line in vlans ] }
-  
-  # build lookup tree
-  __build_prefix_lookup_private(vlans)
-  #endregion
+  vlans = { prefix if ':' not in prefix else str(ip_network(prefix.strip(), strict=False)): vlan
+            for (prefix, vlan) in [ line.split(',', 1) for line in vlans ] }
+
+  # build lookup tables
+  lookup = __build_prefix_lookup_private(vlans)
 
   # clear temporary loaded csv prefix data
   __clear_prefix_lists()
+  return lookup
 
 
-@utils.measure_time_memory
-def __build_prefix_lookup_public():
-  ''' create a lookup tree for public prefixes and pickle the result '''
-  __build_prefix_lookup(public_prefixes, prefix_lookup_public)
-  __replace_unknown_prefixes(prefix_lookup_public)
-  utils.pickle_prefixes(prefix_lookup_public)
+def __install_public_prefixes(table):
+  '''
+  @param table: lookup table for public prefixes and version of the index (PrefixTable, int, see load_public_prefixes)
+  '''
+  global prefix_lookup_public, public_index_version
+  prefix_lookup_public, public_index_version = table
 
 
-@utils.measure_time_memory                      
+def __install_public_prefixes6(table):
+  '''
+  @param table: lookup table for public ipv6 prefixes (PrefixTable)
+  '''
+  global prefix_lookup_public6
+  prefix_lookup_public6 = table
+
+
+def __install_private_prefixes(table):
+  '''
+  @param table: lookup tables for private ipv4 and ipv6 prefixes (PrefixTable, PrefixTable)
+  '''
+  global prefix_lookup_private, prefix_lookup_private6
+  prefix_lookup_private, prefix_lookup_private6 = table
+
+
+def ensure_loaded():
+  ''' build and load the lookup tables on first use (the public prefixes are downloaded if missing) '''
+  if prefix_lookup_public is None or prefix_lookup_private is None or prefix_lookup_public6 is None:
+    geo.ensure_databases()
+    load_prefix_data()
+
+
+@utils.measure_time_memory
 def __build_prefix_lookup_private(vlans):
   '''
-  create a lookup tree for private ip prefixes and do not pickle the result
-  
-  @param vlans: mapping between a private prefix and a VLAN (dict)  
-  '''  
-  __build_prefix_lookup(private_prefixes, prefix_lookup_private, vlans)
-  __replace_unknown_prefixes(prefix_lookup_private)
-
-                      
-def __build_prefix_lookup(prefixes, lookup, vlans=None):
-  '''
-  recursively construct a prefix lookup tree and add an ip prefix
-  
-  @param prefixes: ip prefixes (list) 
-  @param lookup  : reference to the prefix lookup tree (prefix_lookup_private, prefix_lookup_public)
-  @param vlans   : mapping between a private prefix and a VLAN (dict)  
-  '''    
-  total = len(prefixes)
-  
-  for i, prefix in enumerate(prefixes):
-    utils.printProgressBar(i + 1, total, prefix='build prefix lookup:', suffix='Complete', length=50)
-    ip, prefix_length = prefix.split('/', 1)
-
-    def __add_prefix(parent, bit_mask, prefix_length, prefix):
-      '''
-      @param parent       : current parent tree node (list or tuple) 
-      @param bit_mask     : bit mask of the ip prefix (str)
-      @param prefix_length: ip prefix length (str)  
-      @param prefix       : ip prefix (str)
-      '''        
-      bit = int(bit_mask[0])
-      new_network = IPv4Network(prefix)
-      
-      if type(parent[bit]) is tuple: 
-        if parent[bit][0].prefixlen < new_network.prefixlen:
-          # more specific ip network 
-          parent[bit] = [None, None]
-          
-      if prefix_length == 1: # leaf node (ip network)
-        if vlans is not None: parent[bit] = (new_network, vlans.get(new_network.with_prefixlen, 0))
-        else                : parent[bit] = (new_network, 0)
-        return
-      
-      if parent[bit] is None:
-        parent[bit] = [None, None]
-      
-      __add_prefix(parent[bit], bit_mask[1:], prefix_length - 1, prefix)
-  
-    __add_prefix(lookup, ''.join([ np.binary_repr(int(x), width=8) for x in ip.split('.') ]), int(prefix_length), prefix)
+  create the lookup tables for private ipv4 and ipv6 prefixes (not stored as index files)
+
+  @param vlans: mapping between a private prefix and a VLAN (dict)
+  @return lookup tables for private ipv4 and ipv6 prefixes (PrefixTable, PrefixTable)
+  '''
+  return (__build_prefix_lookup([ x for x in private_prefixes if ':' not in x ], vlans),
+          __build_prefix_lookup([ x for x in private_prefixes if ':' in x ], vlans, ipv6=True))
+
+
+def __build_prefix_lookup(prefixes, vlans=None, ipv6=False):
+  '''
+  construct a prefix lookup table from ip prefixes (see build_prefix_table, build_prefix_table6)
+
+  @param prefixes: ip prefixes (list of str)
+  @param vlans   : mapping between a private prefix and a VLAN (dict)
+  @param ipv6    : ipv6 prefixes (bool)
+  @return lookup table (PrefixTable)
+  '''
+  networks, prefix_lens = parse_prefixes6(prefixes) if ipv6 else parse_prefixes(prefixes)
+  build                 = build_prefix_table6 if ipv6 else build_prefix_table
+  if vlans is None: return build(networks, prefix_lens)
+
+  # vlan of each prefix (by its normalized notation), vlan_labels[0] is the default vlan
+  addresses   = utils.uint64x2_to_ips(networks) if ipv6 else utils.uint32_to_ips(networks)
+  keys        = [ '{}/{}'.format(x, y) for x, y in zip(addresses, prefix_lens.tolist()) ]
+  vlan_labels = [0]
+  vlan_codes  = {0: 0}
+  for vlan in ( vlans.get(key, 0) for key in keys ):
+    if vlan not in vlan_codes:
+      vlan_codes[vlan] = len(vlan_labels)
+      vlan_labels.append(vlan)
+  codes = np.array([ vlan_codes[vlans.get(key, 0)] for key in keys ], dtype=np.uint16)
+  return build(networks, prefix_lens, codes, vlan_labels)
+
+
+def read_prefix_file(filename):
+  '''
+  read the prefixes of a GeoLite2 ASN blocks csv file (first column, e.g., 8.8.4.0/24,15169,"Google LLC") in one pass
+
+  @param filename: csv file (str)
+  @return network addresses (np.ndarray of uint32) and prefix lengths (np.ndarray of uint8)
+  '''
+  with open(filename, encoding='utf8') as csv_file:
+    text = csv_file.read()
+  # header and comments do not start with a digit
+  return parse_prefixes([ x for x in OTHER_COLUMNS.sub('', text).split() if x[0].isdigit() ])
+
+
+def read_prefix_file6(filename):
+  '''
+  read the prefixes of a GeoLite2 ASN ipv6 blocks csv file (first column, e.g., 2001:4860::/32,15169,"Google LLC")
+
+  @param filename: csv file (str)
+  @return network addresses (np.ndarray of uint64, shape (n, 2)) and prefix lengths (np.ndarray of uint8)
+  '''
+  with open(filename, encoding='utf8') as csv_file:
+    text = csv_file.read()
+  # header and comments contain no ':'
+  return parse_prefixes6([ x for x in OTHER_COLUMNS.sub('', text).split() if ':' in x and x[0] != '#' ])
+
+
+def parse_prefixes6(prefixes):
+  '''
+  parse ipv6 prefixes (e.g., 2001:db8::/32), host bits must not be set
+
+  @param prefixes: ipv6 prefixes (list of str)
+  @return network addresses (np.ndarray of uint64, shape (n, 2)) and prefix lengths (np.ndarray of uint8)
+  @raise ValueError: invalid prefix (like IPv6Network)
+  '''
+  if not prefixes: return np.zeros((0, 2), dtype=np.uint64), np.zeros(0, dtype=np.uint8)
+  parts    = [ x.strip().split('/') for x in prefixes ]
+  try:
+    lengths  = np.array([ int(x[1]) if len(x) == 2 else 128 for x in parts ], dtype=np.int64)
+    networks = utils.ips_to_uint64x2([ x[0] for x in parts ])
+  except ValueError:
+    raise ValueError('invalid prefixes: {}'.format(__invalid_prefix(prefixes, IPv6Network)))
+  host_hi, host_lo = __host_masks6(np.minimum(lengths, 128))
+  invalid  = ((lengths < 0) | (lengths > 128) | np.array([ ':' not in x[0] for x in parts ]) |
+              ((networks[:, 0] & host_hi) != 0) | ((networks[:, 1] & host_lo) != 0))
+  if invalid.any():
+    raise ValueError('invalid prefix: {}'.format(prefixes[int(np.flatnonzero(invalid)[0])]))
+  return networks, lengths.astype(np.uint8)
+
+
+def __host_masks6(prefix_lens):
+  '''
+  @param prefix_lens: ipv6 prefix lengths (np.ndarray)
+  @return host bits of the upper and lower half of each prefix (np.ndarray of uint64, np.ndarray of uint64)
+  '''
+  def _mask(bits):
+    bits = np.clip(bits, 0, 64)
+    return np.where(bits == 64, np.uint64(2 ** 64 - 1),
+                    (np.uint64(1) << np.minimum(bits, 63).astype(np.uint64)) - np.uint64(1))
+  prefix_lens = np.asarray(prefix_lens, dtype=np.int64)
+  return _mask(64 - prefix_lens), _mask(128 - prefix_lens)
+
+
+def parse_prefixes(prefixes):
+  '''
+  convert ip prefixes to integer arrays (vectorized), addresses without prefix length are /32 prefixes
+
+  @param prefixes: ip prefixes (list of str, e.g., 10.0.0.0/8)
+  @return network addresses (np.ndarray of uint32) and prefix lengths (np.ndarray of uint8)
+  @raise ValueError: invalid prefix (e.g., host bits set, like IPv4Network)
+  '''
+  if not prefixes: return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint8)
+  text = '.'.join(prefixes)
+  if text.count('/') != len(prefixes): text = '.'.join( x if '/' in x else x + '/32' for x in prefixes )
+  fields = np.fromstring(text.replace('/', '.'), dtype=np.int64, sep='.')
+  if len(fields) != 5 * len(prefixes) or fields.min() < 0:
+    raise ValueError('invalid prefixes: {}'.format(__invalid_prefix(prefixes)))
+  fields   = fields.reshape(-1, 5)
+  octets   = fields[:, :4]
+  lengths  = fields[:, 4]
+  invalid  = (octets > 255).any(axis=1) | (lengths > 32)
+  networks = (octets << np.array([24, 16, 8, 0])).sum(axis=1)
+  masks    = (2 ** 32 - 1) ^ ((1 << (32 - np.minimum(lengths, 32))) - 1)
+  invalid |= (networks & ~masks) != 0
+  if invalid.any():
+    raise ValueError('invalid prefix: {}'.format(prefixes[int(np.flatnonzero(invalid)[0])]))
+  return networks.astype(np.uint32), lengths.astype(np.uint8)
+
+
+def __invalid_prefix(prefixes, network=IPv4Network):
+  '''
+  @param prefixes: ip prefixes (list of str)
+  @param network : network type (IPv4Network, IPv6Network)
+  @return first prefix that is no valid prefix of the network type (str) or None
+  '''
+  for prefix in prefixes:
+    try:
+      network(prefix.strip())
+    except ValueError:
+      return prefix
+  return None
+
+
+def build_prefix_table(networks, prefix_lens, vlans=None, vlan_labels=(0,), progress=True):
+  '''
+  construct a prefix lookup table, address ranges that are not covered by any prefix are assigned to the default
+  prefix (0.0.0.0/0), nested prefixes are resolved by longest prefix match (of duplicate prefixes the last one is used)
+
+  the address space is split at the first and after the last address of each prefix, the prefixes are applied length
+  by length in ascending order (vectorized range search per length, prefixes of one length do not overlap), so each
+  range is owned by its most specific prefix, adjacent ranges with the same owner are merged
+
+  @param networks   : network addresses (np.ndarray of uint32)
+  @param prefix_lens: prefix lengths (np.ndarray of uint8)
+  @param vlans      : (optional) vlan of each prefix (np.ndarray of uint16, index into vlan_labels)
+  @param vlan_labels: vlans (list/tuple), vlan_labels[0] is the default vlan
+  @param progress   : show a progress bar (bool)
+  @return lookup table (PrefixTable)
+  '''
+  networks    = np.asarray(networks, dtype=np.int64)
+  prefix_lens = np.asarray(prefix_lens, dtype=np.int64)
+  vlans       = np.zeros(len(networks), dtype=np.uint16) if vlans is None else np.asarray(vlans, dtype=np.uint16)
+
+  # remove duplicate prefixes (the last one is kept)
+  keys       = (networks << 6) | prefix_lens
+  _, last    = np.unique(keys[::-1], return_index=True)
+  keep       = np.sort(len(keys) - 1 - last)
+  networks, prefix_lens, vlans = networks[keep], prefix_lens[keep], vlans[keep]
+  ends       = networks + (np.int64(1) << (32 - prefix_lens)) - 1
+
+  boundaries = np.unique(np.concatenate([ [0], networks, ends + 1 ]))
+  boundaries = boundaries[boundaries < 2 ** 32]
+  owners     = np.zeros(len(boundaries), dtype=np.int64) # index + 1 of the owning prefix, 0: default prefix
+
+  lengths = np.unique(prefix_lens)
+  for i, length in enumerate(lengths.tolist()):
+    if progress: utils.printProgressBar(i + 1, len(lengths), prefix='build prefix lookup:', suffix='Complete', length=50)
+    selected = np.flatnonzero(prefix_lens == length)
+    selected = selected[np.argsort(networks[selected], kind='stable')]
+    row      = np.searchsorted(networks[selected], boundaries, side='right') - 1
+    covered  = (row >= 0) & (boundaries <= ends[selected[np.maximum(row, 0)]])
+    owners[covered] = selected[row[covered]] + 1
+
+  changed     = np.ones(len(boundaries), dtype=bool)
+  changed[1:] = owners[1:] != owners[:-1]
+  boundaries, owners = boundaries[changed], owners[changed]
+
+  index = np.maximum(owners - 1, 0)
+  own   = owners > 0
+  return PrefixTable(starts      = boundaries.astype(np.uint32),
+                     networks    = np.where(own, networks[index] if len(networks) else 0, 0).astype(np.uint32),
+                     prefix_lens = np.where(own, prefix_lens[index] if len(networks) else 0, 0).astype(np.uint8),
+                     vlans       = np.where(own, vlans[index] if len(networks) else 0, 0).astype(np.uint16),
+                     vlan_labels = tuple(vlan_labels))
+
+
+def build_prefix_table6(networks, prefix_lens, vlans=None, vlan_labels=(0,), progress=True):
+  '''
+  construct an ipv6 prefix lookup table like build_prefix_table (longest prefix match, default prefix ::/0), the
+  addresses are 128-bit integers (two uint64 per address)
+
+  @param networks   : network addresses (np.ndarray of uint64, shape (n, 2))
+  @param prefix_lens: prefix lengths (np.ndarray of uint8)
+  @param vlans      : (optional) vlan of each prefix (np.ndarray of uint16, index into vlan_labels)
+  @param vlan_labels: vlans (list/tuple), vlan_labels[0] is the default vlan
+  @param progress   : show a progress bar (bool)
+  @return lookup table (PrefixTable)
+  '''
+  networks    = np.asarray(networks, dtype=np.uint64).reshape(-1, 2)
+  prefix_lens = np.asarray(prefix_lens, dtype=np.int64)
+  vlans       = np.zeros(len(networks), dtype=np.uint16) if vlans is None else np.asarray(vlans, dtype=np.uint16)
+
+  # remove duplicate prefixes (the last one is kept)
+  keys     = np.column_stack([ networks, prefix_lens.astype(np.uint64) ]).astype('>u8')
+  _, last  = np.unique(np.ascontiguousarray(keys[::-1]).view('V24').ravel(), return_index=True)
+  keep     = np.sort(len(keys) - 1 - last)
+  networks, prefix_lens, vlans = networks[keep], prefix_lens[keep], vlans[keep]
+  host_hi, host_lo = __host_masks6(prefix_lens)
+  ends     = np.column_stack([ networks[:, 0] | host_hi, networks[:, 1] | host_lo ])
+
+  # address after each prefix (carry into the upper half, the end of the address space has no successor)
+  carry    = ends[:, 1] == np.uint64(2 ** 64 - 1)
+  after    = np.column_stack([ ends[:, 0] + carry.astype(np.uint64), ends[:, 1] + np.uint64(1) ])
+  after    = after[~(carry & (ends[:, 0] == np.uint64(2 ** 64 - 1)))]
+
+  # sorted distinct boundaries (big-endian bytes compare like the 128-bit integers)
+  boundaries = np.concatenate([ np.zeros((1, 2), dtype=np.uint64), networks, after ]).astype('>u8')
+  boundaries = np.unique(np.ascontiguousarray(boundaries).view('V16').ravel()).view('>u8').reshape(-1, 2)
+  boundaries = boundaries.astype(np.uint64)
+  owners     = np.zeros(len(boundaries), dtype=np.int64) # index + 1 of the owning prefix, 0: default prefix
+
+  lengths = np.unique(prefix_lens)
+  for i, length in enumerate(lengths.tolist()):
+    if progress: utils.printProgressBar(i + 1, len(lengths), prefix='build prefix lookup:', suffix='Complete', length=50)
+    selected = np.flatnonzero(prefix_lens == length)
+    selected = selected[np.lexsort((networks[selected, 1], networks[selected, 0]))]
+    row      = utils.searchsorted_uint64x2(networks[selected], boundaries)
+    end      = ends[selected[np.maximum(row, 0)]]
+    covered  = (row >= 0) & ((boundaries[:, 0] < end[:, 0]) |
+                             ((boundaries[:, 0] == end[:, 0]) & (boundaries[:, 1] <= end[:, 1])))
+    owners[covered] = selected[row[covered]] + 1
+
+  changed     = np.ones(len(boundaries), dtype=bool)
+  changed[1:] = owners[1:] != owners[:-1]
+  boundaries, owners = boundaries[changed], owners[changed]
+
+  if not len(networks): # only the default prefix
+    return PrefixTable(starts      = boundaries,
+                       networks    = np.zeros((len(boundaries), 2), dtype=np.uint64),
+                       prefix_lens = np.zeros(len(boundaries), dtype=np.uint8),
+                       vlans       = np.zeros(len(boundaries), dtype=np.uint16),
+                       vlan_labels = tuple(vlan_labels))
+
+  index = np.maximum(owners - 1, 0)
+  own   = owners > 0
+  return PrefixTable(starts      = boundaries,
+                     networks    = np.where(own[:, None], networks[index], 0).astype(np.uint64),
+                     prefix_lens = np.where(own, prefix_lens[index], 0).astype(np.uint8),
+                     vlans       = np.where(own, vlans[index], 0).astype(np.uint16),
+                     vlan_labels = tuple(vlan_labels))
+
+
+def save_prefix_index(lookup, filename, source=None, prefixes=None, version=1):
+  '''
+  store a lookup table as binary index file
+
+  @param lookup  : lookup table (PrefixTable)
+  @param filename: filename of/path to the index file (str)
+  @param source  : stamp of the csv file the lookup table was built from (list, see utils.file_stamp)
+  @param prefixes: (optional) prefix set of the lookup table for delta updates (network addresses, prefix lengths)
+  @param version : version of the lookup table (int)
+  '''
+  columns = { name: getattr(lookup, name) for name in ['starts', 'networks', 'prefix_lens', 'vlans'] }
+  if prefixes is not None:
+    columns['prefix_networks'] = np.asarray(prefixes[0], dtype=np.uint32)
+    columns['prefix_lengths']  = np.asarray(prefixes[1], dtype=np.uint8)
+  utils.save_index_file(filename, columns, { 'type': 'prefix_table', 'source': source, 'version': version,
+                                             'vlan_labels': list(lookup.vlan_labels) })
+
+
+def load_prefix_index(filename, source=None):
+  '''
+  memory map a lookup table from a binary index file
+
+  @param filename: filename of/path to the index file (str)
+  @param source  : expected stamp of the csv file (list, see utils.file_stamp), None skips the check
+  @return lookup table (PrefixTable) or None if the index file is invalid or outdated
+  '''
+  columns, meta = utils.load_index_file(filename)
+  if meta is None or meta.get('type') != 'prefix_table'  : return None
+  if source is not None and meta.get('source') != source: return None
+  return __prefix_table(columns, meta)
+
+
+def __prefix_table(columns, meta):
+  '''
+  @param columns: columns of a prefix index file (dict of np.ndarray)
+  @param meta   : meta information of the index file (dict)
+  @return lookup table (PrefixTable)
+  '''
+  return PrefixTable(starts=columns['starts'], networks=columns['networks'], prefix_lens=columns['prefix_lens'],
+                     vlans=columns['vlans'], vlan_labels=tuple(meta['vlan_labels']))
+
+
+@utils.measure_time_memory
+def update_prefix_index(filename, prefixes, source=None):
+  '''
+  update the prefix index to a new prefix set: only the address ranges of inserted and deleted prefixes are rebuilt
+  (see apply_prefix_delta), without a previous prefix set (or with too many changes) the lookup table is rebuilt, the
+  version of the index is increased (processes that use the index switch to it, see load_public_prefixes)
+
+  @param filename: filename of/path to the index file (str)
+  @param prefixes: new prefix set (network addresses (np.ndarray of uint32), prefix lengths (np.ndarray of uint8))
+  @param source  : stamp of the csv file of the prefixes (list, see utils.file_stamp)
+  @return version of the updated index (int)
+  '''
+  columns, meta = utils.load_index_file(filename) if os.path.isfile(filename) else (None, None)
+  version       = meta.get('version', 0) + 1 if meta is not None else 1
+
+  lookup = None
+  if meta is not None and meta.get('type') == 'prefix_table' and 'prefix_networks' in columns:
+    lookup, inserted, deleted = apply_prefix_delta(__prefix_table(columns, meta),
+                                                   (columns['prefix_networks'], columns['prefix_lengths']), prefixes)
+    print(' (+{} -{} prefixes)'.format(inserted, deleted), end=' ', flush=True)
+  if lookup is None: lookup = build_prefix_table(*prefixes)
+  save_prefix_index(lookup, filename, source, prefixes, version)
+  return version
+
+
+def apply_prefix_delta(lookup, old_prefixes, new_prefixes, max_share=None):
+  '''
+  apply the insertions and deletions between two prefix sets to a lookup table (without vlans): the address ranges of
+  the changed prefixes are rebuilt from the new prefixes that overlap them (covering and nested prefixes), the lookup
+  table outside of these ranges is kept
+
+  @param lookup      : lookup table of the old prefix set (PrefixTable)
+  @param old_prefixes: old prefix set (network addresses (np.ndarray of uint32), prefix lengths (np.ndarray of uint8))
+  @param new_prefixes: new prefix set (network addresses (np.ndarray of uint32), prefix lengths (np.ndarray of uint8))
+  @param max_share   : (optional) maximum share of changed prefixes (float), default PREFIX_DELTA_MAX
+  @return updated lookup table (PrefixTable) or None if too many prefixes changed, number of inserted and of deleted
+          prefixes (int, int)
+  '''
+  max_share  = PREFIX_DELTA_MAX if max_share is None else max_share
+  old_keys   = np.unique(__prefix_keys(*old_prefixes))
+  new_keys   = np.unique(__prefix_keys(*new_prefixes))
+  inserted   = np.setdiff1d(new_keys, old_keys, assume_unique=True)
+  deleted    = np.setdiff1d(old_keys, new_keys, assume_unique=True)
+  changed    = np.concatenate([inserted, deleted])
+  counts     = len(inserted), len(deleted)
+  if len(changed) > max_share * max(len(new_keys), 1): return (None, *counts)
+  if len(changed) == 0: return (lookup, *counts)
+
+  # merged address ranges of the changed prefixes
+  starts, ends = __prefix_ranges(changed)
+  order        = np.argsort(starts, kind='stable')
+  starts, ends = starts[order], np.maximum.accumulate(ends[order])
+  first        = np.ones(len(starts), dtype=bool)
+  first[1:]    = starts[1:] > ends[:-1] + 1
+  groups       = np.cumsum(first) - 1
+  range_starts = starts[first]
+  range_ends   = np.zeros(len(range_starts), dtype=np.int64)
+  np.maximum.at(range_ends, groups, ends)
+
+  # lookup table of the new prefixes that overlap a changed range (the owners within the changed ranges)
+  networks, prefix_lens = (np.asarray(x, dtype=np.int64) for x in new_prefixes)
+  prefix_ends = networks + (np.int64(1) << (32 - prefix_lens)) - 1
+  row         = np.searchsorted(range_starts, prefix_ends, side='right') - 1
+  overlapping = (row >= 0) & (range_ends[np.maximum(row, 0)] >= networks)
+  partial     = build_prefix_table(networks[overlapping], prefix_lens[overlapping], progress=False)
+
+  # interval starts: old starts outside of the changed ranges, partial starts inside, and the range boundaries
+  old_starts = np.asarray(lookup.starts, dtype=np.int64)
+  boundaries = np.unique(np.concatenate([ old_starts, np.asarray(partial.starts, dtype=np.int64), range_starts,
+                                          range_ends + 1 ]))
+  boundaries = boundaries[boundaries < 2 ** 32]
+  row        = np.searchsorted(range_starts, boundaries, side='right') - 1
+  inside     = (row >= 0) & (range_ends[np.maximum(row, 0)] >= boundaries)
+  old_rows   = np.searchsorted(old_starts, boundaries, side='right') - 1
+  new_rows   = np.searchsorted(np.asarray(partial.starts, dtype=np.int64), boundaries, side='right') - 1
+  columns    = {}
+  for name in ['networks', 'prefix_lens', 'vlans']:
+    columns[name] = np.where(inside, getattr(partial, name)[new_rows], getattr(lookup, name)[old_rows])
+
+  # merge adjacent intervals with the same owner
+  same = np.zeros(len(boundaries), dtype=bool)
+  same[1:] = ((columns['networks'][1:] == columns['networks'][:-1]) &
+              (columns['prefix_lens'][1:] == columns['prefix_lens'][:-1]) &
+              (columns['vlans'][1:] == columns['vlans'][:-1]))
+  lookup = PrefixTable(starts      = boundaries[~same].astype(np.uint32),
+                       networks    = columns['networks'][~same].astype(np.uint32),
+                       prefix_lens = columns['prefix_lens'][~same].astype(np.uint8),
+                       vlans       = columns['vlans'][~same].astype(np.uint16),
+                       vlan_labels = lookup.vlan_labels)
+  return (lookup, *counts)
+
+
+def __prefix_keys(networks, prefix_lens):
+  '''
+  @param networks   : network addresses (np.ndarray of uint32)
+  @param prefix_lens: prefix lengths (np.ndarray of uint8)
+  @return unique key of each prefix (np.ndarray of int64)
+  '''
+  return (np.asarray(networks, dtype=np.int64) << 6) | np.asarray(prefix_lens, dtype=np.int64)
+
+
+def __prefix_ranges(keys):
+  '''
+  @param keys: prefix keys (np.ndarray of int64, see __prefix_keys)
+  @return first and last address of each prefix (np.ndarray of int64, np.ndarray of int64)
+  '''
+  networks, prefix_lens = keys >> 6, keys & 63
+  return networks, networks + (np.int64(1) << (32 - prefix_lens)) - 1
 
 
 def get_prefix_for_ip_public(ip):
   '''
   determine the ip prefix for a public ip address
-  
+
   @param ip: public ip address (str)
-  @return public ip prefix and VLAN (str,0)
+  @return public ip prefix and VLAN (IPv4Network/IPv6Network,0)
   '''
+  if prefix_lookup_public is None: ensure_loaded()
+  if ':' in ip: return __get_prefix_for_ip6(ip, prefix_lookup_public6)
   return __get_prefix_for_ip(ip, prefix_lookup_public)
 
-                      
+
 def get_prefix_for_ip_private(ip):
   '''
-  determine the ip prefix and VLAN information for a private ip address 
-  
+  determine the ip prefix and VLAN information for a private ip address
+
   @param ip: private ip address (str)
-  @return private ip prefix and VLAN (str,int)
+  @return private ip prefix and VLAN (IPv4Network/IPv6Network,str)
   '''
+  if prefix_lookup_private is None: ensure_loaded()
+  if ':' in ip: return __get_prefix_for_ip6(ip, prefix_lookup_private6)
   return __get_prefix_for_ip(ip, prefix_lookup_private)
 
 
+def get_prefixes_for_ips(ips, private=False):
+  '''
+  determine the ip prefixes and VLAN information for many ip addresses at once (vectorized range search), ipv6
+  columns: ipv4-mapped addresses are looked up in the ipv4 table (ipv4-mapped networks, ipv4 prefix lengths)
+
+  @param ips    : ip addresses (np.ndarray of uint32 or np.ndarray of uint64 with shape (n, 2))
+  @param private: use the lookup table for private (True) or public (False) prefixes (bool)
+  @return network addresses (np.ndarray of uint32 or uint64 with shape (n, 2) like ips), prefix lengths (np.ndarray
+          of uint8) and VLANs (np.ndarray of str/int)
+  '''
+  if (prefix_lookup_private if private else prefix_lookup_public) is None: ensure_loaded()
+  ips = np.asarray(ips)
+  if ips.ndim == 1: return __get_prefixes(prefix_lookup_private if private else prefix_lookup_public, ips)
+
+  ipv4        = utils.ipv4_mapped(ips)
+  networks    = np.zeros((len(ips), 2), dtype=np.uint64)
+  prefix_lens = np.zeros(len(ips), dtype=np.uint8)
+  vlans       = np.empty(len(ips), dtype=object)
+  if ipv4.any():
+    network, prefix_lens[ipv4], vlans[ipv4] = __get_prefixes(prefix_lookup_private if private else prefix_lookup_public,
+                                                             ips[ipv4, 1] & np.uint64(2 ** 32 - 1))
+    networks[ipv4] = utils.uint32_to_uint64x2(network)
+  if not ipv4.all():
+    networks[~ipv4], prefix_lens[~ipv4], vlans[~ipv4] = __get_prefixes(
+      prefix_lookup_private6 if private else prefix_lookup_public6, ips[~ipv4])
+  return networks, prefix_lens, vlans
+
+
+def __get_prefixes(lookup, ips):
+  '''
+  @param lookup: prefix lookup table (PrefixTable, ipv4 or ipv6)
+  @param ips   : ip addresses (np.ndarray of uint32 for ipv4, np.ndarray of uint64 with shape (n, 2) for ipv6)
+  @return network addresses, prefix lengths and VLANs (np.ndarray, np.ndarray of uint8, np.ndarray of str/int)
+  '''
+  if lookup.starts.ndim == 2: i = utils.searchsorted_uint64x2(lookup.starts, ips)
+  else                      : i = np.searchsorted(lookup.starts, np.asarray(ips, dtype=np.uint32), side='right') - 1
+  labels = np.empty(len(lookup.vlan_labels), dtype=object)
+  labels[:] = lookup.vlan_labels
+  return lookup.networks[i], lookup.prefix_lens[i], labels[lookup.vlans[i]]
+
+
 def __get_prefix_for_ip(ip, lookup):
   '''
-  recursively get the ip prefix and VLAN information for an ip address from a prefix lookup tree
-  
+  get the ip prefix and VLAN information for an ip address from a prefix lookup table
+
   @param ip    : ip address (str)
-  @param lookup: reference to the prefix lookup tree (prefix_lookup_private, prefix_lookup_public)
-  @return ip prefix and VLAN (str,int)  
+  @param lookup: reference to the prefix lookup table (prefix_lookup_private, prefix_lookup_public)
+  @return ip prefix and VLAN (IPv4Network,str/int)
   '''
-  bit_mask = ''.join([ np.binary_repr(int(x), width=8) for x in ip.split('.') ])
+  octets = ip.split('.')
+  ip     = (int(octets[0]) << 24) | (int(octets[1]) << 16) | (int(octets[2]) << 8) | int(octets[3])
+  # bisect on a memoryview avoids the per call overhead of numpy for scalar lookups
+  i      = bisect.bisect_right(memoryview(lookup.starts), ip) - 1
+  return __network(int(lookup.networks[i]), int(lookup.prefix_lens[i])), lookup.vlan_labels[lookup.vlans[i]]
+
+
+def __get_prefix_for_ip6(ip, lookup):
+  '''
+  get the ip prefix and VLAN information for an ipv6 address from an ipv6 prefix lookup table
+
+  @param ip    : ipv6 address (str)
+  @param lookup: reference to the ipv6 prefix lookup table (prefix_lookup_private6, prefix_lookup_public6)
+  @return ip prefix and VLAN (IPv6Network,str/int)
+  '''
+  i      = int(utils.searchsorted_uint64x2(lookup.starts, utils.ips_to_uint64x2([ip]))[0])
+  hi, lo = lookup.networks[i].tolist()
+  return IPv6Network(((hi << 64) | lo, int(lookup.prefix_lens[i]))), lookup.vlan_labels[lookup.vlans[i]]
+
+
+@functools.lru_cache(maxsize=2 ** 16)
+def __network(network, prefix_len):
+  '''
+  create (and cache) the ip network object for a network address and prefix length
+
+  @param network   : network address (int)
+  @param prefix_len: prefix length (int)
+  @return ip network (IPv4Network)
+  '''
+  return IPv4Network((network, prefix_len))
+
 
-  def __get_prefix(parent, bit_mask):
-    '''
-    @param parent  : current parent tree node (list or tuple)
-    @param bit_mask: bit mask of the ip address (str)
-    @return ip prefix and VLAN (str,int)  
-    '''    
-    bit = int(bit_mask[0])
-    if not isinstance(parent[bit], list):
-      return parent[bit]
-    return __get_prefix(parent[bit], bit_mask[1:])
-
-  return __get_prefix(lookup, bit_mask)
-
-  
 def __clear_prefix_lists():
   ''' clear temporary loaded csv prefix data '''
   global private_prefixes, public_prefixes
-  del private_prefixes
-  del public_prefixes
+  private_prefixes = None
+  public_prefixes  = None
 
 
-def __replace_unknown_prefixes(lookup):
-  '''
-  recursively replace leaf nodes with None values in the lookup tree by a default prefix
-  
-  @param lookup: reference to the prefix lookup tree (prefix_lookup_private, prefix_lookup_public)
-  '''
-  default_prefix = (IPv4Network('0.0.0.0/0'), 0)
- 
-  def __replace_none_values(lookup):
-    '''
-    @param lookup: reference to the prefix lookup tree (current position in the tree)
-    '''
-    if not isinstance(lookup[0], list):
-      if lookup[0] is None:
-        lookup[0] = default_prefix
-    else:
-      __replace_none_values(lookup[0])
-
-    if not isinstance(lookup[1], list):
-      if lookup[1] is None:
-        lookup[1] = default_prefix
-    else:
-      __replace_none_values(lookup[1])
-      
-  __replace_none_values(lookup)
\ No newline at end of file
+tables.REGISTRY.register('public_prefixes', lambda: [ geo.GEO_DATA['public_prefixes']['db_file'] ],
+                         load_public_prefixes, __install_public_prefixes, version=lambda table: table[1] or 0)
+tables.REGISTRY.register('public_prefixes6', lambda: [ geo.GEO_DATA['public_prefixes']['db_file6'] ],
+                         load_public_prefixes6, __install_public_prefixes6)
+tables.REGISTRY.register('private_prefixes', lambda: [ geo.GEO_DATA['private_prefixes_file'],
+                                                       geo.GEO_DATA['private_prefixes_vlans'] ],
+                         load_private_prefixes, __install_private_prefixes)
+
+
+if __name__ == '__main__':
+  # update the public prefix index after a database update (running processes switch to the new version)
+  import argparse
+  parser = argparse.ArgumentParser(description='update the public prefix index (delta update of the lookup table)')
+  parser.add_argument('--remote-check', choices=['sync', 'off'], default=geo.GEO_REMOTE_CHECK,
+                      help='check the published databases for updates (off: only the local csv file)')
+  args = parser.parse_args()
+
+  geo.update_databases(args.remote_check)
+  load_prefix_data()
+  print('public prefix index version: {}'.format(public_index_version))
@@ -0,0 +1,337 @@
+'''
+flow sources: the processing (update_flows, convert_flows) is driven by pages of flows from a source
+
+ElasticsearchSource: (sliced) scroll over an elasticsearch index
+FileSource         : exported flows as NDJSON (one document or hit per line) or CSV (header with the field names), the
+                     file is memory mapped and parsed in chunks, slices are byte ranges of the file
+SyntheticSource    : reproducible random flows (profiling and benchmarks without a cluster)
+
+the flows of a page are documents (dict of elasticsearch field: value, as _source of a hit) or a FlowBatch
+'''
+import abc
+import csv
+import json
+import mmap
+import os
+import numpy as np
+import utils
+from flows import FlowBatch, FLOW_COLUMN_TYPES, MISSING, column_name
+
+# size of the chunks of a file source, each chunk is one page (bytes)
+FILE_CHUNK_SIZE = 2 ** 22
+
+# fields of the hits of an elasticsearch source: hits (complete hits, pages of documents), source (_source of the hits
+# only, filter_path), docvalues (doc values of the fields instead of _source, filter_path, all fields need doc values,
+# e.g., keyword, numeric, ip and date fields), source and docvalues pages are decoded into columns (FlowBatch)
+PROJECTIONS = ['hits', 'source', 'docvalues']
+
+# parts of the responses that are kept with the filter_path of a projection
+FILTER_PATHS = {
+  'source'   : ['_scroll_id', 'hits.total', 'hits.hits._source'],
+  'docvalues': ['_scroll_id', 'hits.total', 'hits.hits.fields'],
+  }
+
+
+class FlowSource(abc.ABC):
+  '''
+  abstract base of the flow sources: pages (required) yields the pages of flows, count (number of flows for the
+  progress) and slices (independently readable parts) are optional
+  '''
+
+  def count(self):
+    '''
+    @return number of flows (int) or None if unknown
+    '''
+    return None
+
+  def slices(self, number=1):
+    '''
+    split the source into independently readable parts (e.g., read by parallel fetcher threads)
+
+    @param number: requested number of slices (int), sources without slices return a single slice
+    @return pages of each slice (list of iterables)
+    '''
+    return [ self.pages() ]
+
+  @abc.abstractmethod
+  def pages(self):
+    '''
+    @return generator of pages (list of dict or FlowBatch)
+    '''
+
+
+class ElasticsearchSource(FlowSource):
+  '''
+  flows of an elasticsearch index (scroll, sliced scroll for multiple slices)
+  '''
+
+  def __init__(self, elastic, index, doc_type, body, fields, page_size, scroll_timeout, projection='hits'):
+    '''
+    @param elastic       : elasticsearch client (Elasticsearch)
+    @param index         : index pattern (str)
+    @param doc_type      : document type (str)
+    @param body          : query (dict)
+    @param fields        : fields of the flows (list of str)
+    @param page_size     : flows per page (int)
+    @param scroll_timeout: lifetime of the scroll context (str, e.g., 1h)
+    @param projection    : fields of the hits that are transferred (str, see PROJECTIONS)
+    '''
+    if projection not in PROJECTIONS: raise ValueError('unknown projection {}'.format(projection))
+    self.elastic        = elastic
+    self.index          = index
+    self.doc_type       = doc_type
+    self.body           = body
+    self.fields         = fields
+    self.page_size      = page_size
+    self.scroll_timeout = scroll_timeout
+    self.projection     = projection
+
+  def count(self):
+    return self.elastic.count(index=self.index, doc_type=self.doc_type, body=self.body)['count']
+
+  def slices(self, number=1):
+    return [ self.pages(slice_id, number) for slice_id in range(number) ]
+
+  def pages(self, slice_id=0, slices=1):
+    '''
+    load flows pagewise (scroll), optionally restricted to one slice of a sliced scroll
+
+    @param slice_id: index of the slice (int)
+    @param slices  : number of slices, 1 for an unsliced scroll (int)
+    @return generator of pages (list of dict for the projection hits, FlowBatch otherwise)
+    '''
+    body = self.body
+    if slices > 1: body = dict(body, slice={'id': slice_id, 'max': slices})
+    body, params = search_request(body, self.fields, self.projection)
+
+    page = self.elastic.search(index=self.index,
+                               doc_type=self.doc_type,
+                               scroll=self.scroll_timeout,
+                               size=self.page_size,
+                               body=body,
+                               **params)
+
+    scroll_id   = page['_scroll_id']
+    scroll_size = page['hits']['total']
+
+    print('scroll_size_total', scroll_size)
+
+    params.pop('_source', None)
+    while (scroll_size > 0):
+      yield decode_hits(page['hits'].get('hits', []), self.fields, self.projection)
+      page        = self.elastic.scroll(scroll_id=scroll_id, scroll=self.scroll_timeout, **params)
+      scroll_id   = page['_scroll_id']
+      scroll_size = len(page['hits'].get('hits', [])) # filter_path drops empty hits
+
+
+def search_request(body, fields, projection='hits', sort=False):
+  '''
+  query and parameters of a search for the fields of a projection
+
+  @param body      : query (dict)
+  @param fields    : fields of the flows (list of str)
+  @param projection: fields of the hits that are transferred (str, see PROJECTIONS)
+  @param sort      : keep the sort values of the hits (search_after) (bool)
+  @return query (dict) and parameters of the search (dict: _source, filter_path)
+  '''
+  params = {}
+  if projection == 'docvalues': body = dict(body, _source=False, docvalue_fields=fields)
+  else                        : params['_source'] = fields
+  if projection in FILTER_PATHS:
+    params['filter_path'] = FILTER_PATHS[projection] + (['hits.hits.sort'] if sort else [])
+  return body, params
+
+
+def decode_hits(hits, fields, projection='hits'):
+  '''
+  flows of the hits of an elasticsearch page
+
+  @param hits      : hits of a page (list of dict)
+  @param fields    : fields of the flows (list of str)
+  @param projection: fields of the hits (str, see PROJECTIONS)
+  @return flows (list of dict for the projection hits, FlowBatch otherwise)
+  '''
+  if projection == 'hits': return [ x['_source'] for x in hits ]
+  return FlowBatch.from_hits(hits, fields, docvalues=projection == 'docvalues')
+
+
+class FileSource(FlowSource):
+  '''
+  flows of an exported file, NDJSON (.json, .ndjson) or CSV (.csv), optionally restricted to some fields
+  '''
+
+  def __init__(self, filename, fields=None, chunk_size=None):
+    '''
+    @param filename  : filename of/path to the file (str)
+    @param fields    : (optional) fields of the flows, other fields are dropped (list of str)
+    @param chunk_size: (optional) size of a page in bytes (int), default FILE_CHUNK_SIZE
+    '''
+    self.filename   = filename
+    self.fields     = fields
+    self.chunk_size = chunk_size if chunk_size is not None else FILE_CHUNK_SIZE
+    self.format     = 'csv' if filename.endswith('.csv') else 'ndjson'
+
+  def slices(self, number=1):
+    '''
+    split the file into byte ranges (aligned to lines) that are parsed independently
+
+    @param number: number of slices (int)
+    @return pages of each slice (list of generators)
+    '''
+    size = os.path.getsize(self.filename)
+    if size == 0: return [ iter(()) ]
+
+    with open(self.filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+      header     = self.__header(buffer)
+      start      = buffer.find(b'\n') + 1 if header is not None else 0
+      boundaries = [ start ]
+      for i in range(1, number):
+        boundary = max(start + (size - start) * i // number, boundaries[-1])
+        boundary = buffer.find(b'\n', boundary)
+        boundaries.append(boundary + 1 if boundary != -1 else size)
+      boundaries.append(size)
+    return [ self.pages(begin, end) for begin, end in zip(boundaries[:-1], boundaries[1:]) if begin < end ]
+
+  def pages(self, start=None, end=None):
+    '''
+    parse a byte range of the file chunk by chunk
+
+    @param start: first byte (int), default first line of flows
+    @param end  : end of the range (int), default end of the file
+    @return generator of pages (list of dict or FlowBatch)
+    '''
+    if os.path.getsize(self.filename) == 0: return
+
+    with open(self.filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+      header   = self.__header(buffer)
+      position = start if start is not None else buffer.find(b'\n') + 1 if header is not None else 0
+      end      = end   if end   is not None else len(buffer)
+      while position < end:
+        stop = position + self.chunk_size
+        if stop < end: # complete the last line of the chunk
+          stop = buffer.find(b'\n', stop, end)
+          stop = stop + 1 if stop != -1 else end
+        else:
+          stop = end
+        lines    = buffer[position:stop].decode().splitlines()
+        position = stop
+        if not lines: continue
+        if header is not None: yield self.__parse_csv(header, lines)
+        else                 : yield self.__parse_ndjson(lines)
+
+  def __header(self, buffer):
+    '''
+    @param buffer: mapped file (mmap)
+    @return field names of a CSV file (list of str) or None for NDJSON
+    '''
+    if self.format != 'csv': return None
+    end = buffer.find(b'\n')
+    return next(csv.reader([ buffer[:end if end != -1 else len(buffer)].decode().strip() ]))
+
+  def __parse_ndjson(self, lines):
+    '''
+    @param lines: lines with one document or elasticsearch hit (_source) each (list of str)
+    @return flows (list of dict)
+    '''
+    documents = []
+    for line in lines:
+      if not line.strip(): continue
+      document = json.loads(line)
+      document = document.get('_source', document)
+      if self.fields is not None: document = { key: document[key] for key in self.fields if key in document }
+      documents.append(document)
+    return documents
+
+  def __parse_csv(self, header, lines):
+    '''
+    parse CSV lines column by column, empty values are missing, integer fields (see flows.FLOW_COLUMN_TYPES) are
+    converted to int
+
+    @param header: field names (list of str)
+    @param lines : CSV lines (list of str)
+    @return flows (FlowBatch)
+    '''
+    rows  = [ row for row in csv.reader(lines) if row ]
+    batch = FlowBatch(len(rows))
+    for key, values in zip(header, zip(*rows) if rows else [ () ] * len(header)):
+      if self.fields is not None and key not in self.fields: continue
+      name = column_name(key)
+      if name in FLOW_COLUMN_TYPES and '' not in values: # parse complete integer columns at once
+        column = np.array(values, dtype=np.int64) if values else np.zeros(0, dtype=np.int64)
+        limits = np.iinfo(FLOW_COLUMN_TYPES[name])
+        if not len(column) or (column.min() >= limits.min and column.max() <= limits.max):
+          batch[name] = column.astype(FLOW_COLUMN_TYPES[name])
+          continue
+      if name in FLOW_COLUMN_TYPES: values = [ int(value) if value != '' else MISSING for value in values ]
+      else                        : values = [ value if value != '' else MISSING for value in values ]
+      batch.set_column(name, values)
+    return batch
+
+
+class SyntheticSource(FlowSource):
+  '''
+  reproducible random flows (see synthetic_documents)
+  '''
+
+  def __init__(self, number_of_flows, page_size=10000, seed=0, ipv6=0.0):
+    '''
+    @param number_of_flows: number of flows (int)
+    @param page_size      : flows per page (int)
+    @param seed           : random seed (int)
+    @param ipv6           : share of ipv6 addresses (float)
+    '''
+    self.number_of_flows = number_of_flows
+    self.page_size       = page_size
+    self.seed            = seed
+    self.ipv6            = ipv6
+
+  def count(self):
+    return self.number_of_flows
+
+  def pages(self):
+    for i, start in enumerate(range(0, self.number_of_flows, self.page_size)):
+      yield synthetic_documents(min(self.page_size, self.number_of_flows - start), self.seed + i, start, self.ipv6)
+
+
+def synthetic_documents(number_of_flows, seed=0, first_sequence_number=0, ipv6=0.0):
+  '''
+  create random flows (elasticsearch documents): half of the addresses in 10.0.0.0/8, the others public, one hour of
+  start times, a share of ipv6 addresses (private: fd00::/8, public: 2000::/3)
+
+  @param number_of_flows      : number of flows (int)
+  @param seed                 : random seed (int)
+  @param first_sequence_number: flow sequence number of the first flow (int)
+  @param ipv6                 : share of ipv6 addresses (float)
+  @return flows (list of dict)
+  '''
+  random  = np.random.RandomState(seed)
+  private = random.rand(2, number_of_flows) < 0.5
+  ips     = random.randint(1 << 24, 224 << 24, (2, number_of_flows), dtype=np.uint64).astype(np.uint32)
+  ips     = np.where(private, (10 << 24) | (ips & 0xFFFFFF), ips)
+  start   = 1548925200000 + np.sort(random.randint(0, 3600000, number_of_flows))
+  columns = {
+    'netflow.first_switched': [ '{}'.format(x) for x in start.tolist() ],
+    'netflow.last_switched' : [ '{}'.format(x) for x in (start + random.randint(0, 60000, number_of_flows)).tolist() ],
+    'netflow.bytes'         : random.randint(40, 1 << 20, number_of_flows).tolist(),
+    'netflow.protocol'      : random.choice([6, 17], number_of_flows).tolist(),
+    'netflow.dst_addr'      : utils.uint32_to_ips(ips[1]),
+    'netflow.dst_port'      : random.randint(0, 1 << 16, number_of_flows).tolist(),
+    'netflow.src_addr'      : utils.uint32_to_ips(ips[0]),
+    'netflow.src_port'      : random.randint(0, 1 << 16, number_of_flows).tolist(),
+    'netflow.src_locality'  : np.where(private[0], 'private', 'public').tolist(),
+    'netflow.dst_locality'  : np.where(private[1], 'private', 'public').tolist(),
+    'netflow.tcp_flags'     : random.randint(0, 256, number_of_flows).tolist(),
+    'netflow.flow_seq_num'  : np.arange(first_sequence_number, first_sequence_number + number_of_flows).tolist(),
+    'host'                  : random.choice(['192.168.1.1', '192.168.1.2'], number_of_flows).tolist(),
+    }
+  if ipv6 > 0:
+    for i, direction in enumerate(['src', 'dst']):
+      selected  = np.flatnonzero(random.rand(number_of_flows) < ipv6)
+      upper     = random.randint(0, 2 ** 61, len(selected), dtype=np.uint64)
+      upper     = np.where(private[i, selected], np.uint64(0xfd << 56) | (upper >> np.uint64(5)),
+                           np.uint64(1 << 61) | upper)
+      lower     = random.randint(0, 2 ** 63, len(selected), dtype=np.uint64)
+      addresses = utils.uint64x2_to_ips(np.column_stack([ upper, lower ]))
+      column    = columns['netflow.{}_addr'.format(direction)]
+      for j, address in zip(selected.tolist(), addresses): column[j] = address
+  return [ dict(zip(columns, row)) for row in zip(*columns.values()) ]
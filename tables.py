@@ -0,0 +1,175 @@
+'''
+versioned registry of the lookup tables (public/private prefix lookup tables, geo database readers)
+
+each table is registered with its source files, a build function (creates a new version of the table) and an install
+function (makes a version the one in use), a background thread checks the source files each TABLE_REFRESH_INTERVAL,
+builds new versions of changed tables and the pipeline swaps them in between pages (see swap), the current page keeps
+the version it started with, so the enrichment is never paused for a build
+
+each process that processes pages (also forked worker processes) runs its own refresh thread, so every process swaps
+its own tables, the main process of a worker pool keeps its tables and reports the versions of the workers (see
+metrics.Metrics.table_versions)
+'''
+import os
+import threading
+import time
+
+import utils
+
+# region ----------------------------------------------------------------- table parameters
+TABLE_REFRESH_INTERVAL = 30 # s, interval of the source file checks of loaded tables, 0: no background refresh
+# endregion
+
+
+class TableRegistry(object):
+  '''
+  lookup tables with version, build time and stamps of the source files, thread-safe
+  '''
+
+  def __init__(self, interval=None):
+    '''
+    @param interval: (optional) interval of the background refresh (float, s), default TABLE_REFRESH_INTERVAL
+    '''
+    self.interval = interval
+    self.tables   = {}   # name: sources, build and install function
+    self.status   = {}   # name: version, build_seconds, built, stamps, error
+    self.pending  = {}   # name: new version (built, not yet installed)
+    self.lock     = threading.RLock()
+    self.stopped  = threading.Event()
+    self.thread   = None
+    self._pid     = None # process of the refresh thread (not inherited by forked processes)
+
+  def register(self, name, sources, build, install, version=None):
+    '''
+    @param name   : name of the table (str)
+    @param sources: function that returns the source files of the table (func -> list of str)
+    @param build  : function that builds a new version of the table (func -> table)
+    @param install: function that makes a version of the table the one in use (func(table))
+    @param version: (optional) function that returns the version of the data of a table (func(table) -> int, e.g., the
+                    version of an index file), default: modification time of the newest source file (s)
+    '''
+    with self.lock:
+      self.tables[name] = { 'sources': sources, 'build': build, 'install': install, 'version': version }
+
+  def load(self, name):
+    '''
+    build and install a table immediately (first load)
+
+    @param name: name of the table (str)
+    '''
+    table, status = self.__build(name)
+    with self.lock:
+      self.pending.pop(name, None)
+      self.__install(name, table, status)
+
+  def check(self):
+    '''
+    build a new version of each loaded table whose source files changed (failed builds are reported, the version in use
+    is kept until the sources change again)
+
+    @return names of the tables with a new (pending) version (list of str)
+    '''
+    built = []
+    with self.lock:
+      current = { name: (self.pending[name][1] if name in self.pending else status)['stamps']
+                  for name, status in self.status.items() }
+    for name, stamps in current.items():
+      if self.__stamps(name) == stamps: continue
+      try:
+        table = self.__build(name)
+        with self.lock: self.pending[name] = table
+        built.append(name)
+      except Exception as ex:
+        with self.lock: self.status[name].update(stamps=self.__stamps(name), error=repr(ex))
+        print('\nbuild of table {} failed: {!r}'.format(name, ex))
+    return built
+
+  def swap(self):
+    '''
+    install the pending versions (called between pages), starts the refresh thread of this process
+
+    @return names of the swapped tables (list of str)
+    '''
+    if self.thread is None or self._pid != os.getpid(): self.start()
+    if not self.pending: return []
+    with self.lock:
+      swapped = list(self.pending)
+      for name in swapped:
+        self.__install(name, *self.pending.pop(name))
+    for name in swapped:
+      print('\nswap table {} to version {} (built in {:.2f}s)'.format(name, self.status[name]['version'],
+                                                                       self.status[name]['build_seconds']))
+    return swapped
+
+  def start(self):
+    ''' start the refresh thread of this process (TABLE_REFRESH_INTERVAL > 0) '''
+    interval = TABLE_REFRESH_INTERVAL if self.interval is None else self.interval
+    if self._pid != os.getpid(): self.lock = threading.RLock() # the lock of a forked process may be held by a thread
+    with self.lock:
+      if self.thread is not None and self._pid == os.getpid(): return
+      self._pid   = os.getpid()
+      self.thread = False
+      if not interval: return
+      self.stopped.clear()
+      self.thread = threading.Thread(target=self.__refresh, args=(interval,), name='table-refresh', daemon=True)
+      self.thread.start()
+
+  def stop(self):
+    ''' stop the refresh thread (pending versions are installed by the next swap) '''
+    self.stopped.set()
+    if self.thread: self.thread.join()
+    self.thread = None
+
+  def versions(self):
+    '''
+    @return version of the data (same in all processes that use the same data, see register), build time (s), time of
+            the build and error of the last failed build of each loaded table (dict)
+    '''
+    with self.lock:
+      return { name: { key: value for key, value in status.items() if key != 'stamps' }
+               for name, status in self.status.items() }
+
+  def __refresh(self, interval):
+    '''
+    background refresh: check the source files of the loaded tables each interval
+
+    @param interval: interval of the checks (float, s)
+    '''
+    while not self.stopped.wait(interval):
+      if self._pid != os.getpid(): return
+      self.check()
+
+  def __build(self, name):
+    '''
+    @param name: name of the table (str)
+    @return new version of the table and its status (table, dict)
+    '''
+    stamps = self.__stamps(name)
+    start  = time.perf_counter()
+    table  = self.tables[name]['build']()
+    return table, { 'build_seconds': round(time.perf_counter() - start, 3), 'built': time.time(), 'stamps': stamps,
+                    'error': None }
+
+  def __install(self, name, table, status):
+    '''
+    @param name  : name of the table (str)
+    @param table : version of the table (table)
+    @param status: status of the version (dict, see __build)
+    '''
+    self.tables[name]['install'](table)
+    version = self.tables[name]['version']
+    if version is not None: version = version(table)
+    else                  : version = max([ stamp[1] // 10 ** 9 for stamp in status['stamps'] if stamp is not None ],
+                                          default=0)
+    self.status[name] = dict(status, version=version)
+
+  def __stamps(self, name):
+    '''
+    @param name: name of the table (str)
+    @return stamps of the source files of a table (list, see utils.file_stamp)
+    '''
+    return [ utils.file_stamp(filename) for filename in self.tables[name]['sources']() ]
+
+
+# lookup tables of this process (registered by prefix_lookup and geo)
+REGISTRY = TableRegistry()
@@ -0,0 +1,61 @@
+'''
+tests of the geo lookups (run from the repository: python -m pytest tests)
+'''
+import contextlib
+import io
+from ipaddress import IPv4Address
+
+import numpy as np
+import pytest
+
+import geo
+from benchmarks.mmdb import synthetic_geo_databases, synthetic_networks
+
+
+def test_invalid_address():
+  ''' invalid ip addresses have the zero-filled geo information (no database access) '''
+  for invalid in ['', 'not-an-ip', '10.0.0.256']:
+    assert geo.get_geo_information(invalid) == {'country_code': 'None', 'longitude': '0.0', 'latitude': '0.0',
+                                                'asn': '0'}
+
+
+@pytest.fixture
+def geo_databases(tmp_path, monkeypatch):
+  '''
+  synthetic MMDB files (see benchmarks.mmdb) with open readers and without geo table, the module globals are restored
+  after the test
+  '''
+  for name, filename in synthetic_geo_databases(str(tmp_path), 300, 2).items():
+    monkeypatch.setitem(geo.GEO_DATA, name, dict(geo.GEO_DATA[name], db_file=filename))
+  monkeypatch.setitem(geo.GEO_DATA, 'geo_table_file', str(tmp_path / 'geo_table.idx'))
+  for name in ['country_reader', 'city_reader', 'asn_reader', 'geo_table', 'NEW_GEO_DATA', 'AddressNotFoundError']:
+    monkeypatch.setattr(geo, name, getattr(geo, name))
+  geo.NEW_GEO_DATA = False
+  (geo.country_reader, geo.city_reader, geo.asn_reader), _, _ = geo.load_readers()
+  geo.geo_table = None
+  getattr(geo, '__lookup_geo_information').cache_clear()
+  getattr(geo, '__geo_table_information').cache_clear()
+  yield tmp_path
+  for reader in [geo.country_reader, geo.city_reader, geo.asn_reader]: reader.close()
+
+
+def test_geo_table_equals_readers(geo_databases, monkeypatch):
+  ''' lookups in the geo table return the geo information of the MaxMind readers (in, at and next to the networks) '''
+  random    = np.random.RandomState(0)
+  networks  = synthetic_networks(300, 2)
+  addresses = [ network + offset for network, length in networks
+                for offset in [0, 1, 2 ** (32 - length) - 1, 2 ** (32 - length), -1] ]
+  addresses = np.concatenate([ np.array(addresses, dtype=np.int64) % 2 ** 32,
+                               random.randint(0, 2 ** 32, 2000, dtype=np.uint64) ]).astype(np.uint32)
+  expected  = [ geo.get_geo_information(str(IPv4Address(int(ip)))) for ip in addresses ]
+
+  with contextlib.redirect_stdout(io.StringIO()):
+    geo.geo_table = geo.read_geo_table()
+  information, index = geo.get_geo_information_for_ips(addresses)
+  assert [ information[i] for i in index ] == expected
+  assert any( x['country_code'] != 'None' for x in expected ) and any( x['country_code'] == 'None' for x in expected )
+
+  # the stored table is mapped again (not rebuilt) while the MMDB files are unchanged
+  monkeypatch.setattr(geo, 'build_geo_table', None)
+  table = geo.read_geo_table()
+  for name in table: np.testing.assert_array_equal(table[name], geo.geo_table[name]) # NaN: no location
@@ -0,0 +1,31 @@
+'''
+tests of the binary index files (run from the repository: python -m pytest tests)
+'''
+import numpy as np
+
+import utils
+
+
+def test_round_trip_header_lengths(tmp_path):
+  ''' the arrays are read back for headers whose length changes the offsets (header/offset fixpoint) '''
+  filename = str(tmp_path / 'table.idx')
+  random   = np.random.RandomState(0)
+  for length in range(0, 400, 7):
+    columns = { 'column_{}'.format(i): random.randint(0, 2 ** 31, random.randint(1, 3000)).astype(np.uint32)
+                for i in range(12) }
+    columns['pairs'] = random.randint(0, 2 ** 63, (5, 2), dtype=np.uint64)
+    utils.save_index_file(filename, columns, {'padding': 'x' * length})
+    loaded, meta = utils.load_index_file(filename)
+    assert meta == {'padding': 'x' * length}
+    for name, array in columns.items(): assert np.array_equal(loaded[name], array), name
+
+
+def test_invalid_files(tmp_path):
+  ''' empty, truncated and corrupt index files are invalid (None, None), the callers rebuild them '''
+  filename = str(tmp_path / 'table.idx')
+  utils.save_index_file(filename, {'starts': np.arange(1000, dtype=np.uint32)}, {'type': 'test'})
+  with open(filename, 'rb') as file: content = file.read()
+
+  for invalid in [b'', content[:10], content[:40], content[:-100], content[:16] + b'x' + content[17:]]:
+    with open(filename, 'wb') as file: file.write(invalid)
+    assert utils.load_index_file(filename) == (None, None)
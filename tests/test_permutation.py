@@ -0,0 +1,108 @@
+'''
+tests of the anonymization (permutation) of ip addresses (run from the repository: python -m pytest tests)
+'''
+import hashlib
+
+import numpy as np
+import pytest
+
+import main
+import utils
+from flows import FlowBatch
+
+
+def baseline_permutation(permutation_seed):
+  '''
+  per-octet string permutation of the first version (tables of the SHA-512 hash of the seed, one octet at a time)
+
+  @param permutation_seed: password (permutation seed) (bytes)
+  @return permutation of an ip address (func: str -> str)
+  '''
+  sha3_512_hash = hashlib.sha512(permutation_seed).hexdigest()
+  seeds         = [ int(sha3_512_hash[0:8], 16), int(sha3_512_hash[56:64], 16), int(sha3_512_hash[64:72], 16),
+                    int(sha3_512_hash[120:128], 16) ]
+  tables        = [ np.random.RandomState(seed=seed).permutation(np.arange(256)) for seed in seeds ]
+  return lambda ip: '.'.join([ str(tables[i][int(octet)]) for i, octet in enumerate(ip.split('.')) ])
+
+
+@pytest.fixture
+def permutation_tables(monkeypatch):
+  ''' permutation tables of PERMUTATION_SEED, restored after the test '''
+  monkeypatch.setattr(main, 'PERMUTATION_TABLES' , main.create_permutation_tables(main.PERMUTATION_SEED))
+  monkeypatch.setattr(main, 'PERMUTATION_TABLES6', main.create_permutation_tables6(main.PERMUTATION_SEED))
+
+
+def random_ips(number, seed=0):
+  '''
+  @param number: number of random addresses (int)
+  @param seed  : random seed (int)
+  @return random ipv4 addresses and the bounds of the octets (list of str)
+  '''
+  random = np.random.RandomState(seed)
+  ips    = random.randint(0, 2 ** 32, number, dtype=np.uint64).astype(np.uint32)
+  return utils.uint32_to_ips(ips) + ['0.0.0.0', '255.255.255.255', '10.0.0.255', '1.2.3.4']
+
+
+def test_baseline_equivalence(permutation_tables):
+  ''' the vectorized permutation (strings, integers and flow columns) equals the per-octet string permutation '''
+  permute  = baseline_permutation(main.PERMUTATION_SEED)
+  ips      = random_ips(20000)
+  expected = [ permute(ip) for ip in ips ]
+  assert main.permute_ips(ips) == expected
+  assert utils.uint32_to_ips(main.permute_ips(utils.ips_to_uint32(ips), as_strings=False)) == expected
+
+  flows = FlowBatch.from_dicts([ {'src_addr': ips[i], 'dst_addr': ips[-i - 1], 'src_network': ips[i // 2],
+                                  'dst_network': ips[-i // 2 - 1]} for i in range(len(ips)) ])
+  main.convert_flows(flows)
+  for i, flow in enumerate(flows.to_dicts()):
+    assert flow == {'src_addr': expected[i], 'dst_addr': expected[-i - 1], 'src_network': expected[i // 2],
+                    'dst_network': expected[-i // 2 - 1]}
+
+
+def test_seed(permutation_tables):
+  ''' another permutation seed permutes differently, each octet table is a permutation '''
+  assert all( sorted(table.tolist()) == list(range(256)) for table in main.PERMUTATION_TABLES )
+  ips   = random_ips(1000)
+  other = baseline_permutation(b'other seed')
+  assert main.permute_ips(ips) != [ other(ip) for ip in ips ]
+
+
+def test_ipv6_groups_bijection(permutation_tables):
+  '''
+  each 16-bit group of an ipv6 address is permuted by its own table (a bijection of the group values, the other groups
+  are not affected), distinct addresses stay distinct
+  '''
+  tables = main.PERMUTATION_TABLES6
+  assert len(tables) == 8 and all( np.array_equal(np.sort(table), np.arange(2 ** 16)) for table in tables )
+  assert len({ tuple(table[:16].tolist()) for table in tables }) == 8
+
+  random = np.random.RandomState(0)
+  base   = np.array([0x20010db8a1b2c3d4, 0x1122334455667788], dtype=np.uint64)
+  for group in range(8):
+    half, shift  = group // 4, np.uint64(48 - 16 * (group % 4))
+    ips          = np.tile(base, (2 ** 16, 1))
+    ips[:, half] = (ips[:, half] & ~(np.uint64(0xFFFF) << shift)) | (np.arange(2 ** 16, dtype=np.uint64) << shift)
+    permuted     = main.permute_ips(ips, as_strings=False)
+    values       = (permuted[:, half] >> shift) & np.uint64(0xFFFF)
+    assert np.array_equal(values, tables[group]) # the group values are permuted by the table of the group
+    others = permuted.copy()
+    others[:, half] &= ~(np.uint64(0xFFFF) << shift)
+    assert (others == others[0]).all() # the other groups are the same for all addresses
+
+  ips      = np.unique(random.randint(0, 2 ** 63, (20000, 2), dtype=np.uint64) | np.uint64(1 << 63), axis=0)
+  permuted = main.permute_ips(ips, as_strings=False)
+  assert len(np.unique(permuted, axis=0)) == len(ips)
+  inverse  = np.argsort(tables, axis=1).astype(np.uint64) # inverse permutation of each group
+  shifts   = np.array([48, 32, 16, 0], dtype=np.uint64)
+  restored = np.column_stack([ (inverse[np.arange(4 * half, 4 * half + 4), (permuted[:, half][:, None] >> shifts) &
+                                        np.uint64(0xFFFF)] << shifts).sum(axis=1, dtype=np.uint64) for half in [0, 1] ])
+  assert np.array_equal(restored, ips)
+
+
+def test_ipv4_mapped(permutation_tables):
+  ''' ipv4-mapped addresses (::ffff:a.b.c.d) of ipv6 columns are permuted like ipv4 addresses '''
+  ips      = random_ips(2000)
+  mixed    = [ '::ffff:' + ip if i % 2 else ip for i, ip in enumerate(ips) ] + ['2001:db8::1', 'fd00::1', '::1']
+  permuted = main.permute_ips(mixed)
+  assert permuted[:len(ips)] == main.permute_ips(ips)
+  assert all( ':' in ip for ip in permuted[len(ips):] )
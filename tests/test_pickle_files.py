@@ -0,0 +1,96 @@
+'''
+tests of the paged pickle files (one gzip member per page, side index of the page offsets, filters) (run from the
+repository: python -m pytest tests)
+'''
+import os
+
+import numpy as np
+import pytest
+
+import utils
+import writers
+
+
+def write_pages(filename, pages, append=False):
+  '''
+  @param filename: pickle file (str)
+  @param pages   : pages of flows (list of list of dict)
+  @param append  : append to an existing file (bool)
+  '''
+  with writers.open_writer(filename, append=append) as writer:
+    for page in pages: writer.write(page)
+
+
+def random_pages(number_of_pages, seed=0):
+  '''
+  @param number_of_pages: number of pages (int)
+  @param seed           : random seed (int)
+  @return pages of flows with exporter and times (list of list of dict), some times are missing, one page is empty
+  '''
+  random = np.random.RandomState(seed)
+  pages  = []
+  for page in range(number_of_pages):
+    flows = []
+    for _ in range(0 if page == 2 else random.randint(1, 200)):
+      first = int(random.randint(0, 10000))
+      flow  = {'host': 'exporter{}'.format(random.randint(3)), 'first_switched': first,
+               'last_switched': first + int(random.randint(0, 500)), 'in_bytes': int(random.randint(2 ** 20))}
+      if random.rand() < 0.05: del flow[random.choice(['first_switched', 'last_switched'])]
+      flows.append(flow)
+    pages.append(flows)
+  return pages
+
+
+@pytest.fixture
+def pickle_file(tmp_path):
+  ''' pickle file of 9 pages (with side index) and its pages '''
+  filename = str(tmp_path / 'flows.pkl.gz')
+  pages    = random_pages(9)
+  write_pages(filename, pages)
+  return filename, pages
+
+
+def test_start_page(pickle_file):
+  ''' pages from start_page on equal the pages of a full scan, with the side index of the writer and without it '''
+  filename, pages = pickle_file
+  assert list(utils.iter_flow_pages(filename)) == pages
+  assert os.path.isfile(filename + '.idx')
+  for start_page in range(len(pages) + 2):
+    assert list(utils.iter_flow_pages(filename, start_page=start_page)) == pages[start_page:]
+
+  for start_page in range(len(pages) + 2):
+    # the index is rebuilt by a scan of the file (not needed from the first page on)
+    if os.path.isfile(filename + '.idx'): os.remove(filename + '.idx')
+    assert list(utils.iter_flow_pages(filename, start_page=start_page)) == pages[start_page:]
+    assert (utils.load_member_index(filename, build=False) is not None) == (start_page > 0)
+
+
+def test_start_page_appended(pickle_file):
+  ''' the side index is extended by appended pages (an outdated index is not used) '''
+  filename, pages = pickle_file
+  appended        = random_pages(3, seed=1)
+  write_pages(filename, appended, append=True)
+  pages = pages + appended
+  for start_page in range(len(pages) + 1):
+    assert list(utils.iter_flow_pages(filename, start_page=start_page)) == pages[start_page:]
+  assert len(utils.load_member_index(filename)) == len(pages)
+
+
+def test_filters(pickle_file):
+  ''' time range and exporter filters per page, flows without times do not overlap a bounded time range '''
+  filename, pages = pickle_file
+  def _overlaps(flow, first, last):
+    if first is not None and (flow.get('last_switched') is None or flow['last_switched'] < first): return False
+    if last is not None and (flow.get('first_switched') is None or flow['first_switched'] > last): return False
+    return True
+
+  for time_range, hosts in [((2000, 4000), None), ((None, 3000), None), ((5000, None), {'exporter1'}),
+                            (None, {'exporter0', 'exporter2'}), (None, {'unknown'})]:
+    first, last = time_range if time_range is not None else (None, None)
+    expected    = [ [ flow for flow in page
+                      if _overlaps(flow, first, last) and (hosts is None or flow['host'] in hosts) ] for page in pages ]
+    assert list(utils.iter_flow_pages(filename, time_range=time_range, hosts=hosts)) == expected
+    assert list(utils.iter_flow_pages(filename, start_page=4, time_range=time_range, hosts=hosts)) == expected[4:]
+    assert list(utils.iter_flows(filename, time_range=time_range, hosts=hosts)) == sum(expected, [])
+  kept = sum( len(page) for page in utils.iter_flow_pages(filename, time_range=(2000, 4000)) )
+  assert 0 < kept < sum(map(len, pages))
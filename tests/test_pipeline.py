@@ -0,0 +1,126 @@
+'''
+tests of the processing pipeline (process_flows) with synthetic lookup tables and a fake elasticsearch client, without
+network access (run from the repository: python -m pytest tests)
+'''
+import contextlib
+import io
+import socket
+
+import numpy as np
+import pytest
+
+import checkpoint
+import geo
+import main
+import prefix_lookup as pl
+import sources
+import utils
+from benchmarks.fake_elasticsearch import FakeElasticsearch
+from benchmarks.mmdb import synthetic_geo_databases
+from benchmarks.synthetic import setup_tables, synthetic_sources
+
+
+@pytest.fixture
+def synthetic_tables(tmp_path, monkeypatch):
+  '''
+  synthetic lookup tables (see benchmarks.synthetic.setup_tables), the output in tmp_path, name resolution fails (no
+  downloads or remote checks), the module globals are restored after the test
+  '''
+  def offline(*args, **kwargs): raise OSError('network access in a test')
+  monkeypatch.setattr(socket, 'getaddrinfo', offline)
+  for name in ['prefix_lookup_public', 'prefix_lookup_public6', 'prefix_lookup_private', 'prefix_lookup_private6']:
+    monkeypatch.setattr(pl, name, getattr(pl, name))
+  for name in ['geo_table', 'hsfd_geo_data']: monkeypatch.setattr(geo, name, getattr(geo, name))
+  for name in ['PERMUTATION_TABLES', 'PERMUTATION_TABLES6', 'PIPELINE_WORKERS', 'ELASTICSEARCH_SCROLL_SIZE',
+               'INCREMENTAL', 'CHECKPOINT_FILE']:
+    monkeypatch.setattr(main, name, getattr(main, name))
+  monkeypatch.setattr(utils, 'PICKLE_FILE_FLOWS', None)
+  setup_tables(2000, 5000)
+  main.ELASTICSEARCH_SCROLL_SIZE = 500
+  return tmp_path
+
+
+def process(elastic, filename):
+  '''
+  @param elastic : elasticsearch client (FakeElasticsearch)
+  @param filename: output file (str)
+  @return stored flows (list of dict)
+  '''
+  utils.PICKLE_FILE_FLOWS = filename
+  with contextlib.redirect_stdout(io.StringIO()):
+    main.process_flows(elastic)
+    return utils.load_pickle_file(filename)
+
+
+def test_workers_offline(synthetic_tables):
+  ''' the workers use the installed tables (no downloads), their output equals the output of a single process '''
+  documents = synthetic_sources(2000)
+  main.PIPELINE_WORKERS = 1
+  expected = process(FakeElasticsearch(documents), str(synthetic_tables / 'flows_1.pkl.gz'))
+  main.PIPELINE_WORKERS = 2
+  flows = process(FakeElasticsearch(documents), str(synthetic_tables / 'flows_2.pkl.gz'))
+  assert len(expected) == len(documents)
+  assert flows == expected
+
+
+def test_incremental_resume(synthetic_tables, monkeypatch):
+  ''' an interrupted incremental run is continued from its checkpoint, the output equals an uninterrupted run '''
+  documents = synthetic_sources(5000)
+  main.INCREMENTAL = True
+
+  main.CHECKPOINT_FILE = str(synthetic_tables / 'checkpoint_reference.json')
+  expected = process(FakeElasticsearch(documents), str(synthetic_tables / 'reference.pkl.gz'))
+  assert len(expected) == len(documents)
+
+  # the connection fails after 6 of 10 pages (the first request is the count), pages in flight are lost, data after
+  # the checkpoint is discarded
+  main.CHECKPOINT_FILE = str(synthetic_tables / 'checkpoint.json')
+  elastic         = FakeElasticsearch(documents, latency=0.05)
+  elastic.failure = 7
+  with pytest.raises(ConnectionError), contextlib.redirect_stdout(io.StringIO()):
+    utils.PICKLE_FILE_FLOWS = str(synthetic_tables / 'flows.pkl.gz')
+    main.process_flows(elastic)
+  state = checkpoint.load_checkpoint(main.CHECKPOINT_FILE)
+  assert 0 < state['pages'] < 10 and not state['complete']
+  with open(state['path'], 'ab') as file: file.write(b'incomplete page')
+
+  # a new process continues the output of the checkpoint
+  monkeypatch.setattr(utils, 'PICKLE_FILE_FLOWS'   , None)
+  monkeypatch.setattr(utils, 'PICKLE_FILES_WRITTEN', set())
+  with contextlib.redirect_stdout(io.StringIO()):
+    main.process_flows(FakeElasticsearch(documents))
+    flows = utils.load_pickle_file(state['path'])
+  assert flows == expected
+  assert checkpoint.load_checkpoint(main.CHECKPOINT_FILE)['complete']
+
+
+def test_ipv4_mapped_pages(synthetic_tables, monkeypatch):
+  '''
+  ipv4-mapped addresses (::ffff:a.b.c.d) of pages with ipv6 addresses are enriched and anonymized like the ipv4
+  addresses of ipv4 pages
+  '''
+  # ipv6 geo information from the readers of synthetic MMDB files (the geo table covers ipv4 addresses)
+  for name, filename in synthetic_geo_databases(str(synthetic_tables), 300, 0, 300).items():
+    monkeypatch.setitem(geo.GEO_DATA, name, dict(geo.GEO_DATA[name], db_file=filename))
+  for name in ['country_reader', 'city_reader', 'asn_reader', 'AddressNotFoundError']:
+    monkeypatch.setattr(geo, name, getattr(geo, name))
+  (geo.country_reader, geo.city_reader, geo.asn_reader), _, _ = geo.load_readers()
+  getattr(geo, '__lookup_geo_information').cache_clear()
+
+  documents = synthetic_sources(1000)
+  mixed     = [ dict(document) for document in documents ] + sources.synthetic_documents(500, 1, ipv6=1.0)
+  for i, document in enumerate(mixed[:len(documents)]):
+    key           = 'netflow.{}_addr'.format('src' if i % 2 else 'dst')
+    document[key] = '::ffff:' + document[key]
+
+  expected = main.process_page([ dict(document) for document in documents ]).to_dicts()
+  flows    = main.process_page(mixed).to_dicts()
+  assert flows[:len(documents)] == expected
+  # ipv6 flows: prefixes of the ipv6 tables, addresses permuted group by group
+  ipv6    = mixed[len(documents):]
+  ips     = [ document['netflow.src_addr'] for document in ipv6 ]
+  private = np.array([ document['netflow.src_locality'] == 'private' for document in ipv6 ])
+  _, prefix_lens, _ = main.get_prefixes(utils.ips_to_uint64x2(ips), private)
+  assert [ flow['src_prefix_len'] for flow in flows[len(documents):] ] == prefix_lens.tolist()
+  assert [ flow['src_addr'] for flow in flows[len(documents):] ] == main.permute_ips(ips)
+  assert 0 < (prefix_lens > 0).sum() < len(ips)
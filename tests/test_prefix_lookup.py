@@ -0,0 +1,131 @@
+'''
+tests of the prefix lookup tables (run from the repository: python -m pytest tests)
+'''
+import contextlib
+import io
+import os
+import time
+from ipaddress import IPv6Address, IPv6Network
+
+import numpy as np
+
+import geo
+import prefix_lookup as pl
+import utils
+from benchmarks.synthetic import bgp_prefixes, bgp_prefixes6
+
+
+def build_prefix_lookup(prefixes, vlans=None, ipv6=False):
+  with contextlib.redirect_stdout(io.StringIO()):
+    return getattr(pl, '__build_prefix_lookup')(prefixes, vlans, ipv6=ipv6)
+
+
+def test_empty_ipv6_table(monkeypatch):
+  ''' an ipv6 table without prefixes (no ipv6 entries in the private CSV, missing ipv6 CSV) returns the default prefix '''
+  table = build_prefix_lookup([], ipv6=True)
+  assert table.networks.shape == (len(table.starts), 2)
+
+  monkeypatch.setattr(pl, 'prefix_lookup_private' , build_prefix_lookup(['10.0.0.0/8']))
+  monkeypatch.setattr(pl, 'prefix_lookup_private6', table)
+  monkeypatch.setattr(pl, 'prefix_lookup_public'  , build_prefix_lookup(['8.0.0.0/8']))
+  monkeypatch.setattr(pl, 'prefix_lookup_public6' , table)
+  assert pl.get_prefix_for_ip_private('fd00::1') == (IPv6Network('::/0'), 0)
+  assert pl.get_prefix_for_ip_public('2001:db8::1') == (IPv6Network('::/0'), 0)
+
+  ips = utils.ips_to_uint64x2(['fd00::1', '2001:db8::1', '10.1.2.3'])
+  networks, prefix_lens, vlans = pl.get_prefixes_for_ips(ips, private=True)
+  assert networks.shape == (3, 2)
+  assert utils.uint64x2_to_ips(networks) == ['::', '::', '10.0.0.0']
+  assert prefix_lens.tolist() == [0, 0, 8]
+
+
+def test_ipv6_longest_prefix_match():
+  table = build_prefix_lookup(['2001:db8::/32', '2001:db8:1::/48'], ipv6=True)
+  starts = utils.searchsorted_uint64x2(table.starts, utils.ips_to_uint64x2(['2001:db8:1::5', '2001:db8:2::5', '::1']))
+  assert table.prefix_lens[starts].tolist() == [48, 32, 0]
+  assert np.array_equal(table.networks[starts[2]], [0, 0])
+
+
+def assert_equal_tables(table, expected):
+  for name in ['starts', 'networks', 'prefix_lens', 'vlans']:
+    assert np.array_equal(getattr(table, name), getattr(expected, name)), name
+
+
+def test_prefix_delta(tmp_path, monkeypatch):
+  '''
+  random insertions and deletions (nested and covering prefixes) of the public prefix csv file are applied as delta
+  (the result equals a full build of the new csv file), too many changes rebuild the table, each update increases the
+  version of the index
+  '''
+  csv_file = str(tmp_path / 'GeoLite2-ASN-Blocks-IPv4.csv')
+  monkeypatch.setitem(geo.GEO_DATA, 'public_prefixes_lookup_file', str(tmp_path / 'public_prefixes.idx'))
+  monkeypatch.setitem(geo.GEO_DATA, 'public_prefixes', dict(geo.GEO_DATA['public_prefixes'], db_file=csv_file))
+  monkeypatch.setattr(geo, 'NEW_PREFIXES', False)
+  deltas = []
+  def _apply_prefix_delta(*args, **kwargs):
+    deltas.append(apply_prefix_delta(*args, **kwargs))
+    return deltas[-1]
+  apply_prefix_delta = pl.apply_prefix_delta
+  monkeypatch.setattr(pl, 'apply_prefix_delta', _apply_prefix_delta)
+
+  def _load(prefixes):
+    with open(csv_file, 'w') as file:
+      file.write('network,autonomous_system_number,autonomous_system_organization\n')
+      file.writelines('{},{},"AS {}"\n'.format(prefix, i, i) for i, prefix in enumerate(prefixes))
+    mtime = time.time_ns() + 10 ** 9 * (len(deltas) + 1) # a new stamp of the csv file
+    os.utime(csv_file, ns=(mtime, mtime))
+    with contextlib.redirect_stdout(io.StringIO()):
+      lookup, version = pl.load_public_prefixes()
+    assert_equal_tables(lookup, build_prefix_lookup(prefixes))
+    return version
+
+  random   = np.random.RandomState(0)
+  prefixes = bgp_prefixes(3000)
+  pool     = bgp_prefixes(3000, seed=1) + ['0.0.0.0/1', '8.0.0.0/8', '100.0.0.0/6', '200.16.0.0/12']
+  assert _load(prefixes) == 1 and deltas == []
+  for update in range(6):
+    deleted  = set(random.choice(prefixes, random.randint(1, 200), replace=False).tolist())
+    inserted = [ x for x in random.choice(pool, random.randint(1, 200), replace=False).tolist() if x not in prefixes ]
+    prefixes = [ x for x in prefixes if x not in deleted ] + inserted
+    assert _load(prefixes) == update + 2
+    lookup, number_inserted, number_deleted = deltas[-1]
+    assert lookup is not None and (number_inserted, number_deleted) == (len(inserted), len(deleted))
+
+  # more than PREFIX_DELTA_MAX of the prefixes changed: full build
+  prefixes = prefixes[:int(len(prefixes) * (1 - pl.PREFIX_DELTA_MAX)) - 1] + pool[:100]
+  assert _load(prefixes) == 8
+  assert deltas[-1][0] is None
+
+
+def test_ipv6_csv_longest_match(tmp_path, monkeypatch):
+  ''' lookups in the index of an ipv6 prefix csv file (nested prefixes) return the longest matching prefix '''
+  prefixes = bgp_prefixes6(300) + ['2001:db8::/32', '2001:db8:1::/48', '2001:db8:1:2::/64', '2001:db8:1:2::/96',
+                                   '2001:db8:ffff::/48', '2c00::/12']
+  csv_file = str(tmp_path / 'GeoLite2-ASN-Blocks-IPv6.csv')
+  with open(csv_file, 'w') as file:
+    file.write('network,autonomous_system_number,autonomous_system_organization\n')
+    file.writelines('{},{},"AS {}"\n'.format(prefix, i, i) for i, prefix in enumerate(prefixes))
+  monkeypatch.setitem(geo.GEO_DATA, 'public_prefixes_lookup_file6', str(tmp_path / 'public_prefixes6.idx'))
+  monkeypatch.setitem(geo.GEO_DATA, 'public_prefixes', dict(geo.GEO_DATA['public_prefixes'], db_file6=csv_file))
+  with contextlib.redirect_stdout(io.StringIO()):
+    table = pl.load_public_prefixes6()
+  monkeypatch.setattr(pl, 'prefix_lookup_public' , build_prefix_lookup(['8.0.0.0/8']))
+  monkeypatch.setattr(pl, 'prefix_lookup_public6', table)
+
+  # addresses in, at the bounds of and next to the prefixes
+  random    = np.random.RandomState(0)
+  networks  = [ IPv6Network(prefix) for prefix in prefixes ]
+  addresses = [ '::1', '2000::', '3fff:ffff:ffff:ffff:ffff:ffff:ffff:ffff' ]
+  for network in networks:
+    first, last = int(network.network_address), int(network.broadcast_address)
+    host        = int(random.randint(0, 2 ** 62)) % (last - first + 1)
+    addresses  += [ str(IPv6Address(x)) for x in [first, last, first + host, first - 1, last + 1] ]
+  expected = []
+  for address in addresses:
+    matching = [ network for network in networks if IPv6Address(address) in network ]
+    expected.append(max(matching, key=lambda x: x.prefixlen) if matching else IPv6Network('::/0'))
+
+  found, prefix_lens, _ = pl.get_prefixes_for_ips(utils.ips_to_uint64x2(addresses))
+  assert utils.uint64x2_to_ips(found) == [ str(network.network_address) for network in expected ]
+  assert prefix_lens.tolist() == [ network.prefixlen for network in expected ]
+  assert [ pl.get_prefix_for_ip_public(address)[0] for address in addresses ] == expected
@@ -0,0 +1,117 @@
+'''
+tests of the table registry (build, pending versions, swap between pages, failed builds) with small local CSV and
+MMDB files (run from the repository: python -m pytest tests)
+'''
+import contextlib
+import io
+import itertools
+import os
+import time
+from ipaddress import IPv4Address
+
+import pytest
+
+import geo
+import prefix_lookup as pl
+import tables
+from benchmarks.mmdb import synthetic_geo_databases, synthetic_networks
+
+# seconds added to the modification time of each written file (every write is newer than the previous ones)
+_ticks = itertools.count(1)
+
+
+def write(filename, lines):
+  ''' write a file and advance its modification time (a new stamp even within the resolution of the file system) '''
+  with open(filename, 'w') as file: file.write('\n'.join(lines) + '\n')
+  mtime = time.time_ns() + 10 ** 9 * next(_ticks)
+  os.utime(filename, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+  '''
+  registry (without refresh thread) with the private prefix and geo reader tables of local files, the installed
+  module globals are restored after the test
+  '''
+  private_file, vlans_file = str(tmp_path / 'private_prefixes.csv'), str(tmp_path / 'private_prefixes_vlans.csv')
+  write(private_file, ['10.0.0.0/8'])
+  write(vlans_file  , ['Subnet,VLAN', '10.0.0.0/8,7'])
+  monkeypatch.setitem(geo.GEO_DATA, 'private_prefixes_file' , private_file)
+  monkeypatch.setitem(geo.GEO_DATA, 'private_prefixes_vlans', vlans_file)
+  for name, filename in synthetic_geo_databases(str(tmp_path), 50).items():
+    monkeypatch.setitem(geo.GEO_DATA, name, dict(geo.GEO_DATA[name], db_file=filename))
+  for name in ['prefix_lookup_private', 'prefix_lookup_private6']: monkeypatch.setattr(pl, name, getattr(pl, name))
+  for name in ['country_reader', 'city_reader', 'asn_reader', 'geo_table', 'hsfd_geo_data']:
+    monkeypatch.setattr(geo, name, getattr(geo, name))
+
+  registry = tables.TableRegistry(interval=0)
+  for name in ['private_prefixes', 'geo_readers']: registry.tables[name] = dict(tables.REGISTRY.tables[name])
+  with contextlib.redirect_stdout(io.StringIO()):
+    registry.load('private_prefixes')
+    registry.load('geo_readers')
+  yield registry
+  registry.stop()
+
+
+def test_build_pending_swap(registry):
+  assert registry.check() == []
+  assert pl.get_prefix_for_ip_private('10.1.2.3')[1] == '7'
+  version = registry.versions()['private_prefixes']['version']
+
+  write(geo.GEO_DATA['private_prefixes_vlans'], ['Subnet,VLAN', '10.0.0.0/8,8'])
+  with contextlib.redirect_stdout(io.StringIO()):
+    assert registry.check() == ['private_prefixes']
+    # the new version is pending, the current page keeps the version in use
+    assert pl.get_prefix_for_ip_private('10.1.2.3')[1] == '7'
+    assert registry.swap() == ['private_prefixes']
+  assert pl.get_prefix_for_ip_private('10.1.2.3')[1] == '8'
+  assert registry.versions()['private_prefixes']['version'] > version
+  assert registry.check() == [] and registry.swap() == []
+
+
+def test_swap_geo_readers(registry):
+  reader = geo.country_reader
+  for name, filename in synthetic_geo_databases(os.path.dirname(geo.GEO_DATA['country']['db_file']), 50, 1).items():
+    mtime = time.time_ns() + 10 ** 9 * next(_ticks)
+    os.utime(filename, ns=(mtime, mtime))
+  with contextlib.redirect_stdout(io.StringIO()):
+    assert registry.check() == ['geo_readers']
+    assert registry.swap() == ['geo_readers']
+  assert geo.country_reader is not reader
+  with pytest.raises(ValueError): reader.country('8.8.8.8') # the replaced reader is closed
+
+
+def test_swap_local_geo_information(registry, monkeypatch):
+  ''' the geo information of the local system is resolved with the new readers in the build (no query between pages) '''
+  def offline(): raise OSError('query of the external ip address')
+  network, _ = synthetic_networks(50, 1)[0]
+  monkeypatch.setattr(geo, 'EXTERNAL_IP'     , str(IPv4Address(network)))
+  monkeypatch.setattr(geo, 'GEO_REMOTE_CHECK', 'sync')
+  monkeypatch.setattr(geo, 'get_external_ip' , offline)
+  for name, filename in synthetic_geo_databases(os.path.dirname(geo.GEO_DATA['country']['db_file']), 50, 1).items():
+    mtime = time.time_ns() + 10 ** 9 * next(_ticks)
+    os.utime(filename, ns=(mtime, mtime))
+  with contextlib.redirect_stdout(io.StringIO()):
+    assert registry.check() == ['geo_readers']
+    assert registry.swap() == ['geo_readers']
+  assert geo.hsfd_geo_data is not None
+  assert geo.get_local_geo_information() == geo.get_geo_information(geo.EXTERNAL_IP)
+  assert geo.get_local_geo_information()['country_code'] != 'None'
+
+
+def test_failed_build(registry):
+  write(geo.GEO_DATA['private_prefixes_vlans'], ['Subnet,VLAN', '10.0.0.0/8 7'])
+  with contextlib.redirect_stdout(io.StringIO()):
+    assert registry.check() == []
+  status = registry.versions()['private_prefixes']
+  assert status['error'] is not None
+  # the version in use is kept and the build is not repeated until the sources change again
+  assert registry.swap() == [] and registry.check() == []
+  assert pl.get_prefix_for_ip_private('10.1.2.3')[1] == '7'
+
+  write(geo.GEO_DATA['private_prefixes_vlans'], ['Subnet,VLAN', '10.0.0.0/8,9'])
+  with contextlib.redirect_stdout(io.StringIO()):
+    assert registry.check() == ['private_prefixes']
+    registry.swap()
+  assert pl.get_prefix_for_ip_private('10.1.2.3')[1] == '9'
+  assert registry.versions()['private_prefixes']['error'] is None
@@ -1,6 +1,6 @@
 '''
-load/install modules
-helper functions (load csv file, pickle data)
+install modules (optional, see install_modules)
+helper functions (load csv file, pickle data, binary index files)
 '''
 
 
@@ -39,18 +39,45 @@ modules = [
   'gzip',
   ]
 
-# auto install routine for modules
-for module in modules: load_module(module)
 
-import psutil
+def install_modules():
+  ''' install the required modules that are not present (pip, user space), not run on import for a fast startup '''
+  for module in modules: load_module(module)
+
+
+import contextlib
 import time
 import os
-import gzip
+import socket
 import pickle
+import numpy as np
+import json
+import mmap
+import struct
+import threading
+import zlib
 from datetime import datetime
+import writers
 
 PICKLE_FILE_FLOWS    = None
-PICKLE_FILE_PREFIXES = 'public_prefixes.pkl.gz'
+# flow files that were written by this process (further pages are appended)
+PICKLE_FILES_WRITTEN = set()
+# open writers of the flow files (path: writer)
+FLOW_WRITERS         = {}
+
+# read size for streaming pickle files
+READ_CHUNK_SIZE      = 2 ** 20
+
+# binary index files: magic, format version and header length, followed by a json header and 64 byte aligned arrays
+INDEX_FILE_MAGIC     = b'ANONIDX\0'
+INDEX_FILE_VERSION   = 1
+INDEX_FILE_ALIGNMENT = 64
+
+# string representation of each octet value (for the conversion of integer ip addresses to dotted quads)
+OCTET_STRINGS = np.array([ str(octet) for octet in range(256) ], dtype=object)
+
+# upper 32 bits of the lower half of ipv4-mapped ipv6 addresses (::ffff:0:0/96, ipv4 addresses in ipv6 columns)
+IPV4_MAPPED = np.uint64(0xffff << 32)
 
 
 def measure_time_memory(method):
@@ -61,6 +88,7 @@ def measure_time_memory(method):
   @return result(s) of the execution of method
   '''
   def measure(*args, **kw):
+    import psutil
     print('{}'.format(method.__name__), end='', flush=True)
     start  = time.time()
     result = method(*args, **kw)
@@ -101,33 +129,271 @@ def load_csv_file(filename, _filter=None, _select=None, skip_header=False):
   return data
 
 
+def ips_to_uint32(ips):
+  '''
+  convert ip addresses (dotted quads) to integers in one pass
+  
+  @param ips: ip addresses (list of str)
+  @return ip addresses (np.ndarray of uint32)
+  '''
+  if len(ips) == 0: return np.zeros(0, dtype=np.uint32)
+  octets = np.fromstring('.'.join(ips), dtype=np.uint32, sep='.')
+  if octets.size != 4 * len(ips) or (octets > 255).any():
+    raise ValueError('invalid ipv4 address in {}...'.format(ips[:3]))
+  octets = octets.reshape(-1, 4)
+  return (octets[:, 0] << 24) | (octets[:, 1] << 16) | (octets[:, 2] << 8) | octets[:, 3]
+
+
+def uint32_to_ips(ips):
+  '''
+  convert integer ip addresses to dotted quads
+  
+  @param ips: ip addresses (np.ndarray of uint32)
+  @return ip addresses (list of str)
+  '''
+  ips    = np.asarray(ips, dtype=np.uint32)
+  octets = (ips[:, None] >> np.array([24, 16, 8, 0], dtype=np.uint32)) & 255
+  return [ '.'.join(x) for x in OCTET_STRINGS[octets].tolist() ]
+
+
+def ips_to_uint64x2(ips):
+  '''
+  convert ipv6 and ipv4 addresses to 128-bit integers (two uint64 per address: upper and lower half), ipv4 addresses
+  are stored as ipv4-mapped ipv6 addresses (::ffff:a.b.c.d)
+  
+  @param ips: ip addresses (list of str)
+  @return ip addresses (np.ndarray of uint64, shape (n, 2))
+  @raise ValueError: invalid ip address
+  '''
+  result = np.zeros((len(ips), 2), dtype=np.uint64)
+  ipv6   = np.array([ ':' in ip for ip in ips ], dtype=bool)
+  if not ipv6.all():
+    result[~ipv6, 1] = IPV4_MAPPED | ips_to_uint32([ ip for ip in ips if ':' not in ip ]).astype(np.uint64)
+  if ipv6.any():
+    try:
+      packed = b''.join([ socket.inet_pton(socket.AF_INET6, ip) for ip in ips if ':' in ip ])
+    except OSError:
+      raise ValueError('invalid ipv6 address in {}...'.format([ ip for ip in ips if ':' in ip ][:3]))
+    result[ipv6] = np.frombuffer(packed, dtype='>u8').reshape(-1, 2)
+  return result
+
+
+def uint64x2_to_ips(ips):
+  '''
+  convert 128-bit integer ip addresses to strings (ipv4-mapped addresses as dotted quads, compressed ipv6 notation)
+  
+  @param ips: ip addresses (np.ndarray of uint64, shape (n, 2))
+  @return ip addresses (list of str)
+  '''
+  ips    = np.asarray(ips, dtype=np.uint64)
+  ipv4   = ipv4_mapped(ips)
+  result = np.empty(len(ips), dtype=object)
+  if ipv4.any(): result[ipv4] = uint32_to_ips(ips[ipv4, 1] & np.uint64(2 ** 32 - 1))
+  if not ipv4.all():
+    packed = np.ascontiguousarray(ips[~ipv4], dtype='>u8').tobytes()
+    result[~ipv4] = [ socket.inet_ntop(socket.AF_INET6, packed[i:i + 16]) for i in range(0, len(packed), 16) ]
+  return result.tolist()
+
+
+def uint32_to_uint64x2(ips):
+  '''
+  @param ips: ipv4 addresses (np.ndarray of uint32)
+  @return ipv4-mapped ipv6 addresses (np.ndarray of uint64, shape (n, 2))
+  '''
+  result       = np.zeros((len(ips), 2), dtype=np.uint64)
+  result[:, 1] = IPV4_MAPPED | np.asarray(ips, dtype=np.uint64)
+  return result
+
+
+def ipv4_mapped(ips):
+  '''
+  @param ips: ip addresses (np.ndarray of uint64, shape (n, 2))
+  @return whether an address is an ipv4-mapped ipv6 address (np.ndarray of bool)
+  '''
+  return (ips[:, 0] == 0) & (ips[:, 1] >> np.uint64(32) == np.uint64(0xffff))
+
+
+def searchsorted_uint64x2(starts, ips):
+  '''
+  vectorized binary search for 128-bit integers: the upper halves are searched at once, only addresses whose upper
+  half equals an upper half of the starts are resolved by a search of the lower halves (a few vectorized steps)
+  
+  @param starts: sorted 128-bit integers (np.ndarray of uint64, shape (n, 2))
+  @param ips   : 128-bit integers (np.ndarray of uint64, shape (m, 2))
+  @return index of the last start that is less than or equal to each address, -1 if there is none (np.ndarray)
+  '''
+  first = np.searchsorted(starts[:, 0], ips[:, 0], side='left')
+  last  = np.searchsorted(starts[:, 0], ips[:, 0], side='right')
+  index = last - 1
+  tied  = np.flatnonzero(last > first) # search the lower halves of the starts with equal upper half
+  if len(tied):
+    low, high = first[tied], last[tied] # first start that is greater is in [low, high]
+    lows      = ips[tied, 1]
+    while True:
+      active = low < high
+      if not active.any(): break
+      middle  = (low + high) // 2
+      greater = starts[np.minimum(middle, len(starts) - 1), 1] > lows
+      high    = np.where(active & greater, middle, high)
+      low     = np.where(active & ~greater, middle + 1, low)
+    index[tied] = low - 1
+  return index
+
+
 def load_pickle_file(filename):
   '''
-  load a pickle file
+  load a pickle file (all pages into one list, see iter_flows for large files)
   
   @param filename: local pickle filename/path to the pickle file (str)
   @return unpickled data (list)
   '''  
-  if not filename.endswith('.pkl.gz'): filename += '.pkl.gz'
-  
-  print('load pickle file {}'.format(filename), end='', flush=True)
-  
-  if os.path.dirname(os.path.realpath(__file__)) not in filename:
-    folder_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), filename)
-  else:
-    folder_filename = filename
-  if not os.path.isfile(folder_filename): assert('pickle file {} not found'.format(filename))
+  folder_filename = __pickle_path(filename)
   
+  print('load pickle file {}'.format(os.path.basename(folder_filename)), end='', flush=True)
   print('...size: {} MB\n'.format(os.path.getsize(folder_filename) // 2 ** 20))
   
   # if the file contain multiple objects, append all to a list
-  with gzip.open(folder_filename, 'rb') as file:
-    result = []
-    while True:
-      try:
-        result += pickle.load(file)
-      except:
-        return result
+  result = []
+  for page in iter_flow_pages(folder_filename):
+    result += page
+  return result
+
+
+def iter_flow_pages(filename, start_page=0, time_range=None, hosts=None):
+  '''
+  iterate the pages of a pickle file (each page is a gzip member), only one page is in memory at a time
+
+  @param filename  : local pickle filename/path to the pickle file (str)
+  @param start_page: (optional) skip the first pages, the side index of member offsets is used (or built) (int)
+  @param time_range: (optional) keep flows that overlap the time range [first, last], bounds in the representation of
+                     first_switched/last_switched, None for an open bound (tuple)
+  @param hosts     : (optional) keep flows of these exporters (host) (set of str)
+  @return generator of pages (list of dict), filtered pages can be empty
+  '''
+  folder_filename = __pickle_path(filename)
+  offset          = 0
+  if start_page > 0:
+    offsets = load_member_index(folder_filename)
+    if start_page >= len(offsets): return
+    offset  = int(offsets[start_page])
+
+  with open(folder_filename, 'rb') as file:
+    for _, data in __iter_members(file, offset):
+      page = pickle.loads(data)
+      if time_range is not None or hosts is not None: page = __filter_flows(page, time_range, hosts)
+      yield page
+
+
+def iter_flows(filename, **kwargs):
+  '''
+  iterate the flows of a pickle file (constant memory, see iter_flow_pages for the parameters)
+
+  @param filename: local pickle filename/path to the pickle file (str)
+  @return generator of flows (dict)
+  '''
+  for page in iter_flow_pages(filename, **kwargs):
+    yield from page
+
+
+def load_member_index(filename, build=True):
+  '''
+  load the side index of a pickle file (offsets of the gzip members, i.e., the pages), a missing or outdated index is
+  built by scanning the file
+
+  @param filename: filename of/path to the pickle file (str)
+  @param build   : build (and store) the index if it is missing or outdated (bool)
+  @return offsets of the pages (np.ndarray of uint64) or None if the index is not available
+  '''
+  if os.path.isfile(filename + '.idx'):
+    columns, meta = load_index_file(filename + '.idx')
+    if meta is not None and meta.get('type') == 'member_index' and meta.get('source') == file_stamp(filename):
+      return columns['offsets']
+  if not build: return None
+  return build_member_index(filename)
+
+
+def build_member_index(filename):
+  '''
+  scan a pickle file for the offsets of its gzip members and store them as side index (<filename>.idx)
+
+  @param filename: filename of/path to the pickle file (str)
+  @return offsets of the pages (np.ndarray of uint64)
+  '''
+  with open(filename, 'rb') as file:
+    offsets = np.array([ offset for offset, _ in __iter_members(file, keep=False) ], dtype=np.uint64)
+  save_member_index(filename, offsets)
+  return offsets
+
+
+def save_member_index(filename, offsets):
+  '''
+  store the offsets of the gzip members of a (complete) pickle file as side index (<filename>.idx)
+
+  @param filename: filename of/path to the pickle file (str)
+  @param offsets : offsets of the pages (list of int)
+  '''
+  save_index_file(filename + '.idx', { 'offsets': np.asarray(offsets, dtype=np.uint64) },
+                  { 'type': 'member_index', 'source': file_stamp(filename) })
+
+
+def __iter_members(file, offset=0, keep=True):
+  '''
+  decompress the gzip members of a file one by one (the end of a member is detected by zlib, the remaining input is
+  the start of the next member)
+
+  @param file  : opened file (binary)
+  @param offset: offset of the first member (int)
+  @param keep  : return the decompressed data, False only scans for the offsets (bool)
+  @return generator of offset and decompressed data (bytes or None) of each member
+  '''
+  file.seek(offset)
+  pending = b''
+  while True:
+    start        = file.tell() - len(pending)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    data         = []
+    while not decompressor.eof:
+      chunk   = pending or file.read(READ_CHUNK_SIZE)
+      pending = b''
+      if not chunk:
+        if start == file.tell(): return # end of file between members
+        raise EOFError('truncated gzip member at offset {}'.format(start))
+      chunk = decompressor.decompress(chunk)
+      if keep: data.append(chunk)
+    pending = decompressor.unused_data
+    yield start, b''.join(data) if keep else None
+
+
+def __filter_flows(flows, time_range, hosts):
+  '''
+  select flows by time range and exporter
+
+  @param flows     : flows (list of dict)
+  @param time_range: flows that overlap [first, last] (tuple) or None
+  @param hosts     : exporters (set of str) or None
+  @return selected flows (list of dict)
+  '''
+  first, last = time_range if time_range is not None else (None, None)
+  def _keep(flow):
+    if hosts is not None and flow.get('host') not in hosts: return False
+    if first is not None and (flow.get('last_switched') is None or flow['last_switched'] < first): return False
+    if last  is not None and (flow.get('first_switched') is None or flow['first_switched'] > last): return False
+    return True
+  return [ flow for flow in flows if _keep(flow) ]
+
+
+def __pickle_path(filename):
+  '''
+  resolve the path of a pickle file (suffix .pkl.gz, relative to the module folder)
+
+  @param filename: local pickle filename/path to the pickle file (str)
+  @return path of the pickle file (str)
+  '''
+  if not filename.endswith('.pkl.gz'): filename += '.pkl.gz'
+  if os.path.dirname(os.path.realpath(__file__)) not in filename:
+    filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), filename)
+  if not os.path.isfile(filename): raise FileNotFoundError('pickle file {} not found'.format(filename))
+  return filename
 
       
 def pickle_data(data, filename, pickle_file):
@@ -141,39 +407,181 @@ def pickle_data(data, filename, pickle_file):
   folder_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), filename)
    
   # if file already exists, append  
-  with gzip.GzipFile(folder_filename, 'wb' if pickle_file is None else 'ab') as file:
-    pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)      
+  with writers.open_writer(folder_filename, append=pickle_file is not None) as writer:
+    writer.write(data)
 
 
-def pickle_flows(flows):
+def pickle_flows(flows, part=None):
   '''
   pickle flows
   
-  @param flows: flows (list of dict)
+  @param flows: flows (list of dict or FlowBatch)
+  @param part : (optional) part of the output (e.g., scroll slice), each part is stored in its own file (int)
+  @return writer of the output file (see writers.open_writer)
   '''  
   global PICKLE_FILE_FLOWS
+  
+  # shards store the columns, the pickle files dicts
+  if writers.OUTPUT_CODEC == 'gzip' and hasattr(flows, 'to_dicts'): flows = flows.to_dicts()
    
   if PICKLE_FILE_FLOWS is None:
     filename = '{}_flows.pkl.gz'.format(datetime.fromtimestamp(time.time()).strftime('%Y-%m-%d_%H-%M-%S'))
     print('...file {}'.format(filename), end='', flush=True)    
   else:
     filename = PICKLE_FILE_FLOWS
-     
-  folder_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), filename)
+  
+  part_filename   = filename if part is None else filename.replace('.pkl.gz', '_{}.pkl.gz'.format(part))
+  folder_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), part_filename)
+  # shards are stored in a directory (e.g., <timestamp>_flows)
+  if writers.OUTPUT_CODEC != 'gzip': folder_filename = folder_filename[:-len('.pkl.gz')]
    
-  pickle_data(flows, folder_filename, PICKLE_FILE_FLOWS)
+  # keep the file open for further pages (each page is a gzip member or a shard)
+  if folder_filename not in FLOW_WRITERS:
+    FLOW_WRITERS[folder_filename] = writers.open_writer(folder_filename, writers.OUTPUT_CODEC,
+                                                        append=folder_filename in PICKLE_FILES_WRITTEN)
+  FLOW_WRITERS[folder_filename].write(flows)
    
   PICKLE_FILE_FLOWS = filename
+  PICKLE_FILES_WRITTEN.add(folder_filename)
+  return FLOW_WRITERS[folder_filename]
+
+
+def close_flow_writers():
+  ''' flush and close the open flow files (further pages are appended) '''
+  while FLOW_WRITERS:
+    _, writer = FLOW_WRITERS.popitem()
+    writer.close()
+
+  
+def load_flow_shards(directory, columns=None, decode=True):
+  '''
+  iterate the shards of a shard directory (see writers.ShardWriter), the columns are memory mapped, only the selected
+  columns are touched
+  
+  @param directory: shard directory (str)
+  @param columns  : (optional) names of the columns to load, None loads all columns (list of str)
+  @param decode   : replace dictionary codes by their values (object arrays), False returns the codes (bool)
+  @return generator of shard information (dict: file, rows, time_range) and columns (dict of np.ndarray, masks of
+          missing values as <column>.missing)
+  '''
+  manifest = writers.load_manifest(directory)
+  if manifest is None: raise FileNotFoundError('no shard manifest in {}'.format(directory))
+  
+  for shard in manifest['shards']:
+    arrays, meta = load_index_file(os.path.join(directory, shard['file']))
+    if meta is None or meta.get('type') != 'flow_shard': raise ValueError('invalid shard {}'.format(shard['file']))
+    
+    result = {}
+    for name, encoding in meta['columns'].items():
+      if columns is not None and name not in columns: continue
+      column = arrays[name]
+      if decode and encoding['encoding'] == 'dictionary':
+        dictionary    = np.empty(len(encoding['dictionary']), dtype=object)
+        dictionary[:] = encoding['dictionary']
+        column        = dictionary[column]
+      result[name] = column
+      if encoding.get('missing'): result[name + '.missing'] = arrays[name + '.missing']
+    yield shard, result
+
+
+def save_index_file(filename, columns, meta):
+  '''
+  write flat arrays and meta information to a binary index file (replaces an existing file atomically, processes
+  that still map the old file keep a valid view of it)
+  
+  @param filename: filename of/path to the index file (str)
+  @param columns : named arrays (dict of np.ndarray)
+  @param meta    : json serializable meta information (dict)
+  '''
+  def _align(offset):
+    return -(-offset // INDEX_FILE_ALIGNMENT) * INDEX_FILE_ALIGNMENT
 
+  def _layout(header_length):
+    offset = _align(16 + header_length)
+    layout = []
+    for name, array in columns.items():
+      layout.append({'name': name, 'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset})
+      offset = _align(offset + array.nbytes)
+    return layout
+
+  columns = { name: np.ascontiguousarray(array) for name, array in columns.items() }
+  # the offsets depend on the header length and vice versa, repeat until the header length is stable, the header that
+  # is written is always encoded from the layout of its own length
+  header  = b''
+  while True:
+    layout  = _layout(len(header))
+    encoded = json.dumps({'meta': meta, 'columns': layout}).encode()
+    if len(encoded) == len(header): break
+    header = encoded
+  header = encoded
+
+  # temporary file per process and thread (concurrent writers of the same index never share a temporary file)
+  temp_filename = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+  with open(temp_filename, 'wb') as file:
+    file.write(struct.pack('<8sII', INDEX_FILE_MAGIC, INDEX_FILE_VERSION, len(header)))
+    file.write(header)
+    for entry, array in zip(layout, columns.values()):
+      file.write(b'\0' * (entry['offset'] - file.tell()))
+      file.write(array.tobytes())
+    file.flush()
+    os.fsync(file.fileno())
+  os.replace(temp_filename, filename)
+
+
+def load_index_file(filename):
+  '''
+  memory map a binary index file, the arrays are read-only views of the mapped file (pages are shared between
+  processes via the page cache)
   
-def pickle_prefixes(prefixes):
+  @param filename: filename of/path to the index file (str)
+  @return named arrays (dict of np.ndarray) and meta information (dict) or (None, None) for an invalid file (other
+          format or version, empty, truncated or corrupt, the callers rebuild it)
+  '''
+  try:
+    with open(filename, 'rb') as file:
+      magic, version, header_length = struct.unpack('<8sII', file.read(16))
+      if magic != INDEX_FILE_MAGIC or version != INDEX_FILE_VERSION:
+        return None, None
+      header = json.loads(file.read(header_length).decode())
+      buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    columns = {}
+    for entry in header['columns']:
+      dtype = np.dtype(entry['dtype'])
+      count = int(np.prod(entry['shape'], dtype=np.int64))
+      if count == 0: columns[entry['name']] = np.zeros(entry['shape'], dtype=dtype)
+      else         : columns[entry['name']] = np.frombuffer(buffer, dtype, count, entry['offset']).reshape(entry['shape'])
+    return columns, header['meta']
+  except (struct.error, ValueError, KeyError, TypeError): # ValueError: json, mmap (empty file), truncated arrays
+    return None, None
+
+
+def file_stamp(filename):
+  '''
+  identify the current version of a file by its size and modification time
+  
+  @param filename: filename of/path to the file (str)
+  @return size and modification time in ns (list of int) or None if the file does not exist
+  '''
+  if not os.path.isfile(filename): return None
+  stat = os.stat(filename)
+  return [stat.st_size, stat.st_mtime_ns]
+
+
+@contextlib.contextmanager
+def file_lock(filename):
   '''
-  pickle prefix lookup tree
+  exclusive lock of a lock file (e.g., one process updates an index file at a time, the others wait and use the result)
   
-  @param prefixes: prefix lookup tree (prefix_lookup_public, prefix_lookup_private)
+  @param filename: filename of/path to the lock file (str), created if missing
   '''
-  folder_filename = os.path.join(os.path.dirname(os.path.realpath(__file__)), PICKLE_FILE_PREFIXES)
-  pickle_data(prefixes, folder_filename, PICKLE_FILE_PREFIXES)
+  import fcntl
+  with open(filename, 'a') as file:
+    fcntl.flock(file, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(file, fcntl.LOCK_UN)
 
   
 def printProgressBar (iteration, total, prefix='', suffix='', decimals=1, length=100, fill='█'):
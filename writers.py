@@ -0,0 +1,285 @@
+'''
+output writers for flow files
+
+gzip  : a persistent file handle per output file, each page is pickled and compressed into its own gzip member
+        (concatenated members are read by utils.load_pickle_file like the former appended files), the compression of
+        pages can run in a thread pool (zlib releases the GIL)
+shards: a directory of columnar shards (one binary index file per page, see utils.save_index_file) with typed columns
+        (uint32 addresses, uint16 ports, ...), dictionary encoded strings and a manifest (rows and time range of each
+        shard), readers memory map the shards and load only the required columns (see utils.load_flow_shards)
+'''
+import collections
+import gzip
+import json
+import numpy as np
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import flows
+import utils
+
+# region ----------------------------------------------------------------- output parameters
+COMPRESSION_LEVEL   = 6      # zlib compression level (0: store only, 1: fastest, 9: smallest)
+COMPRESSION_THREADS = 1      # threads that compress pages in parallel (1: compress in the calling thread)
+FLUSH_PAGES         = 1      # flush the completed pages after each n-th page (0: only on checkpoints and close)
+FSYNC               = False  # fsync the file on each flush (durable pages, slower)
+OUTPUT_CODEC        = 'gzip' # output format of utils.pickle_flows (key of WRITERS)
+# endregion
+
+# columns that define the time range of a shard (minimum of the first, maximum of the last column)
+TIME_COLUMNS = ('first_switched', 'last_switched')
+
+# string columns with at most this number of distinct values (or at most half as many as rows) are dictionary encoded
+DICTIONARY_SIZE = 2 ** 16
+
+
+class GzipPickleWriter(object):
+  '''
+  write pickled pages as gzip members to a persistent file handle
+  '''
+
+  def __init__(self, filename, level=None, threads=None, flush_pages=None, fsync=None, append=False):
+    '''
+    @param filename   : filename of/path to the output file (str)
+    @param level      : compression level (int), default COMPRESSION_LEVEL
+    @param threads    : compression threads (int), default COMPRESSION_THREADS
+    @param flush_pages: flush after each n-th page (int), default FLUSH_PAGES
+    @param fsync      : fsync on flush (bool), default FSYNC
+    @param append     : append to an existing file (bool)
+    '''
+    self.filename    = filename
+    self.level       = COMPRESSION_LEVEL   if level       is None else level
+    self.threads     = COMPRESSION_THREADS if threads     is None else threads
+    self.flush_pages = FLUSH_PAGES         if flush_pages is None else flush_pages
+    self.fsync       = FSYNC               if fsync       is None else fsync
+    self.offsets     = _existing_offsets(filename) if append else []
+    self.file        = open(filename, 'ab' if append else 'wb')
+    self.executor    = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+    self.pending     = collections.deque()
+    self.pages       = 0
+    self.raw_bytes   = 0
+
+  def write(self, data):
+    '''
+    pickle and compress data (one page), the compressed page is written in order once it is available
+
+    @param data: picklable data
+    '''
+    payload         = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    self.raw_bytes += len(payload)
+    if self.executor is None:
+      self.__write_member(gzip.compress(payload, self.level))
+    else:
+      self.pending.append(self.executor.submit(gzip.compress, payload, self.level))
+      while len(self.pending) > 2 * self.threads:
+        self.__write_member(self.pending.popleft().result())
+
+    self.pages += 1
+    if self.flush_pages and self.pages % self.flush_pages == 0:
+      self.flush(wait=False)
+
+  def flush(self, wait=True):
+    '''
+    write the pending pages and flush the file handle (fsync if configured)
+
+    @param wait: wait for all pending pages (bool, e.g., checkpoints, close), False writes only the pages whose
+                 compression completed (in order), the others stay in flight
+    '''
+    while self.pending and (wait or self.pending[0].done()):
+      self.__write_member(self.pending.popleft().result())
+    self.file.flush()
+    if self.fsync: os.fsync(self.file.fileno())
+
+  def __write_member(self, member):
+    '''
+    write a compressed page and record its offset
+
+    @param member: gzip member (bytes)
+    '''
+    if self.offsets is not None: self.offsets.append(self.file.tell())
+    self.file.write(member)
+
+  def tell(self):
+    '''
+    @return size of the written (flushed) output (int, bytes)
+    '''
+    return self.file.tell()
+
+  def close(self):
+    ''' flush and close the file, store the side index of the page offsets (see utils.load_member_index) '''
+    if self.file.closed: return
+    try:
+      self.flush()
+    finally:
+      self.file.close()
+      if self.executor is not None: self.executor.shutdown()
+    if self.offsets is not None: utils.save_member_index(self.filename, self.offsets)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+def _existing_offsets(filename):
+  '''
+  page offsets of a file that is continued (None if the file has no valid side index, it is rebuilt on demand)
+
+  @param filename: filename of/path to the output file (str)
+  @return offsets (list of int) or None
+  '''
+  if not os.path.isfile(filename): return []
+  offsets = utils.load_member_index(filename, build=False)
+  return offsets.tolist() if offsets is not None else None
+
+
+class ShardWriter(object):
+  '''
+  write each page as a columnar shard (binary index file) into a directory and list it in the manifest of the directory
+  '''
+
+  def __init__(self, directory, flush_pages=None, fsync=None, append=False, **kwargs):
+    '''
+    @param directory  : output directory (str)
+    @param flush_pages: not used, each shard is written completely (int)
+    @param fsync      : fsync the manifest after each shard (bool), default FSYNC (shards are always fsynced)
+    @param append     : add shards to an existing directory (bool)
+    @param kwargs     : parameters of other writers (ignored, e.g., compression level)
+    '''
+    self.filename  = directory
+    self.directory = directory
+    self.fsync     = FSYNC if fsync is None else fsync
+    self.manifest  = load_manifest(directory) if append else None
+    if self.manifest is None: self.manifest = { 'type': 'flow_shards', 'shards': [] }
+    os.makedirs(directory, exist_ok=True)
+
+  def write(self, data):
+    '''
+    write one page as shard
+
+    @param data: flows (FlowBatch or list of dict)
+    '''
+    batch = data if isinstance(data, flows.FlowBatch) else flows.FlowBatch.from_dicts(data)
+
+    columns   = {}
+    encodings = {}
+    for name, column in batch.columns.items():
+      encoding = { 'encoding': 'plain' }
+      if column.dtype == object:
+        column, encoding = encode_column(column)
+      columns[name] = column
+      if name in batch.missing:
+        columns[name + '.missing'] = batch.missing[name]
+        encoding['missing']        = True
+      encodings[name] = encoding
+
+    shard = { 'file': 'shard_{:06d}.idx'.format(len(self.manifest['shards'])), 'rows': len(batch),
+              'time_range': time_range(batch) }
+    utils.save_index_file(os.path.join(self.directory, shard['file']), columns,
+                          dict(shard, type='flow_shard', columns=encodings))
+    self.manifest['shards'].append(shard)
+    self.flush()
+
+  def flush(self):
+    ''' replace the manifest atomically '''
+    filename = os.path.join(self.directory, 'manifest.json')
+    with open(filename + '.tmp', 'w') as file:
+      json.dump(self.manifest, file)
+      file.flush()
+      if self.fsync: os.fsync(file.fileno())
+    os.replace(filename + '.tmp', filename)
+
+  def tell(self):
+    '''
+    @return number of written shards (int)
+    '''
+    return len(self.manifest['shards'])
+
+  def close(self):
+    ''' shards and manifest are complete after each page '''
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+def encode_column(column):
+  '''
+  encode an object column: dictionary encoding for few distinct (json serializable) values, fixed width unicode for
+  other string columns
+
+  @param column: values (np.ndarray of object)
+  @return encoded column (np.ndarray) and its encoding (dict)
+  '''
+  codes   = {}
+  indices = [ codes.setdefault((type(value), value), len(codes)) for value in column.tolist() ]
+  few_values = len(codes) <= DICTIONARY_SIZE and (len(codes) <= 256 or 2 * len(codes) <= len(column))
+  if few_values or not all(type(value) is str for value in column.tolist()):
+    dtype = np.uint8 if len(codes) <= 2 ** 8 else np.uint16 if len(codes) <= 2 ** 16 else np.uint32
+    return np.array(indices, dtype=dtype), { 'encoding': 'dictionary', 'dictionary': [ x[1] for x in codes ] }
+  return np.array(column.tolist(), dtype=str), { 'encoding': 'string' }
+
+
+def time_range(batch):
+  '''
+  time range of a page (minimum of the first and maximum of the last TIME_COLUMNS, as stored in the flows)
+
+  @param batch: flows (FlowBatch)
+  @return first and last time (list) or None if the page has no time columns
+  '''
+  first, last = [ [ x for x in batch[name].tolist() if x is not None ] if name in batch else [] for name in TIME_COLUMNS ]
+  if not first or not last: return None
+  return [ min(first), max(last) ]
+
+
+def load_manifest(directory):
+  '''
+  load the manifest of a shard directory
+
+  @param directory: shard directory (str)
+  @return manifest (dict) or None if the directory has no manifest
+  '''
+  filename = os.path.join(directory, 'manifest.json')
+  if not os.path.isfile(filename): return None
+  with open(filename) as file:
+    return json.load(file)
+
+
+def truncate_output(filename, codec, position):
+  '''
+  cut an output back to a previous size (see the tell method of the writers), e.g., to discard a partially written page
+
+  @param filename: filename of/path to the output file or directory (str)
+  @param codec   : output codec (str, key of WRITERS)
+  @param position: size in bytes (gzip) or number of shards (shards) to keep (int)
+  '''
+  if codec == 'shards':
+    writer = ShardWriter(filename, append=True)
+    writer.manifest['shards'] = writer.manifest['shards'][:position]
+    writer.flush()
+    return
+  os.truncate(filename, position)
+
+
+# available writers (output codecs)
+WRITERS = {
+  'gzip'  : GzipPickleWriter,
+  'shards': ShardWriter,
+  }
+
+
+def open_writer(filename, codec='gzip', **kwargs):
+  '''
+  open an output writer
+
+  @param filename: filename of/path to the output file (str)
+  @param codec   : output codec (str, key of WRITERS)
+  @param kwargs  : parameters of the writer
+  @return writer
+  '''
+  if codec not in WRITERS: raise ValueError('unknown output codec {} (available: {})'.format(codec, list(WRITERS)))
+  return WRITERS[codec](filename, **kwargs)